@@ -1,28 +1,195 @@
-from flask import Flask, render_template, request, redirect, url_for, jsonify, flash
+from flask import (Flask, Blueprint, render_template, request, redirect, url_for, jsonify, flash,
+                   current_app, make_response, session, g, abort, has_request_context,
+                   before_render_template, template_rendered, Response, stream_with_context, send_file,
+                   after_this_request, send_from_directory)
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, login_user, login_required, logout_user, current_user, UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.utils import safe_join
 from datetime import datetime, date, timedelta
 import os
+import csv
+import gzip
+import io
 import json
-from collections import defaultdict
+import math
+import mimetypes
+import re
+import shutil
+import secrets
+import socket
+import hashlib
+import logging
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, defaultdict
+from functools import wraps
+from urllib.request import urlopen
 
-app = Flask(__name__)
-app.config['SECRET_KEY'] = 'your-secret-key-here-change-in-production'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///attendance.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+import click
+from sqlalchemy import event, inspect
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import make_transient_to_detached
 
-db = SQLAlchemy(app)
+def database_url():
+    """Database URL from DATABASE_URL, defaulting to the local SQLite file"""
+    url = os.environ.get('DATABASE_URL', 'sqlite:///attendance.db')
+    # Heroku and friends still hand out the scheme SQLAlchemy dropped
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+def engine_options(url):
+    """Connection pool settings for server databases, tunable from the environment"""
+    if url.startswith('sqlite'):
+        # Seconds a SQLite writer waits for a lock before failing
+        return {'connect_args': {'timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000)) / 1000}}
+    return {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': True
+    }
+
+# Rows per INSERT statement; keeps bulk upserts under SQLite's 999 bound-parameter limit
+UPSERT_CHUNK_SIZE = 150
+# Largest number of records accepted by a single bulk attendance request
+BULK_MAX_RECORDS = 10000
+# Recent records shown per subject on the report, and page sizes for the history API
+REPORT_RECENT_RECORDS = 5
+HISTORY_PAGE_SIZE = 20
+HISTORY_MAX_PAGE_SIZE = 100
+# What-if scenarios evaluated per planner request
+PLANNER_MAX_SCENARIOS = 100
+# Semesters whose timetable occurrence index is kept in memory per process
+OCCURRENCE_CACHE_SIZE = 256
+# Fingerprinted assets never change, so browsers may keep them for a year
+ASSET_MAX_AGE = 365 * 24 * 3600
+# Already-compressed formats that gain nothing from gzip or brotli
+PRECOMPRESSED_SKIP = ('.woff2', '.woff', '.png', '.jpg', '.jpeg', '.gif', '.webp', '.ico')
+# Dynamic responses: which to gzip, from what size, and at which level
+COMPRESSIBLE_MIMETYPES = {'text/html', 'application/json', 'text/plain', 'text/csv'}
+COMPRESS_MIN_BYTES = 1024
+COMPRESS_LEVEL = 6
+# Estimated bytes of one attendance row with its index entries (notes excluded), and of an
+# archive row before its payload, for the space-saved figures
+ATTENDANCE_ROW_BYTES = 110
+ARCHIVE_ROW_BYTES = 80
+# Users whose row and active semester are kept in memory per process
+USER_CACHE_SIZE = 4096
+# Background jobs: queue polling interval, cleanup interval, and how long a job may run
+JOB_POLL_SECONDS = 1.0
+JOB_CLEANUP_SECONDS = 300
+JOB_TIMEOUT_HOURS = 2
+JOB_PAGE_SIZE = 50
+# Cohort analytics: users per batch, and completed snapshot runs kept
+ANALYTICS_BATCH_SIZE = 500
+ANALYTICS_KEEP_RUNS = 5
+ANALYTICS_PAGE_SIZE = 50
+# (user, semester) pairs whose attendance trend series are kept in memory per process
+TREND_CACHE_SIZE = 256
+# Writes stamped this many seconds before a cached trend's watermark are re-read on refresh
+TREND_SETTLE_SECONDS = 5
+# CSV import: rows per transaction, and per-row errors kept for the report
+IMPORT_BATCH_SIZE = 1000
+IMPORT_MAX_ERRORS = 100
+# Rows fetched per round trip while streaming exports
+EXPORT_FETCH_SIZE = 1000
+# Sync API: changes per pull page, pushed changes per request, and how long deletions are remembered
+SYNC_API_VERSION = 1
+SYNC_PAGE_SIZE = 500
+SYNC_MAX_PUSH = 1000
+SYNC_TOMBSTONE_DAYS = 90
+# Changes are stamped before their transaction commits, so pulls stop this many seconds short of now
+SYNC_SETTLE_SECONDS = 5
+# Sync responses smaller than this aren't worth compressing; compressed request bodies are capped
+SYNC_GZIP_MIN_BYTES = 512
+SYNC_MAX_BODY = 4 * 1024 * 1024
+# Indexes replaced by later schema versions, dropped by upgrade-db
+OBSOLETE_INDEXES = ['uq_attendance_subject_date']
+
+db = SQLAlchemy()
 login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'login'
+login_manager.login_view = 'main.login'
 login_manager.login_message = 'Please log in to access this page.'
 login_manager.login_message_category = 'info'
+# cli_group=None registers the maintenance commands directly under `flask`
+bp = Blueprint('main', __name__, cli_group=None)
+
+def create_app(config=None):
+    """Application factory; ``config`` overrides settings read from the environment"""
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'your-secret-key-here-change-in-production')
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url()
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Rendered pages/JSON kept by the in-process response cache
+    app.config['RESPONSE_CACHE_SIZE'] = int(os.environ.get('RESPONSE_CACHE_SIZE', 1024))
+    # Optional shared store (any object with get/set, e.g. a redis.Redis client)
+    app.config['RESPONSE_CACHE_BACKEND'] = None
+    # Prometheus metrics at /metrics are opt-in; METRICS_TOKEN additionally requires a bearer token
+    app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED') == '1'
+    app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+    # Requests running more SQL queries than this are flagged in a header and the log
+    app.config['QUERY_BUDGET'] = int(os.environ.get('QUERY_BUDGET', 20))
+    app.config['COMPRESS_RESPONSES'] = os.environ.get('COMPRESS_RESPONSES', '1') == '1'
+    # Seconds a worker reuses a user's row and active semester without querying (0 to disable)
+    app.config['USER_CACHE_SECONDS'] = float(os.environ.get('USER_CACHE_SECONDS', 30))
+    # Job threads embedded in each web process (0 when a separate `flask run-jobs` process is used)
+    app.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', 1))
+    app.config['JOB_ARTIFACT_DIR'] = os.environ.get('JOB_ARTIFACT_DIR', os.path.join(app.instance_path, 'jobs'))
+    app.config['JOB_ARTIFACT_TTL_HOURS'] = float(os.environ.get('JOB_ARTIFACT_TTL_HOURS', 24))
+    if config:
+        app.config.update(config)
+    # Pool settings follow the database actually used, which ``config`` may have replaced
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config['SQLALCHEMY_DATABASE_URI']))
+    
+    db.init_app(app)
+    login_manager.init_app(app)
+    app.register_blueprint(bp)
+    app.extensions['response_cache'] = ResponseCache(
+        app.config['RESPONSE_CACHE_BACKEND'] or LRUStore(app.config['RESPONSE_CACHE_SIZE'])
+    )
+    init_metrics(app)
+    app.extensions['asset_manifest'] = load_asset_manifest(app)
+    app.extensions['asset_version'] = hashlib.sha1(
+        json.dumps(app.extensions['asset_manifest'], sort_keys=True).encode()
+    ).hexdigest()[:12]
+    app.add_template_global(asset_url)
+    if app.config['COMPRESS_RESPONSES']:
+        init_compression(app)
+    if app.config['JOB_WORKERS']:
+        init_job_worker(app)
+    return app
+
+@event.listens_for(Engine, 'connect')
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Let SQLite readers and a writer work concurrently across workers"""
+    if type(dbapi_connection).__module__ != 'sqlite3':
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.close()
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start_times', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def record_query_time(conn, cursor, statement, parameters, context, executemany):
+    """Charge each SQL statement to the request that issued it"""
+    elapsed = time.perf_counter() - conn.info['query_start_times'].pop()
+    if has_request_context() and 'request_stats' in g:
+        g.request_stats['queries'] += 1
+        g.request_stats['sql_seconds'] += elapsed
 
 # Database Models
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return load_user_context(int(user_id))
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -30,6 +197,10 @@ class User(UserMixin, db.Model):
     email = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(120), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Bumped by every write to the user's data; part of every cached response's ETag
+    data_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Grants access to the cohort analytics pages (see `flask set-admin`)
+    is_admin = db.Column(db.Boolean, nullable=False, default=False, server_default='0')
     
     # Relationships
     semesters = db.relationship('Semester', backref='user', lazy=True, cascade='all, delete-orphan')
@@ -41,13 +212,24 @@ class User(UserMixin, db.Model):
         return check_password_hash(self.password_hash, password)
 
 class Semester(db.Model):
+    __table_args__ = (
+        db.Index('ix_semester_user_active', 'user_id', 'is_active'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     start_date = db.Column(db.Date, nullable=False)
     end_date = db.Column(db.Date, nullable=False)
     is_active = db.Column(db.Boolean, default=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    # Bumped whenever slots or holidays change so cached occurrence indexes are rebuilt
+    schedule_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Last change, for the sync API
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Set while the attendance records live packed in AttendanceArchive
+    archived_at = db.Column(db.DateTime)
     subjects = db.relationship('Subject', backref='semester', lazy=True, cascade='all, delete-orphan')
+    holidays = db.relationship('Holiday', backref='semester', lazy=True, cascade='all, delete-orphan', order_by='Holiday.date')
+    stats = db.relationship('SemesterStats', uselist=False, lazy=True, cascade='all, delete-orphan')
 
 class Subject(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -55,93 +237,2951 @@ class Subject(db.Model):
     code = db.Column(db.String(20), nullable=False)
     credits = db.Column(db.Integer, default=3)
     total_lectures = db.Column(db.Integer, default=60)
-    semester_id = db.Column(db.Integer, db.ForeignKey('semester.id'), nullable=False)
+    semester_id = db.Column(db.Integer, db.ForeignKey('semester.id'), nullable=False, index=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     timetable_slots = db.relationship('TimetableSlot', backref='subject', lazy=True, cascade='all, delete-orphan')
     attendance_records = db.relationship('AttendanceRecord', backref='subject', lazy=True, cascade='all, delete-orphan')
+    stats = db.relationship('SubjectStats', uselist=False, lazy=True, cascade='all, delete-orphan')
+    archive = db.relationship('AttendanceArchive', uselist=False, lazy=True, cascade='all, delete-orphan')
+
+class TimetableSlot(db.Model):
+    __table_args__ = (
+        db.Index('ix_timetable_slot_subject_day', 'subject_id', 'day_of_week'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    subject_id = db.Column(db.Integer, db.ForeignKey('subject.id'), nullable=False)
+    day_of_week = db.Column(db.Integer, nullable=False)  # 0=Monday, 6=Sunday
+    start_time = db.Column(db.Time, nullable=False)
+    end_time = db.Column(db.Time, nullable=False)
+    room = db.Column(db.String(50))
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class AttendanceRecord(db.Model):
+    __table_args__ = (
+        # One record per lecture; also the target of bulk upserts
+        db.Index('uq_attendance_subject_date_lecture', 'subject_id', 'date', 'lecture', unique=True),
+        db.Index('ix_attendance_subject_updated', 'subject_id', 'updated_at'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    subject_id = db.Column(db.Integer, db.ForeignKey('subject.id'), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    # Position of the lecture among the subject's slots that day (0 for the first)
+    lecture = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    attended = db.Column(db.Boolean, nullable=False)
+    notes = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class Holiday(db.Model):
+    """A date with no lectures (holiday, exam break, ...) within a semester"""
+    __table_args__ = (
+        db.Index('ix_holiday_semester_date', 'semester_id', 'date', unique=True),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    semester_id = db.Column(db.Integer, db.ForeignKey('semester.id'), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    name = db.Column(db.String(100))
+
+class AttendanceArchive(db.Model):
+    """A subject's attendance packed as bitmaps over its lecture sequence, for archived semesters.
+
+    The sequence is every teaching day from start_date to end_date (holidays
+    skipped) with one lecture per weekly slot the subject has on that
+    weekday; it is stored rather than read from the timetable, so later
+    timetable edits cannot shift the bits.
+    """
+    subject_id = db.Column(db.Integer, db.ForeignKey('subject.id', ondelete='CASCADE'), primary_key=True)
+    start_date = db.Column(db.Date, nullable=False)
+    end_date = db.Column(db.Date, nullable=False)
+    # JSON list of holiday date ordinals, and slots per weekday (Monday first) as "0,1,0,2,0,0,0"
+    holidays = db.Column(db.Text, nullable=False, default='[]')
+    weekly = db.Column(db.String(20), nullable=False)
+    # Bit i of each map is lecture i of the sequence: has a record / was attended
+    recorded = db.Column(db.LargeBinary, nullable=False)
+    attended = db.Column(db.LargeBinary, nullable=False)
+    # JSON {"<lecture index>": note}, and [[date ordinal, lecture, attended, note, id], ...] for
+    # records that fall outside the sequence
+    notes = db.Column(db.Text, nullable=False, default='{}')
+    extras = db.Column(db.Text, nullable=False, default='[]')
+    # Ids of the records in the bitmaps in sequence order, as zigzag varint deltas, so restored
+    # rows keep the ids sync clients know them by
+    ids = db.Column(db.LargeBinary)
+    # Records packed and how many were attended, for counting without unpacking
+    rows = db.Column(db.Integer, nullable=False, default=0)
+    attended_rows = db.Column(db.Integer, nullable=False, default=0)
+    # Estimated size of the rows in the live table and of this packed form, for space reports
+    row_bytes = db.Column(db.Integer, nullable=False, default=0)
+    packed_bytes = db.Column(db.Integer, nullable=False, default=0)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class SubjectStats(db.Model):
+    """Materialized attended/total counters for a subject"""
+    subject_id = db.Column(db.Integer, db.ForeignKey('subject.id', ondelete='CASCADE'), primary_key=True)
+    attended = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer, nullable=False, default=0)
+
+class SemesterStats(db.Model):
+    """Materialized attended/total counters rolled up over a semester's subjects"""
+    semester_id = db.Column(db.Integer, db.ForeignKey('semester.id', ondelete='CASCADE'), primary_key=True)
+    attended = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer, nullable=False, default=0)
+
+class SyncTombstone(db.Model):
+    """A deleted row, kept so sync clients can drop their copy"""
+    __table_args__ = (
+        db.Index('ix_sync_tombstone_user_deleted', 'user_id', 'deleted_at'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)
+    object_id = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class AnalyticsRun(db.Model):
+    """One computation of the admin cohort snapshots; dashboards read the latest complete run"""
+    id = db.Column(db.Integer, primary_key=True)
+    started_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+    status = db.Column(db.String(20), nullable=False, default='running')
+    threshold = db.Column(db.Float, nullable=False)
+    users = db.Column(db.Integer, nullable=False, default=0)
+
+class SubjectCodeSnapshot(db.Model):
+    """Distribution of students' attendance in one subject code of one semester"""
+    __table_args__ = (
+        db.Index('ix_subject_code_snapshot_run', 'run_id', 'semester_name', 'subject_code'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    run_id = db.Column(db.Integer, db.ForeignKey('analytics_run.id'), nullable=False)
+    semester_name = db.Column(db.String(100), nullable=False)
+    subject_code = db.Column(db.String(20), nullable=False)
+    students = db.Column(db.Integer, nullable=False)
+    attended = db.Column(db.Integer, nullable=False)
+    total = db.Column(db.Integer, nullable=False)
+    below_threshold = db.Column(db.Integer, nullable=False)
+    p10 = db.Column(db.Float)
+    p25 = db.Column(db.Float)
+    median = db.Column(db.Float)
+    p75 = db.Column(db.Float)
+    p90 = db.Column(db.Float)
+    # Students per 10% band, as a JSON list of ten counts
+    histogram = db.Column(db.Text, nullable=False)
+
+class SemesterSnapshot(db.Model):
+    """Totals of every semester sharing a name, for comparing terms"""
+    __table_args__ = (
+        db.Index('ix_semester_snapshot_run', 'run_id', 'semester_name'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    run_id = db.Column(db.Integer, db.ForeignKey('analytics_run.id'), nullable=False)
+    semester_name = db.Column(db.String(100), nullable=False)
+    students = db.Column(db.Integer, nullable=False)
+    subjects = db.Column(db.Integer, nullable=False)
+    attended = db.Column(db.Integer, nullable=False)
+    total = db.Column(db.Integer, nullable=False)
+    below_threshold = db.Column(db.Integer, nullable=False)
+
+class AtRiskSnapshot(db.Model):
+    """A subject of an active semester below the threshold, with its end-of-semester forecast"""
+    __table_args__ = (
+        db.Index('ix_at_risk_snapshot_run', 'run_id', 'max_percentage'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    run_id = db.Column(db.Integer, db.ForeignKey('analytics_run.id'), nullable=False)
+    user_id = db.Column(db.Integer, nullable=False)
+    username = db.Column(db.String(80), nullable=False)
+    semester_id = db.Column(db.Integer, nullable=False)
+    semester_name = db.Column(db.String(100), nullable=False)
+    subject_id = db.Column(db.Integer, nullable=False)
+    subject_code = db.Column(db.String(20), nullable=False)
+    subject_name = db.Column(db.String(100), nullable=False)
+    attended = db.Column(db.Integer, nullable=False)
+    total = db.Column(db.Integer, nullable=False)
+    percentage = db.Column(db.Float, nullable=False)
+    remaining_lectures = db.Column(db.Integer, nullable=False)
+    max_percentage = db.Column(db.Float, nullable=False)
+    target_reachable = db.Column(db.Boolean, nullable=False)
+
+class Job(db.Model):
+    """A unit of background work, queued by a request and claimed by a JobWorker"""
+    __table_args__ = (
+        db.Index('ix_job_status', 'status', 'id'),
+        db.Index('ix_job_user', 'user_id', 'id'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    kind = db.Column(db.String(50), nullable=False)
+    params = db.Column(db.Text, nullable=False, default='{}')
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done, failed
+    worker = db.Column(db.String(100))
+    # JSON summary returned by the handler, or why it failed
+    result = db.Column(db.Text)
+    error = db.Column(db.Text)
+    # File written by the handler, kept until expires_at
+    artifact = db.Column(db.String(255))
+    artifact_name = db.Column(db.String(255))
+    mimetype = db.Column(db.String(100))
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    expires_at = db.Column(db.DateTime)
+
+# Models whose rows carry updated_at for the sync API
+SYNCED_MODELS = (Semester, Subject, TimetableSlot, AttendanceRecord)
+
+# Stats Counters
+def count_attendance(subject_ids):
+    """Count attended/total records per subject straight from AttendanceRecord and the archive"""
+    counts = {subject_id: (0, 0) for subject_id in subject_ids}
+    if not counts:
+        return counts
+    rows = db.session.query(
+        AttendanceRecord.subject_id,
+        db.func.sum(db.case((AttendanceRecord.attended == True, 1), else_=0)),
+        db.func.count(AttendanceRecord.id)
+    ).filter(AttendanceRecord.subject_id.in_(list(counts))).group_by(AttendanceRecord.subject_id).all()
+    for subject_id, attended, total in rows:
+        counts[subject_id] = (int(attended or 0), int(total))
+    for subject_id, attended, total in db.session.query(
+        AttendanceArchive.subject_id, AttendanceArchive.attended_rows, AttendanceArchive.rows
+    ).filter(AttendanceArchive.subject_id.in_(list(counts))):
+        counts[subject_id] = (counts[subject_id][0] + attended, counts[subject_id][1] + total)
+    return counts
+
+def get_subject_stats(subject_id):
+    """Return the counters for a subject, rebuilding them from raw records if missing"""
+    stats = db.session.get(SubjectStats, subject_id)
+    if stats is None:
+        # Count what is already in the database; pending writes are applied as deltas
+        with db.session.no_autoflush:
+            attended, total = count_attendance([subject_id])[subject_id]
+        stats = SubjectStats(subject_id=subject_id, attended=attended, total=total)
+        db.session.add(stats)
+    return stats
+
+def get_semester_stats(semester_id):
+    """Return the counters for a semester, rebuilding them from its subjects if missing"""
+    stats = db.session.get(SemesterStats, semester_id)
+    if stats is None:
+        with db.session.no_autoflush:
+            subject_ids = [row.id for row in Subject.query.with_entities(Subject.id).filter_by(semester_id=semester_id)]
+            counts = count_attendance(subject_ids).values()
+        stats = SemesterStats(
+            semester_id=semester_id,
+            attended=sum(attended for attended, _ in counts),
+            total=sum(total for _, total in counts)
+        )
+        db.session.add(stats)
+    return stats
+
+def ensure_stats(subjects):
+    """Load the counter rows for the given subjects and their semesters, creating missing ones"""
+    subject_ids = {subject.id for subject in subjects}
+    subject_stats = {stats.subject_id: stats for stats in SubjectStats.query.filter(SubjectStats.subject_id.in_(subject_ids))}
+    missing = subject_ids - set(subject_stats)
+    if missing:
+        # Count what is already in the database; pending writes are applied as deltas
+        with db.session.no_autoflush:
+            counts = count_attendance(missing)
+        for subject_id, (attended, total) in counts.items():
+            subject_stats[subject_id] = SubjectStats(subject_id=subject_id, attended=attended, total=total)
+            db.session.add(subject_stats[subject_id])
+    semester_stats = {semester_id: get_semester_stats(semester_id) for semester_id in {subject.semester_id for subject in subjects}}
+    return subject_stats, semester_stats
+
+def apply_stats_deltas(deltas):
+    """Adjust subject and semester counters in the current transaction.
+
+    ``deltas`` maps a Subject to an ``(attended_delta, total_delta)`` pair.
+    Call this before the matching AttendanceRecord changes are flushed.
+    """
+    deltas = {subject: delta for subject, delta in deltas.items() if any(delta)}
+    if not deltas:
+        return
+    subject_stats, semester_stats = ensure_stats(list(deltas))
+    db.session.flush()
+
+    semester_deltas = defaultdict(lambda: [0, 0])
+    for subject, (attended_delta, total_delta) in deltas.items():
+        semester_deltas[subject.semester_id][0] += attended_delta
+        semester_deltas[subject.semester_id][1] += total_delta
+
+    # Increment in SQL so concurrent writers don't overwrite each other
+    for model, key, rows in (
+        (SubjectStats, 'subject_id', [(subject.id, delta) for subject, delta in deltas.items()]),
+        (SemesterStats, 'semester_id', list(semester_deltas.items()))
+    ):
+        table = model.__table__
+        db.session.execute(
+            table.update().where(table.c[key] == db.bindparam('b_id')).values(
+                attended=table.c.attended + db.bindparam('b_attended'),
+                total=table.c.total + db.bindparam('b_total')
+            ),
+            [{'b_id': row_id, 'b_attended': delta[0], 'b_total': delta[1]} for row_id, delta in rows]
+        )
+    for stats in list(subject_stats.values()) + list(semester_stats.values()):
+        db.session.expire(stats)
+
+def lock_counters(subjects):
+    """Hold the counters of these subjects and their semesters until the transaction ends.
+
+    Writers compute deltas from the records they read, so two of them
+    touching the same subjects must not read concurrently. A no-op UPDATE
+    takes the counter row locks on PostgreSQL and the database write lock
+    on SQLite; records read afterwards include every write committed before.
+    """
+    subjects = list(subjects)
+    for model, key, ids in (
+        (SemesterStats, 'semester_id', {subject.semester_id for subject in subjects}),
+        (SubjectStats, 'subject_id', {subject.id for subject in subjects})
+    ):
+        table = model.__table__
+        db.session.execute(
+            table.update().where(table.c[key].in_(sorted(ids))).values(attended=table.c.attended)
+        )
+
+def apply_stats_delta(subject, attended_delta, total_delta):
+    """Adjust the counters of a single subject (see apply_stats_deltas)"""
+    apply_stats_deltas({subject: (attended_delta, total_delta)})
+
+def rebuild_stats(fix=True):
+    """Recompute every counter from raw records and return the drifted rows"""
+    drift = []
+    semester_totals = defaultdict(lambda: [0, 0])
+    subjects = Subject.query.with_entities(Subject.id, Subject.semester_id).all()
+    counts = count_attendance([subject.id for subject in subjects])
+    stored = {stats.subject_id: stats for stats in SubjectStats.query.all()}
+
+    for subject in subjects:
+        attended, total = counts[subject.id]
+        semester_totals[subject.semester_id][0] += attended
+        semester_totals[subject.semester_id][1] += total
+        stats = stored.get(subject.id)
+        if stats is None or (stats.attended, stats.total) != (attended, total):
+            drift.append(('subject', subject.id, (stats.attended, stats.total) if stats else None, (attended, total)))
+            if fix:
+                if stats is None:
+                    db.session.add(SubjectStats(subject_id=subject.id, attended=attended, total=total))
+                else:
+                    stats.attended, stats.total = attended, total
+
+    stored = {stats.semester_id: stats for stats in SemesterStats.query.all()}
+    for (semester_id,) in Semester.query.with_entities(Semester.id):
+        attended, total = semester_totals[semester_id]
+        stats = stored.get(semester_id)
+        if stats is None or (stats.attended, stats.total) != (attended, total):
+            drift.append(('semester', semester_id, (stats.attended, stats.total) if stats else None, (attended, total)))
+            if fix:
+                if stats is None:
+                    db.session.add(SemesterStats(semester_id=semester_id, attended=attended, total=total))
+                else:
+                    stats.attended, stats.total = attended, total
+
+    if fix:
+        if drift:
+            # Counters changed underneath cached pages
+            User.query.update({'data_version': db.func.coalesce(User.data_version, 0) + 1}, synchronize_session=False)
+        db.session.commit()
+    return drift
+
+@bp.cli.command('rebuild-stats')
+@click.option('--verify', is_flag=True, help='Only report drift, do not rewrite the counters.')
+def rebuild_stats_command(verify):
+    """Recompute attendance counters from raw records and report any drift."""
+    drift = rebuild_stats(fix=not verify)
+    for kind, row_id, stored, actual in drift:
+        click.echo(f'{kind} {row_id}: stored={stored} actual={actual}')
+    action = 'found' if verify else 'fixed'
+    click.echo(f'{len(drift)} drifted counter(s) {action}.')
+
+def upsert_attendance(subjects, entries):
+    """Insert or update many attendance records in one batch.
+
+    ``subjects`` maps subject id to an ownership-checked Subject and
+    ``entries`` yields ``(subject_id, date, lecture, attended, notes)``
+    tuples; later entries for the same lecture win. Counters are locked,
+    then adjusted in the same transaction. Returns ``(inserted, updated)``.
+    """
+    rows = {}
+    for subject_id, record_date, lecture, attended, notes in entries:
+        rows[(subject_id, record_date, lecture)] = (bool(attended), notes)
+    if not rows:
+        return 0, 0
+    touched = [subjects[subject_id] for subject_id in {key[0] for key in rows}]
+    lock_counters(touched)
+    restore_archived_subjects(touched)
+
+    dates = [key[1] for key in rows]
+    existing = {
+        (subject_id, record_date, lecture): attended
+        for subject_id, record_date, lecture, attended in db.session.query(
+            AttendanceRecord.subject_id, AttendanceRecord.date, AttendanceRecord.lecture, AttendanceRecord.attended
+        ).filter(
+            AttendanceRecord.subject_id.in_({key[0] for key in rows}),
+            AttendanceRecord.date.between(min(dates), max(dates))
+        )
+    }
+
+    deltas = defaultdict(lambda: [0, 0])
+    for key, (attended, _) in rows.items():
+        delta = deltas[subjects[key[0]]]
+        if key in existing:
+            delta[0] += int(attended) - int(existing[key])
+        else:
+            delta[0] += int(attended)
+            delta[1] += 1
+    apply_stats_deltas(deltas)
+
+    now = datetime.utcnow()
+    values = [
+        {'subject_id': subject_id, 'date': record_date, 'lecture': lecture, 'attended': attended,
+         'notes': notes, 'created_at': now, 'updated_at': now}
+        for (subject_id, record_date, lecture), (attended, notes) in rows.items()
+    ]
+    table = AttendanceRecord.__table__
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        for start in range(0, len(values), UPSERT_CHUNK_SIZE):
+            stmt = insert(table).values(values[start:start + UPSERT_CHUNK_SIZE])
+            db.session.execute(stmt.on_conflict_do_update(
+                index_elements=['subject_id', 'date', 'lecture'],
+                set_={'attended': stmt.excluded.attended, 'notes': stmt.excluded.notes,
+                      'updated_at': stmt.excluded.updated_at}
+            ))
+    else:
+        # No portable upsert; split into updates and inserts using the rows we already read
+        def key(row):
+            return row['subject_id'], row['date'], row['lecture']
+        updates = [dict(row, b_subject_id=row['subject_id'], b_date=row['date'], b_lecture=row['lecture'])
+                   for row in values if key(row) in existing]
+        inserts = [row for row in values if key(row) not in existing]
+        if updates:
+            db.session.execute(
+                table.update().where(
+                    (table.c.subject_id == db.bindparam('b_subject_id')) & (table.c.date == db.bindparam('b_date'))
+                    & (table.c.lecture == db.bindparam('b_lecture'))
+                ).values(attended=db.bindparam('attended'), notes=db.bindparam('notes'),
+                         updated_at=db.bindparam('updated_at')),
+                updates
+            )
+        if inserts:
+            db.session.execute(table.insert(), inserts)
+
+    updated = sum(1 for key in rows if key in existing)
+    return len(rows) - updated, updated
+
+def remove_duplicate_attendance():
+    """Delete all but the newest record per lecture; returns the number removed"""
+    keep = db.session.query(db.func.max(AttendanceRecord.id)).group_by(
+        AttendanceRecord.subject_id, AttendanceRecord.date, AttendanceRecord.lecture
+    )
+    removed = AttendanceRecord.query.filter(~AttendanceRecord.id.in_(keep)).delete(synchronize_session=False)
+    db.session.commit()
+    return removed
+
+def upgrade_schema():
+    """Bring an existing database up to the current models.
+
+    Creates missing tables, adds missing (nullable) columns and creates
+    missing indexes, removing duplicate attendance records first so the
+    unique index can be built. Safe to run repeatedly. Returns a list of
+    the changes made.
+    """
+    existing_tables = set(inspect(db.engine).get_table_names())
+    changes = [f'created table {table.name}' for table in db.metadata.sorted_tables if table.name not in existing_tables]
+    db.create_all()
+    inspector = inspect(db.engine)
+    # Table and column names such as "user" are reserved words on PostgreSQL
+    preparer = db.engine.dialect.identifier_preparer
+    with db.engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                default = f" DEFAULT '{column.server_default.arg}'" if column.server_default is not None else ''
+                connection.execute(db.text(
+                    f'ALTER TABLE {preparer.format_table(table)} '
+                    f'ADD COLUMN {preparer.format_column(column)} {column_type}{default}'
+                ))
+                changes.append(f'added column {table.name}.{column.name}')
+
+    for model in SYNCED_MODELS:
+        stamped = model.query.filter(model.updated_at.is_(None)).update(
+            {'updated_at': datetime.utcnow()}, synchronize_session=False
+        )
+        if stamped:
+            changes.append(f'stamped updated_at on {stamped} {model.__tablename__} row(s)')
+    db.session.commit()
+
+    removed = remove_duplicate_attendance()
+    if removed:
+        changes.append(f'removed {removed} duplicate attendance record(s)')
+
+    for table in db.metadata.sorted_tables:
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for name in existing.intersection(OBSOLETE_INDEXES):
+            with db.engine.begin() as connection:
+                connection.execute(db.text(f'DROP INDEX {preparer.quote(name)}'))
+            changes.append(f'dropped index {name}')
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(db.engine)
+                changes.append(f'created index {index.name}')
+
+    drift = rebuild_stats()
+    if drift:
+        changes.append(f'corrected {len(drift)} attendance counter(s)')
+    return changes
+
+@bp.cli.command('upgrade-db')
+def upgrade_db_command():
+    """Create or migrate the database schema to match the models."""
+    changes = upgrade_schema()
+    for change in changes:
+        click.echo(change)
+    click.echo('Database is up to date.' if not changes else f'{len(changes)} change(s) applied.')
+
+# Helper Functions
+def calculate_attendance_percentage(subject_id):
+    """Calculate attendance percentage for a subject"""
+    stats = get_subject_stats(subject_id)
+    return (stats.attended / stats.total) * 100 if stats.total > 0 else 0.0
+
+def calculate_aggregate_attendance():
+    """Calculate overall attendance percentage across all subjects"""
+    active_semester = get_active_semester()
+    if not active_semester:
+        return 0.0
+    
+    stats = get_semester_stats(active_semester.id)
+    return (stats.attended / stats.total) * 100 if stats.total > 0 else 0.0
+
+def calculate_lectures_needed(subject_id, target_percentage=75):
+    """Calculate how many lectures needed to reach target attendance"""
+    stats = get_subject_stats(subject_id)
+    return attendance_guidance(stats.attended, stats.total, target_percentage)
+
+def attendance_guidance(attended_lectures, total_lectures, target_percentage=75):
+    """Calculate lectures to attend / lectures that can be missed from raw counts"""
+    if total_lectures == 0:
+        return {"lectures_to_attend": 0, "lectures_can_miss": 0, "current_percentage": 0}
+    
+    current_percentage = (attended_lectures / total_lectures) * 100
+    
+    # Calculate lectures needed to reach target
+    lectures_to_attend = 0
+    if current_percentage < target_percentage:
+        # Need to attend more lectures
+        # Formula: (attended + x) / (total + x) = target/100
+        # Solving for x: x = (target * total - 100 * attended) / (100 - target)
+        if target_percentage < 100:
+            lectures_to_attend = max(0, int((target_percentage * total_lectures - 100 * attended_lectures) / (100 - target_percentage)))
+    
+    # Calculate lectures that can be missed while maintaining target
+    lectures_can_miss = 0
+    if current_percentage >= target_percentage:
+        # Formula: attended / (total + x) >= target/100
+        # Solving for x: x <= (100 * attended - target * total) / target
+        if target_percentage > 0:
+            lectures_can_miss = max(0, int((100 * attended_lectures - target_percentage * total_lectures) / target_percentage))
+    
+    return {
+        "lectures_to_attend": lectures_to_attend,
+        "lectures_can_miss": lectures_can_miss,
+        "current_percentage": round(current_percentage, 2)
+    }
+
+def get_recent_records(subject_ids, limit=REPORT_RECENT_RECORDS):
+    """Latest ``limit`` records for each subject, newest first, in one windowed query"""
+    recent = defaultdict(list)
+    if not subject_ids:
+        return recent
+    row_number = db.func.row_number().over(
+        partition_by=AttendanceRecord.subject_id,
+        order_by=(AttendanceRecord.date.desc(), AttendanceRecord.id.desc())
+    ).label('row_number')
+    ranked = db.session.query(AttendanceRecord.id, row_number).filter(
+        AttendanceRecord.subject_id.in_(subject_ids)
+    ).subquery()
+    records = AttendanceRecord.query.join(ranked, ranked.c.id == AttendanceRecord.id).filter(
+        ranked.c.row_number <= limit
+    ).order_by(AttendanceRecord.date.desc(), AttendanceRecord.id.desc())
+    for record in records:
+        recent[record.subject_id].append(record)
+    return recent
+
+def encode_history_cursor(record):
+    """Keyset cursor pointing just past ``record`` in (date, id) descending order"""
+    return f'{record.date.isoformat()}:{record.id}'
+
+def decode_history_cursor(cursor):
+    record_date, record_id = cursor.split(':')
+    return datetime.strptime(record_date, '%Y-%m-%d').date(), int(record_id)
+
+def archived_history_page(archive, cursor, limit):
+    """A history API page of an archived subject; the cursor holds the lecture, since old archives have no ids"""
+    records = unpack_archive(archive)[::-1]
+    if cursor:
+        after = decode_history_cursor(cursor)
+        records = [record for record in records if (record[1], record[2]) < after]
+    page = records[:limit]
+    return {
+        'records': [{'id': record_id, 'date': record_date.isoformat(), 'lecture': lecture, 'attended': attended,
+                     'notes': notes}
+                    for record_id, record_date, lecture, attended, notes in page],
+        'next_cursor': f'{page[-1][1].isoformat()}:{page[-1][2]}' if len(records) > limit else None,
+        'archived': True
+    }
+
+def get_semester_attendance(semester_id, target_percentage=75):
+    """Attendance stats for every subject of a semester plus the aggregate.
+
+    Reads all subjects and their counters in a single query, so the cost per
+    request does not grow with the number of subjects.
+    """
+    rows = db.session.query(Subject, SubjectStats.attended, SubjectStats.total).outerjoin(
+        SubjectStats, SubjectStats.subject_id == Subject.id
+    ).filter(Subject.semester_id == semester_id).order_by(Subject.id).all()
+
+    # Subjects created before the counters existed get one grouped count between them
+    missing = count_attendance([subject.id for subject, _, total in rows if total is None])
+
+    subject_data = []
+    total_attended = 0
+    total_lectures = 0
+    for subject, attended, total in rows:
+        if total is None:
+            attended, total = missing[subject.id]
+        total_attended += attended
+        total_lectures += total
+        percentage = (attended / total) * 100 if total > 0 else 0.0
+        subject_data.append({
+            'subject': subject,
+            'attendance_percentage': round(percentage, 2),
+            'guidance': attendance_guidance(attended, total, target_percentage),
+            'total_lectures': total,
+            'attended_lectures': attended
+        })
+
+    aggregate = (total_attended / total_lectures) * 100 if total_lectures > 0 else 0.0
+    return subject_data, round(aggregate, 2)
+
+# Timetable Projection
+_occurrence_cache = OrderedDict()
+_occurrence_lock = threading.Lock()
+
+def build_occurrence_index(semester):
+    """Expand the weekly timetable of a semester into a compact occurrence index.
+
+    Instead of materializing every lecture, the index keeps the teaching days
+    of the semester (holidays removed) as sorted date ordinals per weekday,
+    plus the number of weekly slots each subject has on each weekday. It
+    also keeps the day-of-week -> slots lookup used by the attendance pages,
+    where each slot is numbered among the subject's lectures that day.
+    """
+    holidays = {holiday.date for holiday in Holiday.query.filter_by(semester_id=semester.id)}
+    weekday_dates = [array('l') for _ in range(7)]
+    day = semester.start_date
+    while day <= semester.end_date:
+        if day not in holidays:
+            weekday_dates[day.weekday()].append(day.toordinal())
+        day += timedelta(days=1)
+
+    slot_counts = defaultdict(lambda: [0] * 7)
+    day_slots = [[] for _ in range(7)]
+    slots = db.session.query(
+        TimetableSlot.id, TimetableSlot.subject_id, TimetableSlot.day_of_week,
+        TimetableSlot.start_time, TimetableSlot.end_time, TimetableSlot.room
+    ).join(Subject).filter(
+        Subject.semester_id == semester.id
+    ).order_by(TimetableSlot.start_time, TimetableSlot.id)
+    for slot_id, subject_id, day_of_week, start_time, end_time, room in slots:
+        day_slots[day_of_week].append({
+            'slot_id': slot_id, 'subject_id': subject_id, 'lecture': slot_counts[subject_id][day_of_week],
+            'start_time': start_time, 'end_time': end_time, 'room': room
+        })
+        slot_counts[subject_id][day_of_week] += 1
+
+    return {
+        'weekday_dates': weekday_dates,
+        'slot_counts': dict(slot_counts),
+        'day_slots': day_slots,
+        'holidays': frozenset(holidays)
+    }
+
+def get_occurrence_index(semester):
+    """Occurrence index for a semester, cached until its schedule version or dates change"""
+    key = (semester.schedule_version or 0, semester.start_date, semester.end_date)
+    with _occurrence_lock:
+        cached = _occurrence_cache.get(semester.id)
+        if cached is not None and cached[0] == key:
+            _occurrence_cache.move_to_end(semester.id)
+            return cached[1]
+
+    index = build_occurrence_index(semester)
+    with _occurrence_lock:
+        _occurrence_cache[semester.id] = (key, index)
+        _occurrence_cache.move_to_end(semester.id)
+        while len(_occurrence_cache) > OCCURRENCE_CACHE_SIZE:
+            _occurrence_cache.popitem(last=False)
+    return index
+
+def bump_schedule_version(semester_id):
+    """Invalidate cached occurrence indexes for a semester in every worker"""
+    Semester.query.filter_by(id=semester_id).update(
+        # Not a change sync clients care about, so leave updated_at alone
+        {'schedule_version': db.func.coalesce(Semester.schedule_version, 0) + 1, 'updated_at': Semester.updated_at},
+        synchronize_session=False
+    )
+
+def project_attendance(attended, total, remaining, target_percentage=75):
+    """Forecast the end-of-semester position of one subject"""
+    final_total = total + remaining
+    # Largest s with (attended + remaining - s) / final_total >= target
+    skippable = math.floor(attended + remaining - target_percentage * final_total / 100 + 1e-9)
+    rate = attended / total if total > 0 else 1.0
+
+    return {
+        'remaining_lectures': remaining,
+        'max_skippable': min(max(skippable, 0), remaining),
+        'target_reachable': skippable >= 0,
+        'projected_percentage': round((attended + remaining * rate) / final_total * 100, 2) if final_total else 0.0,
+        'max_percentage': round((attended + remaining) / final_total * 100, 2) if final_total else 0.0
+    }
+
+def get_semester_projection(semester, subject_data, as_of=None, target_percentage=75):
+    """Remaining lectures, skippable lectures and projected final % for every subject.
+
+    ``subject_data`` is the list returned by get_semester_attendance(). The
+    remaining teaching days are counted once per weekday, so each subject
+    costs a seven-element dot product. Subjects without timetable slots fall
+    back to their planned ``total_lectures``.
+    """
+    as_of = as_of or date.today()
+    index = get_occurrence_index(semester)
+    remaining_days = [len(dates) - bisect_right(dates, as_of.toordinal()) for dates in index['weekday_dates']]
+
+    projections = {}
+    for subject_info in subject_data:
+        subject = subject_info['subject']
+        slot_counts = index['slot_counts'].get(subject.id)
+        if slot_counts:
+            remaining = sum(count * days for count, days in zip(slot_counts, remaining_days))
+            source = 'timetable'
+        else:
+            remaining = max((subject.total_lectures or 0) - subject_info['total_lectures'], 0) if as_of < semester.end_date else 0
+            source = 'planned'
+        projection = project_attendance(subject_info['attended_lectures'], subject_info['total_lectures'], remaining, target_percentage)
+        projection['source'] = source
+        projections[subject.id] = projection
+    return projections
+
+def remaining_lecture_dates(index, subject_id, as_of):
+    """Dates of a subject's timetabled lectures after ``as_of``, one entry per lecture"""
+    slot_counts = index['slot_counts'].get(subject_id, [0] * 7)
+    dates = []
+    for weekday, count in enumerate(slot_counts):
+        if count:
+            days = index['weekday_dates'][weekday]
+            dates.extend(ordinal for ordinal in days[bisect_right(days, as_of.toordinal()):] for _ in range(count))
+    dates.sort()
+    return dates
+
+def final_percentage(attended, total, remaining, skipped):
+    final_total = total + remaining
+    return (attended + remaining - skipped) / final_total * 100 if final_total else None
+
+def plan_skips(subjects, targets, aggregate_target=None):
+    """Most lectures that can be skipped across subjects while every target still holds.
+
+    ``subjects`` are dicts with attended, total, remaining and credits;
+    ``targets`` gives each one's own minimum percentage (None for no
+    minimum). With ``aggregate_target`` the credit-weighted mean of the
+    final percentages must also stay at or above it. Every skip is worth
+    the same, and one skip of subject i lowers the weighted sum by
+    credits_i / final_total_i, so taking skips from the cheapest subjects
+    first is optimal. Returns ``(skips, aggregate_reachable)``, skips per
+    subject in input order.
+    """
+    caps = []
+    for subject, target in zip(subjects, targets):
+        cap = subject['remaining']
+        if target is not None:
+            final_total = subject['total'] + subject['remaining']
+            # Largest s with (attended + remaining - s) / final_total >= target
+            cap = min(cap, math.floor(subject['attended'] + subject['remaining'] - target * final_total / 100 + 1e-9))
+        caps.append(max(cap, 0))
+    if aggregate_target is None:
+        return caps, True
+
+    weighted = [(i, subject['credits'] or 0, subject['total'] + subject['remaining']) for i, subject in enumerate(subjects)]
+    weighted = [(i, credits, final_total) for i, credits, final_total in weighted if final_total and credits > 0]
+    credit_sum = sum(credits for _, credits, _ in weighted)
+    if not credit_sum:
+        return caps, True
+    # Weighted percentage points above the aggregate target with no skips at all
+    budget = sum(
+        credits * final_percentage(subjects[i]['attended'], subjects[i]['total'], subjects[i]['remaining'], 0)
+        for i, credits, _ in weighted
+    ) - aggregate_target * credit_sum
+    skips = [0] * len(subjects)
+    for i in (i for i, subject in enumerate(subjects) if not subject['credits'] or not subject['total'] + subject['remaining']):
+        # Skipping here does not move the credit-weighted aggregate
+        skips[i] = caps[i]
+    if budget < -1e-9:
+        return skips, False
+    for i, credits, final_total in sorted(weighted, key=lambda item: item[1] / item[2]):
+        cost = credits * 100 / final_total
+        skips[i] = min(caps[i], int(math.floor(budget / cost + 1e-9)))
+        budget -= skips[i] * cost
+    return skips, True
+
+def evaluate_scenario(subjects, targets, aggregate_target, scenario):
+    """Final percentages if the given lectures are skipped; ``scenario`` is already validated"""
+    results, weighted, credit_sum = [], 0.0, 0
+    for subject, target in zip(subjects, targets):
+        subject_id = subject['subject'].id
+        if subject_id in scenario['skip']:
+            skipped = scenario['skip'][subject_id]
+        else:
+            rate = scenario['attend_rate'].get(subject_id, scenario['default_rate'])
+            skipped = int(round(subject['remaining'] * (1 - rate)))
+        skipped = min(max(skipped, 0), subject['remaining'])
+        percentage = final_percentage(subject['attended'], subject['total'], subject['remaining'], skipped)
+        if percentage is not None and subject['credits']:
+            weighted += subject['credits'] * percentage
+            credit_sum += subject['credits']
+        results.append({
+            'subject_id': subject_id,
+            'skipped': skipped,
+            'final_percentage': round(percentage, 2) if percentage is not None else None,
+            'meets_target': target is None or (percentage is not None and percentage + 1e-9 >= target)
+        })
+    aggregate = weighted / credit_sum if credit_sum else None
+    return {
+        'name': scenario['name'],
+        'subjects': results,
+        'aggregate_percentage': round(aggregate, 2) if aggregate is not None else None,
+        'meets_aggregate_target': aggregate_target is None or (aggregate is not None and aggregate + 1e-9 >= aggregate_target),
+        'all_targets_met': all(result['meets_target'] for result in results)
+    }
+
+# Semester Archive
+def archive_sequence(start_date, end_date, holidays, weekly):
+    """Yield ``(date, lecture)`` for every lecture of an archived subject's sequence"""
+    day = start_date
+    while day <= end_date:
+        if day.toordinal() not in holidays:
+            for lecture in range(weekly[day.weekday()]):
+                yield day, lecture
+        day += timedelta(days=1)
+
+def estimated_row_bytes(notes):
+    return ATTENDANCE_ROW_BYTES + len((notes or '').encode('utf-8'))
+
+def pack_ids(ids):
+    """Encode ascending-ish record ids compactly, as varints of the zigzagged differences"""
+    packed, previous = bytearray(), 0
+    for row_id in ids:
+        delta, previous = row_id - previous, row_id
+        value = delta << 1 if delta >= 0 else (-delta << 1) - 1
+        while value >= 0x80:
+            packed.append(value & 0x7f | 0x80)
+            value >>= 7
+        packed.append(value)
+    return bytes(packed)
+
+def unpack_ids(packed):
+    ids, previous, value, shift = [], 0, 0, 0
+    for byte in packed:
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if byte & 0x80:
+            continue
+        previous += value >> 1 if not value & 1 else -((value + 1) >> 1)
+        ids.append(previous)
+        value = shift = 0
+    return ids
+
+def pack_subject(subject_id, index, records, now):
+    """AttendanceArchive for one subject from its ``(id, date, lecture, attended, notes)`` records"""
+    weekly = index['slot_counts'].get(subject_id, [0] * 7)
+    holidays = sorted(day.toordinal() for day in index['holidays'])
+    start_date, end_date = index['start_date'], index['end_date']
+    positions = {key: position for position, key in enumerate(
+        archive_sequence(start_date, end_date, set(holidays), weekly)
+    )}
+    recorded = bytearray((len(positions) + 7) // 8)
+    attended_bits = bytearray(len(recorded))
+    notes, extras, ids = {}, [], {}
+    attended_rows = row_bytes = 0
+    for record_id, record_date, lecture, attended, note in records:
+        attended_rows += bool(attended)
+        row_bytes += estimated_row_bytes(note)
+        position = positions.get((record_date, lecture))
+        if position is None:
+            extras.append([record_date.toordinal(), lecture, int(bool(attended)), note or '', record_id])
+            continue
+        ids[position] = record_id
+        recorded[position >> 3] |= 1 << (position & 7)
+        if attended:
+            attended_bits[position >> 3] |= 1 << (position & 7)
+        if note:
+            notes[str(position)] = note
+    archive = AttendanceArchive(
+        subject_id=subject_id, start_date=start_date, end_date=end_date,
+        holidays=json.dumps(holidays, separators=(',', ':')), weekly=','.join(map(str, weekly)),
+        recorded=bytes(recorded), attended=bytes(attended_bits),
+        notes=json.dumps(notes, separators=(',', ':')), extras=json.dumps(extras, separators=(',', ':')),
+        ids=pack_ids(ids[position] for position in sorted(ids)),
+        rows=len(records), attended_rows=attended_rows, row_bytes=row_bytes, archived_at=now
+    )
+    archive.packed_bytes = (ARCHIVE_ROW_BYTES + len(archive.recorded) + len(archive.attended) + len(archive.holidays)
+                            + len(archive.notes.encode('utf-8')) + len(archive.extras.encode('utf-8'))
+                            + len(archive.ids))
+    return archive
+
+def unpack_archive(archive):
+    """The ``(id, date, lecture, attended, notes)`` records of an archive in date order.
+
+    Ids are None for archives packed before record ids were kept.
+    """
+    weekly = [int(count) for count in archive.weekly.split(',')]
+    notes = json.loads(archive.notes)
+    ids = iter(unpack_ids(archive.ids or b''))
+    records = []
+    for position, (record_date, lecture) in enumerate(archive_sequence(
+        archive.start_date, archive.end_date, set(json.loads(archive.holidays)), weekly
+    )):
+        if archive.recorded[position >> 3] & (1 << (position & 7)):
+            attended = bool(archive.attended[position >> 3] & (1 << (position & 7)))
+            records.append((next(ids, None), record_date, lecture, attended, notes.get(str(position), '')))
+    for extra in json.loads(archive.extras):
+        ordinal, lecture, attended, note = extra[:4]
+        records.append((extra[4] if len(extra) > 4 else None, date.fromordinal(ordinal), lecture, bool(attended), note))
+    records.sort(key=lambda record: (record[1], record[2]))
+    return records
+
+def archive_semester(semester):
+    """Move an inactive semester's attendance records out of the live table into AttendanceArchive rows.
+
+    The counters are left as they are, so every page that only needs totals
+    reads an archived semester exactly as before. The caller commits.
+    Returns the number of records packed.
+    """
+    if semester.is_active:
+        raise ValueError('Deactivate the semester before archiving it')
+    if semester.archived_at is not None:
+        return 0
+    index = dict(get_occurrence_index(semester), start_date=semester.start_date, end_date=semester.end_date)
+    subjects = Subject.query.filter_by(semester_id=semester.id).order_by(Subject.id).all()
+    if not subjects:
+        semester.archived_at = datetime.utcnow()
+        return 0
+    # Totals must survive the raw rows, so make sure every subject has its counters
+    ensure_stats(subjects)
+
+    records = defaultdict(list)
+    for subject_id, record_id, record_date, lecture, attended, notes in db.session.query(
+        AttendanceRecord.subject_id, AttendanceRecord.id, AttendanceRecord.date, AttendanceRecord.lecture,
+        AttendanceRecord.attended, AttendanceRecord.notes
+    ).filter(AttendanceRecord.subject_id.in_([subject.id for subject in subjects])).yield_per(EXPORT_FETCH_SIZE):
+        records[subject_id].append((record_id, record_date, lecture, attended, notes))
+
+    now = datetime.utcnow()
+    for subject in subjects:
+        db.session.add(pack_subject(subject.id, index, records[subject.id], now))
+    AttendanceRecord.query.filter(
+        AttendanceRecord.subject_id.in_([subject.id for subject in subjects])
+    ).delete(synchronize_session=False)
+    semester.archived_at = now
+    return sum(len(subject_records) for subject_records in records.values())
+
+def insert_restored_records(rows):
+    """Insert unpacked records, keeping their ids unless a newer row took one (SQLite reuses the highest)"""
+    table = AttendanceRecord.__table__
+    ids = [row['id'] for row in rows if row['id'] is not None]
+    taken = set()
+    if ids:
+        taken = {row_id for (row_id,) in db.session.query(AttendanceRecord.id).filter(AttendanceRecord.id.in_(ids))}
+    kept = [row for row in rows if row['id'] is not None and row['id'] not in taken]
+    renumbered = [{key: value for key, value in row.items() if key != 'id'}
+                  for row in rows if row['id'] is None or row['id'] in taken]
+    for batch in (kept, renumbered):
+        if batch:
+            db.session.execute(table.insert(), batch)
+
+def restore_semester(semester):
+    """Unpack an archived semester's records back into the live table. The caller commits.
+
+    Restored rows keep their ids and are stamped as changed now, so every
+    sync client pulls them again: clients that synced while the semester
+    was archived get them for the first time, the others overwrite the
+    copy they already have under the same id.
+    """
+    if semester.archived_at is None:
+        return 0
+    restored, rows = 0, []
+    now = datetime.utcnow()
+    archives = AttendanceArchive.query.join(Subject).filter(Subject.semester_id == semester.id).all()
+    for archive in archives:
+        for record_id, record_date, lecture, attended, notes in unpack_archive(archive):
+            rows.append({'id': record_id, 'subject_id': archive.subject_id, 'date': record_date, 'lecture': lecture,
+                         'attended': attended, 'notes': notes, 'created_at': archive.archived_at, 'updated_at': now})
+            if len(rows) == UPSERT_CHUNK_SIZE:
+                insert_restored_records(rows)
+                restored += len(rows)
+                rows = []
+        db.session.delete(archive)
+    if rows:
+        insert_restored_records(rows)
+        restored += len(rows)
+    semester.archived_at = None
+    return restored
+
+def restore_archived_subjects(subjects):
+    """Restore the archived semesters among ``subjects`` before their records are written"""
+    for semester in {subject.semester for subject in subjects}:
+        if semester.archived_at is not None:
+            restore_semester(semester)
+
+def archive_stats(semester_ids):
+    """Records packed and estimated bytes before/after archiving, per archived semester"""
+    stats = {}
+    for semester_id, rows, row_bytes, packed_bytes in db.session.query(
+        Subject.semester_id, db.func.sum(AttendanceArchive.rows),
+        db.func.sum(AttendanceArchive.row_bytes), db.func.sum(AttendanceArchive.packed_bytes)
+    ).join(Subject).filter(Subject.semester_id.in_(semester_ids)).group_by(Subject.semester_id):
+        row_bytes, packed_bytes = int(row_bytes or 0), int(packed_bytes or 0)
+        stats[semester_id] = {
+            'rows': int(rows or 0),
+            'row_bytes': row_bytes,
+            'packed_bytes': packed_bytes,
+            'saved_percentage': round((1 - packed_bytes / row_bytes) * 100, 1) if row_bytes else 0.0
+        }
+    return stats
+
+def archived_daily_attendance(subject_ids):
+    """Rows shaped like daily_attendance() for both groupings, counted from archives"""
+    per_subject = defaultdict(lambda: defaultdict(lambda: [0, 0]))
+    overall = defaultdict(lambda: [0, 0])
+    for archive in AttendanceArchive.query.filter(AttendanceArchive.subject_id.in_(subject_ids)):
+        for _, record_date, _, attended, _ in unpack_archive(archive):
+            for counts in (per_subject[archive.subject_id][record_date], overall[record_date]):
+                counts[0] += attended
+                counts[1] += 1
+
+    rows = []
+    for subject_id, days in sorted(per_subject.items()) + [(None, overall)]:
+        cumulative_attended = cumulative_total = 0
+        for day in sorted(days):
+            attended, total = days[day]
+            cumulative_attended += attended
+            cumulative_total += total
+            rows.append((subject_id, day, attended, total, cumulative_attended, cumulative_total))
+    return rows
+
+@bp.cli.command('archive-semesters')
+@click.option('--ended-before', type=click.DateTime(formats=['%Y-%m-%d']),
+              help='Only semesters that ended before this date (default: today).')
+def archive_semesters_command(ended_before):
+    """Pack the attendance of every finished, inactive semester into the archive."""
+    cutoff = (ended_before or datetime.utcnow()).date()
+    semesters = Semester.query.filter(
+        Semester.is_active == False, Semester.archived_at.is_(None), Semester.end_date < cutoff
+    ).order_by(Semester.id).all()
+    packed = 0
+    for semester in semesters:
+        packed += archive_semester(semester)
+        bump_data_version(semester.user_id)
+        db.session.commit()
+    totals = archive_stats([semester.id for semester in semesters]).values()
+    row_bytes = sum(stats['row_bytes'] for stats in totals)
+    packed_bytes = sum(stats['packed_bytes'] for stats in totals)
+    saved = f' (~{row_bytes:,} bytes packed into ~{packed_bytes:,})' if row_bytes else ''
+    click.echo(f'Archived {len(semesters)} semester(s), {packed} record(s){saved}.')
+
+# Semester Rollover
+def rollover_dates(source, start_date=None, end_date=None, shift_days=None):
+    """Dates of the semester following ``source``: as given, shifted by ``shift_days``, or the next
+    run of whole weeks after it, so every date keeps its weekday"""
+    if start_date is None:
+        if shift_days is None:
+            shift_days = ((source.end_date - source.start_date).days // 7 + 1) * 7
+        start_date = source.start_date + timedelta(days=shift_days)
+    if end_date is None:
+        end_date = start_date + (source.end_date - source.start_date)
+    if end_date < start_date:
+        raise ValueError('The end date is before the start date')
+    return start_date, end_date
+
+def rollover_semesters(sources, name, start_date=None, end_date=None, shift_days=None,
+                       subject_codes=None, copy_holidays=False, activate=True):
+    """Copy each source semester's subjects and timetable into a new semester of the same user.
+
+    Dates are worked out by rollover_dates() per source. Only subjects
+    whose code is in ``subject_codes`` are copied when it is given, and
+    holidays are copied (shifted like the semester) with ``copy_holidays``.
+    Rows for every source are written with a few bulk inserts, and with
+    ``activate`` each user's other semesters are deactivated in the same
+    transaction, which the caller commits. Returns the new semesters.
+    """
+    if not sources:
+        return []
+    source_ids = [source.id for source in sources]
+    subjects = Subject.query.filter(Subject.semester_id.in_(source_ids))
+    slots = db.session.query(
+        TimetableSlot.subject_id, TimetableSlot.day_of_week, TimetableSlot.start_time,
+        TimetableSlot.end_time, TimetableSlot.room
+    ).join(Subject).filter(Subject.semester_id.in_(source_ids))
+    if subject_codes:
+        subjects = subjects.filter(Subject.code.in_(subject_codes))
+        slots = slots.filter(Subject.code.in_(subject_codes))
+    subjects_by_semester = defaultdict(list)
+    for subject in subjects.order_by(Subject.id):
+        subjects_by_semester[subject.semester_id].append(subject)
+    slots_by_subject = defaultdict(list)
+    for slot in slots.order_by(TimetableSlot.id):
+        slots_by_subject[slot.subject_id].append(slot)
+    holidays_by_semester = defaultdict(list)
+    if copy_holidays:
+        for holiday in Holiday.query.filter(Holiday.semester_id.in_(source_ids)):
+            holidays_by_semester[holiday.semester_id].append(holiday)
+
+    if activate:
+        Semester.query.filter(Semester.user_id.in_({source.user_id for source in sources})).update(
+            {'is_active': False}, synchronize_session=False
+        )
+    semesters = []
+    for source in sources:
+        semester_start, semester_end = rollover_dates(source, start_date, end_date, shift_days)
+        semesters.append(Semester(name=name, start_date=semester_start, end_date=semester_end,
+                                  is_active=activate, user_id=source.user_id))
+    db.session.add_all(semesters)
+    db.session.flush()
+
+    copies = []
+    for source, semester in zip(sources, semesters):
+        for subject in subjects_by_semester[source.id]:
+            copies.append((subject, Subject(name=subject.name, code=subject.code, credits=subject.credits,
+                                            total_lectures=subject.total_lectures, semester_id=semester.id)))
+    db.session.add_all([copy for _, copy in copies])
+    db.session.flush()
+
+    insert_rows = [
+        (SemesterStats, [{'semester_id': semester.id, 'attended': 0, 'total': 0} for semester in semesters]),
+        (SubjectStats, [{'subject_id': copy.id, 'attended': 0, 'total': 0} for _, copy in copies]),
+        (TimetableSlot, [
+            {'subject_id': copy.id, 'day_of_week': slot.day_of_week, 'start_time': slot.start_time,
+             'end_time': slot.end_time, 'room': slot.room}
+            for subject, copy in copies for slot in slots_by_subject[subject.id]
+        ]),
+        (Holiday, [
+            {'semester_id': semester.id, 'date': holiday.date + (semester.start_date - source.start_date),
+             'name': holiday.name}
+            for source, semester in zip(sources, semesters) for holiday in holidays_by_semester[source.id]
+            if semester.start_date <= holiday.date + (semester.start_date - source.start_date) <= semester.end_date
+        ])
+    ]
+    for model, rows in insert_rows:
+        for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+            db.session.execute(model.__table__.insert(), rows[start:start + UPSERT_CHUNK_SIZE])
+    bump_data_versions(semester.user_id for semester in semesters)
+    return semesters
+
+@bp.cli.command('rollover-semesters')
+@click.option('--name', required=True, help='Name of the new semesters.')
+@click.option('--source-name', help="Copy each user's semester with this name (default: their active semester).")
+@click.option('--start', 'start_date', type=click.DateTime(formats=['%Y-%m-%d']), help='Start date of the new semesters.')
+@click.option('--end', 'end_date', type=click.DateTime(formats=['%Y-%m-%d']), help='End date of the new semesters.')
+@click.option('--shift-days', type=int, help='Without --start, shift the source dates by this many days '
+                                             '(default: the next whole weeks after the source).')
+@click.option('--subject-code', 'subject_codes', multiple=True, help='Only copy subjects with this code (repeatable).')
+@click.option('--copy-holidays', is_flag=True, help='Copy holidays, shifted with the semester.')
+@click.option('--no-activate', is_flag=True, help='Leave the current active semesters active.')
+@click.option('--user', 'usernames', multiple=True, help='Only these users (repeatable; default: everyone).')
+@click.option('--batch-size', type=int, default=500, show_default=True, help='Users per transaction.')
+def rollover_semesters_command(name, source_name, start_date, end_date, shift_days, subject_codes,
+                               copy_holidays, no_activate, usernames, batch_size):
+    """Start a new semester for many users by copying their subjects and timetable."""
+    def batches():
+        if usernames:
+            yield [user_id for user_id, in db.session.query(User.id).filter(User.username.in_(usernames))]
+        else:
+            yield from user_id_batches(batch_size)
+
+    created = skipped = 0
+    for user_ids in batches():
+        sources = Semester.query.filter(Semester.user_id.in_(user_ids))
+        sources = sources.filter_by(name=source_name) if source_name else sources.filter_by(is_active=True)
+        # Users who already have the new semester are left alone, so a failed run can be repeated
+        done = {user_id for user_id, in db.session.query(Semester.user_id).filter(
+            Semester.user_id.in_(user_ids), Semester.name == name
+        )}
+        latest = {}
+        for source in sources.order_by(Semester.start_date, Semester.id):
+            if source.user_id not in done:
+                latest[source.user_id] = source
+        skipped += len(done)
+        try:
+            semesters = rollover_semesters(list(latest.values()), name,
+                                           start_date.date() if start_date else None, end_date.date() if end_date else None,
+                                           shift_days, subject_codes, copy_holidays, not no_activate)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        db.session.commit()
+        created += len(semesters)
+        click.echo(f'{created} semester(s) created, {skipped} user(s) skipped')
+    click.echo(f'Rolled over {created} semester(s) to "{name}".')
+
+# Attendance Trends
+_trend_cache = OrderedDict()
+_trend_lock = threading.Lock()
+TREND_COLUMNS = ('dates', 'ordinals', 'attended', 'total', 'cumulative_attended', 'cumulative_total',
+                 'cumulative', 'rolling_7', 'rolling_30', 'streak')
+
+def daily_attendance(subject_ids, since=None, by_subject=True):
+    """Per-day attended/total counts with running totals computed by the database.
+
+    Yields ``(subject_id, date, attended, total, cumulative_attended,
+    cumulative_total)`` ordered by subject and date. With ``by_subject``
+    false the days of all subjects are added together and subject_id is
+    None. Running totals start at ``since`` when it is given.
+    """
+    group = [AttendanceRecord.subject_id, AttendanceRecord.date] if by_subject else [AttendanceRecord.date]
+    daily = db.session.query(
+        *group,
+        db.func.sum(db.case((AttendanceRecord.attended == True, 1), else_=0)).label('attended'),
+        db.func.count().label('total')
+    ).filter(AttendanceRecord.subject_id.in_(subject_ids))
+    if since is not None:
+        daily = daily.filter(AttendanceRecord.date >= since)
+    daily = daily.group_by(*group).subquery()
+
+    partition = daily.c.subject_id if by_subject else None
+    rows = db.session.query(
+        daily.c.subject_id if by_subject else db.null(), daily.c.date, daily.c.attended, daily.c.total,
+        db.func.sum(daily.c.attended).over(partition_by=partition, order_by=daily.c.date),
+        db.func.sum(daily.c.total).over(partition_by=partition, order_by=daily.c.date)
+    ).order_by(*([daily.c.subject_id] if by_subject else []), daily.c.date)
+    for subject_id, day, attended, total, cumulative_attended, cumulative_total in rows:
+        yield subject_id, day, int(attended), int(total), int(cumulative_attended), int(cumulative_total)
+
+def merge_trend_series(series, rows, since=None):
+    """Replace the days from ``since`` onwards with freshly counted ``rows``.
+
+    ``series`` maps subject id (None for the aggregate) to columns of daily
+    values. Earlier days are kept as they are, fresh running totals are
+    continued from the last kept day, and the rolling percentages and
+    streaks are only worked out for the new days. Returns new series
+    without modifying the old ones, which other requests may be reading.
+    """
+    fresh = defaultdict(list)
+    for row in rows:
+        fresh[row[0]].append(row[1:])
+
+    merged = {}
+    for key in set(series) | set(fresh):
+        old = series.get(key)
+        cut = bisect_left(old['dates'], since) if old and since is not None else 0
+        columns = {column: (old[column][:cut] if old else []) for column in TREND_COLUMNS}
+        base_attended = columns['cumulative_attended'][-1] if cut else 0
+        base_total = columns['cumulative_total'][-1] if cut else 0
+        ordinals = columns['ordinals']
+        for day, attended, total, cumulative_attended, cumulative_total in fresh.get(key, []):
+            cumulative_attended += base_attended
+            cumulative_total += base_total
+            columns['dates'].append(day)
+            ordinals.append(day.toordinal())
+            columns['attended'].append(attended)
+            columns['total'].append(total)
+            columns['cumulative_attended'].append(cumulative_attended)
+            columns['cumulative_total'].append(cumulative_total)
+            columns['cumulative'].append(round(cumulative_attended / cumulative_total * 100, 2))
+            for days in (7, 30):
+                # Running totals as of the last day before the window
+                before = bisect_right(ordinals, ordinals[-1] - days) - 1
+                window_attended = cumulative_attended - (columns['cumulative_attended'][before] if before >= 0 else 0)
+                window_total = cumulative_total - (columns['cumulative_total'][before] if before >= 0 else 0)
+                columns[f'rolling_{days}'].append(round(window_attended / window_total * 100, 2))
+            previous = columns['streak'][-1] if columns['streak'] else 0
+            columns['streak'].append(previous + 1 if attended == total else 0)
+        if columns['dates']:
+            merged[key] = columns
+    return merged
+
+def get_trend_series(semester, subjects, data_version):
+    """Daily trend series for a semester's subjects and their aggregate, cached per (user, semester).
+
+    A cached entry is reused while the user's data version is unchanged.
+    After a write only the days from the earliest changed record onwards
+    are recounted, so appending today's attendance costs a couple of
+    small queries however long the history is. Deleted records or a
+    changed set of subjects rebuild the whole series.
+    """
+    key = (semester.user_id, semester.id)
+    with _trend_lock:
+        cached = _trend_cache.get(key)
+        if cached is not None and cached['version'] == data_version:
+            _trend_cache.move_to_end(key)
+            return cached['series']
+
+    subject_ids = tuple(sorted(subject.id for subject in subjects))
+    series, since, watermark = {}, None, None
+    if cached is not None and cached['subject_ids'] == subject_ids:
+        # Writes stamped just before the watermark may have committed after it was read
+        settled = cached['watermark'] - timedelta(seconds=TREND_SETTLE_SECONDS)
+        deleted = db.session.query(SyncTombstone.id).filter(
+            SyncTombstone.user_id == semester.user_id,
+            SyncTombstone.kind.in_(['records', 'subjects']),
+            SyncTombstone.deleted_at > settled
+        ).first()
+        if deleted is None:
+            since, watermark = db.session.query(
+                db.func.min(AttendanceRecord.date), db.func.max(AttendanceRecord.updated_at)
+            ).filter(AttendanceRecord.subject_id.in_(subject_ids), AttendanceRecord.updated_at > settled).one()
+            series = cached['series']
+            watermark = max(watermark or cached['watermark'], cached['watermark'])
+
+    if not series or since is not None:
+        if not series:
+            watermark = db.session.query(db.func.max(AttendanceRecord.updated_at)).filter(
+                AttendanceRecord.subject_id.in_(subject_ids)
+            ).scalar()
+        rows = []
+        if subject_ids and semester.archived_at is not None:
+            rows = archived_daily_attendance(subject_ids)
+        elif subject_ids:
+            rows = list(daily_attendance(subject_ids, since)) + list(daily_attendance(subject_ids, since, by_subject=False))
+        series = merge_trend_series(series, rows, since)
+
+    with _trend_lock:
+        _trend_cache[key] = {
+            'version': data_version,
+            'subject_ids': subject_ids,
+            'watermark': watermark or datetime(1970, 1, 1),
+            'series': series
+        }
+        _trend_cache.move_to_end(key)
+        while len(_trend_cache) > TREND_CACHE_SIZE:
+            _trend_cache.popitem(last=False)
+    return series
+
+def trend_payload(columns, since=None):
+    """Chart-ready lists for one series, optionally starting at ``since``"""
+    start = bisect_left(columns['dates'], since) if since is not None else 0
+    return {
+        'dates': [day.isoformat() for day in columns['dates'][start:]],
+        'cumulative': columns['cumulative'][start:],
+        'rolling_7': columns['rolling_7'][start:],
+        'rolling_30': columns['rolling_30'][start:],
+        'streak': columns['streak'][start:],
+        'current_streak': columns['streak'][-1],
+        'longest_streak': max(columns['streak'])
+    }
+
+def get_scheduled_lectures(semester, subjects, start, end, show_all=False):
+    """The lectures to mark on each day from ``start`` to ``end``, with any saved records.
+
+    Lectures come from the cached day-of-week index, so a day with two slots
+    of a subject lists it twice. Days outside the semester or on a holiday
+    have no scheduled lectures. If the semester has no timetable yet, or
+    ``show_all`` is set, every subject is listed once per day instead.
+    Lectures that already have a record are always included. All records
+    in the range are loaded with a single query.
+    """
+    index = get_occurrence_index(semester)
+    subjects_by_id = {subject.id: subject for subject in subjects}
+    records = {}
+    if subjects_by_id:
+        for record in AttendanceRecord.query.filter(
+            AttendanceRecord.subject_id.in_(list(subjects_by_id)),
+            AttendanceRecord.date.between(start, end)
+        ):
+            records[(record.date, record.subject_id, record.lecture)] = record
+    list_all = show_all or not index['slot_counts']
+
+    days = []
+    day = start
+    while day <= end:
+        is_holiday = day in index['holidays']
+        if list_all:
+            planned = [{'subject_id': subject.id, 'lecture': 0, 'slot_id': None} for subject in subjects]
+        elif is_holiday or not semester.start_date <= day <= semester.end_date:
+            planned = []
+        else:
+            planned = index['day_slots'][day.weekday()]
+
+        lectures = []
+        seen = set()
+        for slot in planned:
+            key = (day, slot['subject_id'], slot['lecture'])
+            if slot['subject_id'] in subjects_by_id and key not in seen:
+                seen.add(key)
+                lectures.append({'subject': subjects_by_id[slot['subject_id']], 'slot': slot if slot['slot_id'] else None,
+                                 'lecture': slot['lecture'], 'record': records.get(key)})
+        # Records for lectures that are no longer on the timetable stay editable
+        for key in sorted(records):
+            if key[0] == day and key not in seen:
+                lectures.append({'subject': subjects_by_id[key[1]], 'slot': None, 'lecture': key[2], 'record': records[key]})
+        for lecture in lectures:
+            lecture['key'] = f"{day.isoformat()}:{lecture['subject'].id}:{lecture['lecture']}"
+        days.append({'date': day, 'is_holiday': is_holiday, 'lectures': lectures})
+        day += timedelta(days=1)
+    return days
+
+def parse_lecture_key(key):
+    """Split a ``date:subject_id:lecture`` form key"""
+    record_date, subject_id, lecture = key.split(':')
+    return datetime.strptime(record_date, '%Y-%m-%d').date(), int(subject_id), int(lecture)
+
+# Import and Export
+ATTENDANCE_CSV_FIELDS = ['semester', 'subject_code', 'subject_name', 'date', 'lecture', 'attended', 'notes']
+TIMETABLE_CSV_FIELDS = ['subject_code', 'subject_name', 'day_of_week', 'start_time', 'end_time', 'room']
+DAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 'present', 'p', 'x'}
+FALSE_VALUES = {'0', 'false', 'no', 'n', 'absent', 'a'}
+
+def stream_csv(header, rows):
+    """Encode rows as CSV, yielding chunks of about 64KB so exports use constant memory"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= 65536:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def export_attendance_rows(semester_ids):
+    """Attendance of the given semesters, fetched from the database in batches"""
+    archived = Semester.query.filter(Semester.id.in_(semester_ids), Semester.archived_at.isnot(None)).all()
+    for semester in sorted(archived, key=lambda semester: (semester.start_date, semester.id)):
+        for subject in Subject.query.filter_by(semester_id=semester.id).order_by(Subject.id):
+            if subject.archive is None:
+                continue
+            for _, record_date, lecture, attended, notes in unpack_archive(subject.archive):
+                yield semester.name, subject.code, subject.name, record_date.isoformat(), lecture, int(attended), notes or ''
+    query = db.session.query(
+        Semester.name, Subject.code, Subject.name, AttendanceRecord.date, AttendanceRecord.lecture,
+        AttendanceRecord.attended, AttendanceRecord.notes
+    ).select_from(AttendanceRecord).join(Subject).join(Semester).filter(
+        Semester.id.in_(semester_ids)
+    ).order_by(Semester.start_date, Semester.id, AttendanceRecord.subject_id, AttendanceRecord.date,
+               AttendanceRecord.lecture).yield_per(EXPORT_FETCH_SIZE)
+    for semester_name, code, name, record_date, lecture, attended, notes in query:
+        yield semester_name, code, name, record_date.isoformat(), lecture, int(attended), notes or ''
+
+def export_timetable_rows(semester_id):
+    slots = db.session.query(
+        Subject.code, Subject.name, TimetableSlot.day_of_week, TimetableSlot.start_time,
+        TimetableSlot.end_time, TimetableSlot.room
+    ).join(Subject).filter(Subject.semester_id == semester_id).order_by(
+        TimetableSlot.day_of_week, TimetableSlot.start_time
+    ).yield_per(EXPORT_FETCH_SIZE)
+    for code, name, day_of_week, start_time, end_time, room in slots:
+        yield code, name, DAY_NAMES[day_of_week], start_time.strftime('%H:%M'), end_time.strftime('%H:%M'), room or ''
+
+def ics_text(value):
+    return value.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+def ics_fold(line):
+    """Fold a content line at 75 octets as RFC 5545 requires"""
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line + '\r\n'
+    parts = []
+    while encoded:
+        limit = 75 if not parts else 74
+        # Never split a multi-byte character
+        while limit < len(encoded) and (encoded[limit] & 0xC0) == 0x80:
+            limit -= 1
+        parts.append(encoded[:limit].decode('utf-8'))
+        encoded = encoded[limit:]
+    return '\r\n '.join(parts) + '\r\n'
+
+def stream_timetable_ics(semester):
+    """The weekly timetable as recurring iCalendar events, with holidays excluded"""
+    holidays = [holiday.date for holiday in semester.holidays]
+    stamp = datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')
+    yield ''.join(ics_fold(line) for line in (
+        'BEGIN:VCALENDAR', 'VERSION:2.0', 'PRODID:-//Student Attendance Tracker//Timetable//EN',
+        'CALSCALE:GREGORIAN', f'X-WR-CALNAME:{ics_text(semester.name)}'
+    ))
+    slots = db.session.query(TimetableSlot, Subject.code, Subject.name).join(Subject).filter(
+        Subject.semester_id == semester.id
+    ).order_by(TimetableSlot.id).yield_per(EXPORT_FETCH_SIZE)
+    for slot, code, name in slots:
+        first = semester.start_date + timedelta(days=(slot.day_of_week - semester.start_date.weekday()) % 7)
+        if first > semester.end_date:
+            continue
+        lines = [
+            'BEGIN:VEVENT',
+            f'UID:slot-{slot.id}@attendance-tracker',
+            f'DTSTAMP:{stamp}',
+            f"DTSTART:{datetime.combine(first, slot.start_time).strftime('%Y%m%dT%H%M%S')}",
+            f"DTEND:{datetime.combine(first, slot.end_time).strftime('%Y%m%dT%H%M%S')}",
+            f"RRULE:FREQ=WEEKLY;UNTIL={semester.end_date.strftime('%Y%m%d')}T235959",
+            f'SUMMARY:{ics_text(name)} ({ics_text(code)})'
+        ]
+        excluded = [datetime.combine(day, slot.start_time).strftime('%Y%m%dT%H%M%S')
+                    for day in holidays if day.weekday() == slot.day_of_week]
+        if excluded:
+            lines.append('EXDATE:' + ','.join(excluded))
+        if slot.room:
+            lines.append(f'LOCATION:{ics_text(slot.room)}')
+        lines.append('END:VEVENT')
+        yield ''.join(ics_fold(line) for line in lines)
+    yield ics_fold('END:VCALENDAR')
+
+def parse_attended(value):
+    value = (value or '').strip().lower()
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    raise ValueError(f'attended must be one of yes/no, 1/0, present/absent, not {value!r}')
+
+def parse_day_of_week(value):
+    value = (value or '').strip()
+    if value.isdigit() and int(value) < 7:
+        return int(value)
+    for index, name in enumerate(DAY_NAMES):
+        if value.lower() in (name.lower(), name[:3].lower()):
+            return index
+    raise ValueError(f'unknown day {value!r}')
+
+def parse_clock(value):
+    return datetime.strptime((value or '').strip(), '%H:%M').time()
+
+class CsvImporter:
+    """Validate CSV rows and write them in batched transactions.
+
+    Rows are read one at a time, so files of any size are imported with
+    constant memory. Every ``batch_size`` valid rows are written and
+    committed together; invalid rows are skipped and reported by line
+    number. Subjects are matched by code within the semester, and created
+    when a row names a subject the semester doesn't have yet.
+    """
+
+    required = ()
+
+    def __init__(self, semester, batch_size=IMPORT_BATCH_SIZE, progress=None):
+        self.semester = semester
+        self.batch_size = batch_size
+        self.progress = progress
+        self.subjects = {subject.code.lower(): subject for subject in semester.subjects}
+        self.rows = 0
+        self.written = 0
+        self.error_count = 0
+        self.errors = []
+
+    def run(self, lines):
+        reader = csv.DictReader(lines)
+        missing = [field for field in self.required if field not in (reader.fieldnames or [])]
+        if missing:
+            raise ValueError(f"Missing column(s): {', '.join(missing)}")
+        batch = []
+        while True:
+            try:
+                row = next(reader)
+            except StopIteration:
+                break
+            except csv.Error as e:
+                # A malformed line (e.g. an oversized field) is skipped like an invalid row
+                self.rows += 1
+                self.error(reader.line_num, str(e))
+                continue
+            self.rows += 1
+            try:
+                batch.append(self.parse(row))
+            except (KeyError, ValueError, TypeError, AttributeError) as e:
+                self.error(reader.line_num, str(e))
+            if len(batch) >= self.batch_size:
+                self.flush(batch)
+                batch = []
+        self.flush(batch)
+        return self.result()
+
+    def error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < IMPORT_MAX_ERRORS:
+            self.errors.append((line, message))
+
+    def subject(self, row):
+        code = (row.get('subject_code') or '').strip()
+        if not code:
+            raise ValueError('subject_code is required')
+        subject = self.subjects.get(code.lower())
+        if subject is None:
+            subject = Subject(name=(row.get('subject_name') or '').strip() or code, code=code,
+                              semester_id=self.semester.id)
+            subject.stats = SubjectStats(attended=0, total=0)
+            db.session.add(subject)
+            db.session.flush()
+            self.subjects[code.lower()] = subject
+        return subject
+
+    def flush(self, batch):
+        if batch:
+            self.write(batch)
+            self.written += len(batch)
+        bump_data_version(self.semester.user_id)
+        db.session.commit()
+        if self.progress:
+            self.progress(self)
+
+    def result(self):
+        return {'rows': self.rows, 'written': self.written, 'errors': self.error_count,
+                'error_lines': self.errors}
+
+class AttendanceImporter(CsvImporter):
+    """Import attendance rows: subject_code, date, attended and optional lecture, notes"""
+
+    required = ('subject_code', 'date', 'attended')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.inserted = self.updated = 0
+
+    def parse(self, row):
+        value = (row.get('date') or '').strip()
+        try:
+            record_date = datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            raise ValueError(f'date must be YYYY-MM-DD, not {value!r}')
+        if not self.semester.start_date <= record_date <= self.semester.end_date:
+            raise ValueError(f'{record_date} is outside the semester')
+        lecture = int((row.get('lecture') or '0').strip())
+        if lecture < 0:
+            raise ValueError('lecture must not be negative')
+        attended = parse_attended(row.get('attended'))
+        return self.subject(row).id, record_date, lecture, attended, (row.get('notes') or '').strip()
+
+    def write(self, batch):
+        subjects = {subject.id: subject for subject in self.subjects.values()}
+        inserted, updated = upsert_attendance(subjects, batch)
+        self.inserted += inserted
+        self.updated += updated
+
+    def result(self):
+        return dict(super().result(), inserted=self.inserted, updated=self.updated)
+
+class TimetableImporter(CsvImporter):
+    """Import timetable rows: subject_code, day_of_week, start_time, end_time and optional room"""
+
+    required = ('subject_code', 'day_of_week', 'start_time', 'end_time')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Slots already on the timetable are skipped rather than duplicated
+        self.existing = set(db.session.query(
+            TimetableSlot.subject_id, TimetableSlot.day_of_week, TimetableSlot.start_time
+        ).join(Subject).filter(Subject.semester_id == self.semester.id))
+        self.duplicates = 0
+
+    def parse(self, row):
+        start_time, end_time = parse_clock(row.get('start_time')), parse_clock(row.get('end_time'))
+        if end_time <= start_time:
+            raise ValueError('end_time must be after start_time')
+        day_of_week = parse_day_of_week(row.get('day_of_week'))
+        return {'subject_id': self.subject(row).id, 'day_of_week': day_of_week,
+                'start_time': start_time, 'end_time': end_time, 'room': (row.get('room') or '').strip()}
+
+    def write(self, batch):
+        rows = []
+        for slot in batch:
+            key = (slot['subject_id'], slot['day_of_week'], slot['start_time'])
+            if key in self.existing:
+                self.duplicates += 1
+            else:
+                self.existing.add(key)
+                rows.append(slot)
+        if rows:
+            table = TimetableSlot.__table__
+            for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+                db.session.execute(table.insert(), rows[start:start + UPSERT_CHUNK_SIZE])
+            bump_schedule_version(self.semester.id)
+
+    def result(self):
+        return dict(super().result(), inserted=self.written - self.duplicates, updated=0, skipped=self.duplicates)
+
+IMPORTERS = {'attendance': AttendanceImporter, 'timetable': TimetableImporter}
+
+@bp.cli.command('import-csv')
+@click.argument('kind', type=click.Choice(sorted(IMPORTERS)))
+@click.argument('path', type=click.File('r', encoding='utf-8-sig'))
+@click.option('--semester', 'semester_id', type=int, required=True, help='Semester to import into.')
+@click.option('--batch-size', type=int, default=IMPORT_BATCH_SIZE, show_default=True, help='Rows per transaction.')
+def import_csv_command(kind, path, semester_id, batch_size):
+    """Import attendance or timetable rows from a CSV file into a semester."""
+    semester = db.session.get(Semester, semester_id)
+    if semester is None:
+        raise click.ClickException(f'No semester {semester_id}')
+    started = time.perf_counter()
+
+    def report(importer):
+        click.echo(f'{importer.rows} rows read, {importer.written} written, {importer.error_count} error(s) '
+                   f'[{time.perf_counter() - started:.1f}s]')
+
+    try:
+        result = IMPORTERS[kind](semester, batch_size, report).run(path)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    for line, message in result['error_lines']:
+        click.echo(f'line {line}: {message}', err=True)
+    click.echo(f"Imported {result['inserted']} new and {result['updated']} updated row(s); {result['errors']} rejected.")
+
+# Sync API
+SYNC_FIELDS = {
+    'semesters': ['id', 'name', 'start_date', 'end_date', 'is_active'],
+    'subjects': ['id', 'semester_id', 'name', 'code', 'credits', 'total_lectures'],
+    'slots': ['id', 'subject_id', 'day_of_week', 'start_time', 'end_time', 'room'],
+    'records': ['id', 'subject_id', 'date', 'lecture', 'attended', 'notes', 'version'],
+    'deleted': ['kind', 'id']
+}
+
+def sync_version(timestamp):
+    """A change time as integer microseconds, the form clients store and send back"""
+    return (timestamp - datetime(1970, 1, 1)) // timedelta(microseconds=1)
+
+def sync_timestamp(version):
+    return datetime(1970, 1, 1) + timedelta(microseconds=int(version))
+
+def encode_sync_cursor(key):
+    """Keyset cursor pointing just past a change, ordered by (change time, kind, id)"""
+    timestamp, kind, row_id = key
+    return f'{sync_version(timestamp)}:{kind}:{row_id}'
+
+def decode_sync_cursor(cursor):
+    """Inverse of encode_sync_cursor; raises ValueError for anything it could not have produced"""
+    version, kind, row_id = cursor.split(':')
+    try:
+        timestamp = sync_timestamp(version)
+    except OverflowError:
+        raise ValueError(f'cursor version out of range: {version}')
+    return timestamp, int(kind), int(row_id)
+
+def sync_row(kind, row):
+    """Serialize a row as a list in SYNC_FIELDS order"""
+    if kind == 'semesters':
+        return [row.id, row.name, row.start_date.isoformat(), row.end_date.isoformat(), bool(row.is_active)]
+    if kind == 'subjects':
+        return [row.id, row.semester_id, row.name, row.code, row.credits, row.total_lectures]
+    if kind == 'slots':
+        return [row.id, row.subject_id, row.day_of_week, row.start_time.strftime('%H:%M'),
+                row.end_time.strftime('%H:%M'), row.room]
+    if kind == 'records':
+        return [row.id, row.subject_id, row.date.isoformat(), row.lecture, row.attended, row.notes or '',
+                sync_version(row.updated_at)]
+    return [row.kind, row.object_id]
+
+def sync_sources(user_id):
+    """(kind, query, change time column, id column) for every synced kind, in cursor order"""
+    semester_ids = db.session.query(Semester.id).filter(Semester.user_id == user_id)
+    subject_ids = db.session.query(Subject.id).filter(Subject.semester_id.in_(semester_ids))
+    return [
+        ('semesters', Semester.query.filter(Semester.user_id == user_id), Semester.updated_at, Semester.id),
+        ('subjects', Subject.query.filter(Subject.semester_id.in_(semester_ids)), Subject.updated_at, Subject.id),
+        ('slots', TimetableSlot.query.filter(TimetableSlot.subject_id.in_(subject_ids)),
+         TimetableSlot.updated_at, TimetableSlot.id),
+        ('records', AttendanceRecord.query.filter(AttendanceRecord.subject_id.in_(subject_ids)),
+         AttendanceRecord.updated_at, AttendanceRecord.id),
+        ('deleted', SyncTombstone.query.filter(SyncTombstone.user_id == user_id),
+         SyncTombstone.deleted_at, SyncTombstone.id)
+    ]
+
+def pull_changes(user_id, cursor=None, limit=SYNC_PAGE_SIZE):
+    """One page of a user's changes after ``cursor`` (everything when it is None).
+
+    Each kind is read with its own keyset query and the results are merged
+    by (change time, kind, id), so a page never splits rows that share a
+    timestamp, such as a bulk import. Rows stamped in the last
+    SYNC_SETTLE_SECONDS are held back: a slower transaction may still commit
+    an earlier stamp, which a cursor already past it would never see. A
+    cursor older than the tombstone retention can no longer see every
+    deletion, so the client is told to reset and gets a full snapshot
+    instead. Returns a dict of the rows per kind, the next cursor, whether
+    more pages follow and the reset flag.
+    """
+    now = datetime.utcnow()
+    settled = now - timedelta(seconds=SYNC_SETTLE_SECONDS)
+    reset = False
+    if cursor is not None and cursor[0] < now - timedelta(days=SYNC_TOMBSTONE_DAYS):
+        cursor, reset = None, True
+
+    changes = []
+    for rank, (kind, query, changed, row_id) in enumerate(sync_sources(user_id)):
+        if cursor is None:
+            if kind == 'deleted':
+                # A full snapshot has nothing to delete
+                continue
+        else:
+            timestamp, cursor_rank, cursor_id = cursor
+            if rank > cursor_rank:
+                query = query.filter(changed >= timestamp)
+            elif rank == cursor_rank:
+                query = query.filter(db.or_(changed > timestamp, db.and_(changed == timestamp, row_id > cursor_id)))
+            else:
+                query = query.filter(changed > timestamp)
+        query = query.filter(changed <= settled)
+        # Any row of the merged page is within the first limit rows of its kind
+        for row in query.order_by(changed, row_id).limit(limit + 1):
+            changes.append(((getattr(row, changed.key), rank, row.id), kind, row))
+
+    changes.sort(key=lambda change: change[0])
+    page = changes[:limit]
+    rows = OrderedDict()
+    for _, kind, row in page:
+        rows.setdefault(kind, []).append(sync_row(kind, row))
+    return {
+        'rows': rows,
+        'cursor': page[-1][0] if page else cursor,
+        'more': len(changes) > limit,
+        'reset': reset
+    }
+
+def record_deletions(user_id, kind, object_ids):
+    """Leave tombstones for deleted rows so sync clients remove them too"""
+    db.session.add_all(SyncTombstone(user_id=user_id, kind=kind, object_id=object_id) for object_id in object_ids)
+
+def push_changes(user_id, changes, client_wins=False):
+    """Apply offline attendance edits, resolving conflicts record by record.
+
+    Each change names a lecture by ``subject_id``, ``date`` and ``lecture``
+    and carries the ``base`` version the client last saw (null for a
+    record created offline). A change applies when the server copy is
+    still at that version. Otherwise the server copy is returned as a
+    conflict, unless ``client_wins`` is set, and the rest of the batch
+    goes ahead. Returns ``(applied, conflicts, errors)``; applied keys map
+    the index of each change to its key.
+    """
+    parsed = {}
+    errors = []
+    for index, change in enumerate(changes):
+        try:
+            if not isinstance(change, dict):
+                raise TypeError('change must be an object')
+            lecture = int(change.get('lecture', 0))
+            if lecture < 0:
+                raise ValueError('lecture must not be negative')
+            deleted = change.get('deleted', False)
+            if not isinstance(deleted, bool):
+                raise TypeError('deleted must be true or false')
+            if not deleted and not isinstance(change['attended'], bool):
+                raise TypeError('attended must be true or false')
+            base = change.get('base')
+            parsed[index] = {
+                'key': (int(change['subject_id']), datetime.strptime(change['date'], '%Y-%m-%d').date(), lecture),
+                'deleted': deleted,
+                'attended': bool(change.get('attended')),
+                'notes': str(change.get('notes') or ''),
+                'base': None if base is None else int(base)
+            }
+        except (TypeError, KeyError, ValueError) as e:
+            errors.append({'index': index, 'error': f'Invalid change: {e}'})
+
+    subjects = {subject.id: subject for subject in Subject.query.join(Semester).filter(
+        Subject.id.in_({change['key'][0] for change in parsed.values()}),
+        Semester.user_id == user_id
+    )}
+    for index in [index for index, change in parsed.items() if change['key'][0] not in subjects]:
+        errors.append({'index': index, 'error': f"Unknown subject {parsed.pop(index)['key'][0]}"})
+    if not parsed:
+        return {}, [], errors
+    lock_counters(subjects.values())
+    restore_archived_subjects(subjects.values())
+
+    dates = [change['key'][1] for change in parsed.values()]
+    server = {
+        (record.subject_id, record.date, record.lecture): record
+        for record in AttendanceRecord.query.filter(
+            AttendanceRecord.subject_id.in_({change['key'][0] for change in parsed.values()}),
+            AttendanceRecord.date.between(min(dates), max(dates))
+        )
+    }
+
+    # Only the last change to a lecture in a batch counts
+    latest = {change['key']: index for index, change in parsed.items()}
+    applied, conflicts, upserts, deletes = {}, [], [], []
+    for index, change in parsed.items():
+        key = change['key']
+        record = server.get(key)
+        if latest[key] != index:
+            applied[index] = key
+            continue
+        if change['deleted']:
+            in_sync = record is None
+        else:
+            in_sync = record is not None and (record.attended, record.notes or '') == (change['attended'], change['notes'])
+        current = None if record is None else sync_version(record.updated_at)
+        if not in_sync and current != change['base'] and not client_wins:
+            conflicts.append({'index': index, 'server': None if record is None else sync_row('records', record)})
+            continue
+        applied[index] = key
+        if in_sync:
+            continue
+        if change['deleted']:
+            deletes.append(record)
+        else:
+            upserts.append((key[0], key[1], key[2], change['attended'], change['notes']))
+
+    if upserts:
+        upsert_attendance(subjects, upserts)
+    if deletes:
+        deltas = defaultdict(lambda: [0, 0])
+        for record in deletes:
+            deltas[subjects[record.subject_id]][0] -= int(record.attended)
+            deltas[subjects[record.subject_id]][1] -= 1
+        apply_stats_deltas(deltas)
+        for record in deletes:
+            db.session.delete(record)
+        record_deletions(user_id, 'records', [record.id for record in deletes])
+    errors.sort(key=lambda error: error['index'])
+    return applied, conflicts, errors
+
+def sync_response(payload):
+    """Compact JSON, gzip-compressed when the client accepts it and it pays off"""
+    body = json.dumps(dict(payload, v=SYNC_API_VERSION), separators=(',', ':')).encode()
+    response = current_app.response_class(body, mimetype='application/json')
+    response.vary.add('Accept-Encoding')
+    if len(body) >= SYNC_GZIP_MIN_BYTES and 'gzip' in request.accept_encodings:
+        response.set_data(gzip.compress(body))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+def sync_request_json():
+    """The request's JSON body, which may be sent gzip-compressed"""
+    if request.headers.get('Content-Encoding', '').lower() == 'gzip':
+        with gzip.GzipFile(fileobj=io.BytesIO(request.get_data())) as body:
+            data = body.read(SYNC_MAX_BODY + 1)
+        if len(data) > SYNC_MAX_BODY:
+            raise ValueError('Request body too large')
+        return json.loads(data)
+    return request.get_json(silent=True)
+
+@bp.cli.command('prune-tombstones')
+def prune_tombstones_command():
+    """Delete sync tombstones older than the retention period."""
+    horizon = datetime.utcnow() - timedelta(days=SYNC_TOMBSTONE_DAYS)
+    removed = SyncTombstone.query.filter(SyncTombstone.deleted_at < horizon).delete(synchronize_session=False)
+    db.session.commit()
+    click.echo(f'Removed {removed} tombstone(s) older than {SYNC_TOMBSTONE_DAYS} days.')
+
+# Cohort Analytics
+SNAPSHOT_MODELS = (SubjectCodeSnapshot, SemesterSnapshot, AtRiskSnapshot)
+
+def admin_required(view):
+    """Restrict a view to users with the admin flag"""
+    @wraps(view)
+    @login_required
+    def wrapper(*args, **kwargs):
+        if not current_user.is_admin:
+            abort(403)
+        return view(*args, **kwargs)
+    return wrapper
+
+def user_id_batches(batch_size):
+    """All user ids in ascending batches, read with keyset pagination"""
+    last_id = 0
+    while True:
+        user_ids = [user_id for user_id, in db.session.query(User.id).filter(User.id > last_id).order_by(User.id).limit(batch_size)]
+        if not user_ids:
+            return
+        yield user_ids
+        last_id = user_ids[-1]
+
+def histogram_percentile(buckets, count, fraction):
+    """Percentile from per-1% student counts (bucket 100 is exactly 100%)"""
+    rank = max(math.ceil(fraction * count), 1)
+    seen = 0
+    for bucket, students in enumerate(buckets):
+        seen += students
+        if seen >= rank:
+            return float(bucket)
+    return 100.0
+
+def project_at_risk(semester_ids, threshold, as_of):
+    """Forecast the subjects below ``threshold`` in the given semesters.
+
+    Building each semester's occurrence index is the expensive part of a
+    snapshot, so batches of semesters are sent to worker processes.
+    """
+    rows = []
+    for semester, username in db.session.query(Semester, User.username).join(User).filter(Semester.id.in_(semester_ids)):
+        subject_data, _ = get_semester_attendance(semester.id, threshold)
+        at_risk = [info for info in subject_data if info['total_lectures'] and info['attendance_percentage'] < threshold]
+        if not at_risk:
+            continue
+        projections = get_semester_projection(semester, at_risk, as_of, threshold)
+        for info in at_risk:
+            subject = info['subject']
+            projection = projections[subject.id]
+            rows.append({
+                'user_id': semester.user_id, 'username': username,
+                'semester_id': semester.id, 'semester_name': semester.name,
+                'subject_id': subject.id, 'subject_code': subject.code, 'subject_name': subject.name,
+                'attended': info['attended_lectures'], 'total': info['total_lectures'],
+                'percentage': info['attendance_percentage'],
+                'remaining_lectures': projection['remaining_lectures'],
+                'max_percentage': projection['max_percentage'],
+                'target_reachable': projection['target_reachable']
+            })
+    return rows
+
+_worker_app = None
+
+def init_analytics_worker(config):
+    """Give a worker process its own app, engine and application context"""
+    global _worker_app
+    _worker_app = create_app(config)
+    _worker_app.app_context().push()
+
+def project_at_risk_task(semester_ids, threshold, as_of):
+    try:
+        return project_at_risk(semester_ids, threshold, as_of)
+    finally:
+        db.session.remove()
+
+def compute_cohort_snapshot(threshold=75, workers=0, batch_size=ANALYTICS_BATCH_SIZE, progress=None):
+    """Compute every admin snapshot table in a new AnalyticsRun and return it.
+
+    Users are read in batches. For each batch, subject-code distributions
+    and semester totals are grouped in SQL from the attendance counters,
+    so attendance records are never scanned and memory does not grow with
+    the number of users; the per-batch groups are added together in
+    Python. The active semesters with subjects below ``threshold`` are
+    forecast in ``workers`` processes (in this process when 0) and their
+    rows written as the results arrive. The run becomes visible to the
+    dashboards only once it is complete; older runs are removed.
+    """
+    run = AnalyticsRun(threshold=threshold)
+    db.session.add(run)
+    db.session.commit()
+    as_of = date.today()
+
+    # Whole-percent band of each subject, for the percentiles
+    percentage = SubjectStats.attended * 100 // SubjectStats.total
+    below = db.func.sum(db.case((SubjectStats.attended * 100.0 < threshold * SubjectStats.total, 1), else_=0))
+    codes = defaultdict(lambda: {'buckets': [0] * 101, 'attended': 0, 'total': 0, 'below': 0})
+    semesters = defaultdict(lambda: {'students': 0, 'subjects': 0, 'attended': 0, 'total': 0, 'below': 0})
+    at_risk_table = AtRiskSnapshot.__table__
+
+    executor = None
+    if workers:
+        # Spawned workers start clean instead of inheriting this process's connections
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        executor = ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+            initializer=init_analytics_worker,
+            initargs=({'SQLALCHEMY_DATABASE_URI': current_app.config['SQLALCHEMY_DATABASE_URI']},)
+        )
+    pending = []
+
+    def write_at_risk(rows):
+        for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+            db.session.execute(at_risk_table.insert(), [dict(row, run_id=run.id) for row in rows[start:start + UPSERT_CHUNK_SIZE]])
+        db.session.commit()
+
+    def drain(limit):
+        while len(pending) > limit:
+            write_at_risk(pending.pop(0).result())
+
+    try:
+        for user_ids in user_id_batches(batch_size):
+            base = db.session.query(SubjectStats).join(Subject, Subject.id == SubjectStats.subject_id).join(Semester).filter(
+                Semester.user_id.in_(user_ids), SubjectStats.total > 0
+            )
+            for name, code, bucket, students, attended, total, below_threshold in base.with_entities(
+                Semester.name, Subject.code, percentage, db.func.count(), db.func.sum(SubjectStats.attended),
+                db.func.sum(SubjectStats.total), below
+            ).group_by(Semester.name, Subject.code, percentage):
+                group = codes[(name, code)]
+                group['buckets'][min(int(bucket), 100)] += students
+                group['attended'] += int(attended)
+                group['total'] += int(total)
+                group['below'] += int(below_threshold)
+            for name, students, subjects, attended, total, below_threshold in base.with_entities(
+                Semester.name, db.func.count(db.distinct(Semester.user_id)), db.func.count(), db.func.sum(SubjectStats.attended),
+                db.func.sum(SubjectStats.total), below
+            ).group_by(Semester.name):
+                group = semesters[name]
+                group['students'] += students
+                group['subjects'] += subjects
+                group['attended'] += int(attended)
+                group['total'] += int(total)
+                group['below'] += int(below_threshold)
+
+            semester_ids = [semester_id for semester_id, in base.with_entities(Semester.id).filter(
+                Semester.is_active == True, SubjectStats.attended * 100.0 < threshold * SubjectStats.total
+            ).distinct()]
+            if semester_ids and executor:
+                pending.append(executor.submit(project_at_risk_task, semester_ids, threshold, as_of))
+                # Keep a bounded number of batches in flight
+                drain(workers * 2)
+            elif semester_ids:
+                write_at_risk(project_at_risk(semester_ids, threshold, as_of))
+            run.users += len(user_ids)
+            db.session.commit()
+            if progress:
+                progress(run)
+        drain(0)
+
+        code_rows = []
+        for (name, code), group in sorted(codes.items()):
+            count = sum(group['buckets'])
+            histogram = [sum(group['buckets'][band * 10:band * 10 + 10]) for band in range(10)]
+            histogram[9] += group['buckets'][100]
+            code_rows.append(dict(
+                run_id=run.id, semester_name=name, subject_code=code, students=count,
+                attended=group['attended'], total=group['total'], below_threshold=group['below'],
+                histogram=json.dumps(histogram),
+                **{field: histogram_percentile(group['buckets'], count, fraction) for field, fraction in
+                   (('p10', 0.1), ('p25', 0.25), ('median', 0.5), ('p75', 0.75), ('p90', 0.9))}
+            ))
+        semester_rows = [dict(run_id=run.id, semester_name=name, students=group['students'], subjects=group['subjects'],
+                              attended=group['attended'], total=group['total'], below_threshold=group['below'])
+                         for name, group in sorted(semesters.items())]
+        for model, rows in ((SubjectCodeSnapshot, code_rows), (SemesterSnapshot, semester_rows)):
+            for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+                db.session.execute(model.__table__.insert(), rows[start:start + UPSERT_CHUNK_SIZE])
+
+        run.status = 'complete'
+        run.finished_at = datetime.utcnow()
+        db.session.commit()
+    except BaseException:
+        db.session.rollback()
+        run.status = 'failed'
+        run.finished_at = datetime.utcnow()
+        db.session.commit()
+        raise
+    finally:
+        if executor:
+            for future in pending:
+                future.cancel()
+            executor.shutdown()
+
+    prune_analytics_runs()
+    return run
+
+def prune_analytics_runs(keep=ANALYTICS_KEEP_RUNS):
+    """Delete all but the newest ``keep`` runs and their snapshot rows"""
+    old = [run_id for run_id, in db.session.query(AnalyticsRun.id).order_by(AnalyticsRun.id.desc()).offset(keep)]
+    if old:
+        for model in SNAPSHOT_MODELS:
+            model.query.filter(model.run_id.in_(old)).delete(synchronize_session=False)
+        AnalyticsRun.query.filter(AnalyticsRun.id.in_(old)).delete(synchronize_session=False)
+        db.session.commit()
+
+def latest_analytics_run():
+    return AnalyticsRun.query.filter_by(status='complete').order_by(AnalyticsRun.id.desc()).first()
+
+@bp.cli.command('analytics-snapshot')
+@click.option('--threshold', type=float, default=75, show_default=True, help='Attendance percentage counted as at risk.')
+@click.option('--workers', type=int, default=os.cpu_count() or 1, show_default=True,
+              help='Processes for the forecasts (0 to run them in this process).')
+@click.option('--batch-size', type=int, default=ANALYTICS_BATCH_SIZE, show_default=True, help='Users per batch.')
+def analytics_snapshot_command(threshold, workers, batch_size):
+    """Recompute the admin cohort analytics snapshots."""
+    started = time.perf_counter()
+    run = compute_cohort_snapshot(threshold, workers, batch_size,
+                                  lambda run: click.echo(f'{run.users} users [{time.perf_counter() - started:.1f}s]'))
+    click.echo(f'Snapshot {run.id} complete: {run.users} users in {time.perf_counter() - started:.1f}s.')
+
+@bp.cli.command('set-admin')
+@click.argument('username')
+@click.option('--revoke', is_flag=True, help='Remove admin access instead of granting it.')
+def set_admin_command(username, revoke):
+    """Grant (or revoke) access to the admin analytics pages."""
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        raise click.ClickException(f'No user {username}')
+    user.is_admin = not revoke
+    db.session.commit()
+    click.echo(f"{username} is {'no longer' if revoke else 'now'} an admin.")
+
+# Background Jobs
+JOB_HANDLERS = {}
+# Kinds any user may queue through the API; the rest are queued by the app itself or by admins
+USER_JOB_KINDS = {'export_attendance', 'attendance_report'}
+ADMIN_JOB_KINDS = {'analytics_snapshot'}
+
+def job_handler(kind):
+    """Register ``handler(job, params)`` to run jobs of ``kind``; it returns a JSON-able summary"""
+    def register(handler):
+        JOB_HANDLERS[kind] = handler
+        return handler
+    return register
+
+def enqueue_job(kind, user_id=None, params=None):
+    """Queue a job; the caller commits"""
+    job = Job(kind=kind, user_id=user_id, params=json.dumps(params or {}))
+    db.session.add(job)
+    db.session.flush()
+    return job
+
+def job_artifact(job, name, mimetype):
+    """Path a handler should write its output to, recorded as the job's download"""
+    directory = current_app.config['JOB_ARTIFACT_DIR']
+    os.makedirs(directory, exist_ok=True)
+    job.artifact = f'job-{job.id}{os.path.splitext(name)[1]}'
+    job.artifact_name = name
+    job.mimetype = mimetype
+    return os.path.join(directory, job.artifact)
+
+def job_status(job):
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'result': json.loads(job.result) if job.result else None,
+        'error': job.error,
+        'download_url': url_for('main.download_job', job_id=job.id) if job.status == 'done' and job.artifact else None,
+        'created_at': job.created_at.isoformat(),
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'expires_at': job.expires_at.isoformat() if job.expires_at else None
+    }
+
+def run_next_job(worker_name):
+    """Claim the oldest queued job and run it. Returns False when the queue is empty.
+
+    Claiming is a conditional UPDATE on the job's status, so any number of
+    threads and processes can share the queue without a broker: at most
+    one of them changes a given row from queued to running.
+    """
+    candidate = db.session.query(Job.id).filter_by(status='queued').order_by(Job.id).first()
+    if candidate is None:
+        return False
+    claimed = Job.query.filter_by(id=candidate.id, status='queued').update(
+        {'status': 'running', 'worker': worker_name, 'started_at': datetime.utcnow()}, synchronize_session=False
+    )
+    db.session.commit()
+    if not claimed:
+        return True
+
+    job = db.session.get(Job, candidate.id)
+    try:
+        handler = JOB_HANDLERS.get(job.kind)
+        if handler is None:
+            raise ValueError(f'Unknown job kind {job.kind!r}')
+        result = handler(job, json.loads(job.params))
+        job.status = 'done'
+        job.result = json.dumps(result or {})
+    except Exception as e:
+        logger.exception('Job %d (%s) failed', candidate.id, job.kind)
+        db.session.rollback()
+        job = db.session.get(Job, candidate.id)
+        job.status = 'failed'
+        job.error = str(e) or e.__class__.__name__
+    job.finished_at = datetime.utcnow()
+    job.expires_at = job.finished_at + timedelta(hours=current_app.config['JOB_ARTIFACT_TTL_HOURS'])
+    db.session.commit()
+    return True
+
+def requeue_jobs(worker_names):
+    """Put jobs still running under these worker names back in the queue; the caller commits"""
+    return Job.query.filter(Job.status == 'running', Job.worker.in_(worker_names)).update(
+        {'status': 'queued', 'worker': None, 'started_at': None}, synchronize_session=False
+    )
+
+def cleanup_jobs():
+    """Delete expired jobs with their artifacts and fail jobs whose worker went away.
+
+    Returns ``(expired, timed_out)`` counts.
+    """
+    now = datetime.utcnow()
+    timed_out = Job.query.filter(
+        Job.status == 'running', Job.started_at < now - timedelta(hours=JOB_TIMEOUT_HOURS)
+    ).update({'status': 'failed', 'error': 'Timed out', 'finished_at': now,
+              'expires_at': now + timedelta(hours=current_app.config['JOB_ARTIFACT_TTL_HOURS'])},
+             synchronize_session=False)
+    expired = Job.query.filter(Job.expires_at < now).all()
+    for job in expired:
+        if job.artifact:
+            try:
+                os.remove(os.path.join(current_app.config['JOB_ARTIFACT_DIR'], job.artifact))
+            except FileNotFoundError:
+                pass
+        db.session.delete(job)
+    db.session.commit()
+    return len(expired), timed_out
+
+class JobWorker:
+    """Threads that run queued jobs, inside the web process or from `flask run-jobs`"""
+
+    def __init__(self, app, threads=1, poll_interval=JOB_POLL_SECONDS):
+        self.app = app
+        self.threads = threads
+        self.poll_interval = poll_interval
+        self.pid = None
+        self.names = []
+        self._stop = threading.Event()
+        self._threads = []
+        self._last_cleanup = 0.0
+        self._lock = threading.Lock()
+
+    def start(self):
+        self.pid = os.getpid()
+        for index in range(self.threads):
+            name = f'{socket.gethostname()}:{self.pid}:{index}'
+            thread = threading.Thread(target=self._loop, args=(name,), name=f'job-worker-{index}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+            self.names.append(name)
+
+    def stop(self, timeout=None):
+        """Stop polling and wait up to ``timeout`` seconds in total for running jobs.
+
+        Jobs still running after that are requeued, since the threads die
+        with the process, and another worker starts them over. Returns how
+        many were requeued.
+        """
+        self._stop.set()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(None if deadline is None else max(0, deadline - time.monotonic()))
+        if not any(thread.is_alive() for thread in self._threads):
+            return 0
+        with self.app.app_context():
+            requeued = requeue_jobs(self.names)
+            db.session.commit()
+            db.session.remove()
+        if requeued:
+            logger.warning('Requeued %d job(s) left running by %s', requeued, ', '.join(self.names))
+        return requeued
+
+    def _loop(self, name):
+        while not self._stop.is_set():
+            ran = False
+            try:
+                with self.app.app_context():
+                    self._maybe_cleanup()
+                    ran = run_next_job(name)
+                    db.session.remove()
+            except Exception:
+                logger.exception('Job worker %s failed to poll the queue', name)
+            if not ran:
+                self._stop.wait(self.poll_interval)
+
+    def _maybe_cleanup(self):
+        with self._lock:
+            if time.monotonic() - self._last_cleanup < JOB_CLEANUP_SECONDS:
+                return
+            self._last_cleanup = time.monotonic()
+        cleanup_jobs()
+
+def init_job_worker(app):
+    """Start an embedded worker in each process on its first request.
+
+    Starting lazily rather than in create_app() means threads are created
+    after gunicorn forks its workers, not in the master where they would
+    be lost. The worker is kept in ``app.extensions['job_worker']`` so the
+    gunicorn ``worker_exit`` hook can stop it when the process is recycled.
+    """
+    state = {'pid': None}
+    lock = threading.Lock()
+
+    @app.before_request
+    def start_job_worker():
+        if state['pid'] == os.getpid():
+            return
+        with lock:
+            if state['pid'] != os.getpid():
+                worker = JobWorker(app, app.config['JOB_WORKERS'])
+                worker.start()
+                app.extensions['job_worker'] = worker
+                state['pid'] = os.getpid()
+
+@job_handler('export_attendance')
+def export_attendance_job(job, params):
+    """Every attendance record of the user (or of one semester) as a CSV download"""
+    semesters = Semester.query.filter_by(user_id=job.user_id)
+    if params.get('semester_id'):
+        semesters = semesters.filter_by(id=params['semester_id'])
+    semester_ids = [semester.id for semester in semesters]
+    rows = [0]
+
+    def counted(source):
+        for row in source:
+            rows[0] += 1
+            yield row
+
+    with open(job_artifact(job, 'attendance.csv', 'text/csv'), 'w', newline='', encoding='utf-8') as f:
+        for chunk in stream_csv(ATTENDANCE_CSV_FIELDS, counted(export_attendance_rows(semester_ids))):
+            f.write(chunk)
+    return {'rows': rows[0], 'semesters': len(semester_ids)}
+
+@job_handler('attendance_report')
+def attendance_report_job(job, params):
+    """Attendance report of every semester, with forecasts, as CSV"""
+    target = float(params.get('target', 75))
+    path = job_artifact(job, 'attendance-report.csv', 'text/csv')
+    subjects = 0
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['semester', 'subject_code', 'subject_name', 'attended', 'total', 'percentage',
+                         'lectures_to_attend', 'lectures_can_miss', 'remaining_lectures', 'max_skippable', 'projected_percentage'])
+        for semester in Semester.query.filter_by(user_id=job.user_id).order_by(Semester.start_date):
+            subject_data, aggregate = get_semester_attendance(semester.id, target)
+            projections = get_semester_projection(semester, subject_data, None, target)
+            for info in subject_data:
+                projection = projections[info['subject'].id]
+                writer.writerow([
+                    semester.name, info['subject'].code, info['subject'].name, info['attended_lectures'],
+                    info['total_lectures'], info['attendance_percentage'],
+                    info['guidance']['lectures_to_attend'], info['guidance']['lectures_can_miss'],
+                    projection['remaining_lectures'], projection['max_skippable'], projection['projected_percentage']
+                ])
+                subjects += 1
+            writer.writerow([semester.name, '', 'All subjects', '', '', aggregate, '', '', '', '', ''])
+    return {'subjects': subjects}
+
+@job_handler('import_csv')
+def import_csv_job(job, params):
+    """Run a CSV import uploaded through the Import & Export page"""
+    upload = os.path.join(current_app.config['JOB_ARTIFACT_DIR'], params['upload'])
+    try:
+        semester = Semester.query.filter_by(id=params['semester_id'], user_id=job.user_id).first()
+        if semester is None:
+            raise ValueError('The semester no longer exists')
+        with open(upload, encoding='utf-8-sig', newline='') as lines:
+            result = IMPORTERS[params['kind']](semester).run(lines)
+    finally:
+        os.remove(upload)
+    result['semester'] = semester.name
+    return result
+
+@job_handler('analytics_snapshot')
+def analytics_snapshot_job(job, params):
+    run = compute_cohort_snapshot(float(params.get('threshold', 75)), int(params.get('workers', 0)))
+    return {'run_id': run.id, 'users': run.users}
+
+@bp.cli.command('run-jobs')
+@click.option('--threads', type=int, default=2, show_default=True, help='Jobs run at the same time.')
+def run_jobs_command(threads):
+    """Run background jobs until interrupted (use with JOB_WORKERS=0 on the web servers)."""
+    worker = JobWorker(current_app._get_current_object(), threads)
+    worker.start()
+    click.echo(f'Running jobs with {threads} thread(s); press Ctrl+C to stop.')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        click.echo('Waiting for running jobs to finish...')
+        worker.stop()
+
+@bp.cli.command('cleanup-jobs')
+def cleanup_jobs_command():
+    """Delete expired job artifacts and fail jobs stuck in running."""
+    expired, timed_out = cleanup_jobs()
+    click.echo(f'Removed {expired} expired job(s); {timed_out} timed out.')
+
+# Request Context
+_user_cache = OrderedDict()
+_user_cache_lock = threading.Lock()
+# Session key recording when this browser last changed data, so no worker serves it an older snapshot
+USER_CACHE_STAMP = '_user_stamp'
+
+def detached_copy(instance):
+    """Column values of a loaded row as a detached instance, safe to share between requests"""
+    copy = type(instance)(**{attr.key: getattr(instance, attr.key) for attr in inspect(instance).mapper.column_attrs})
+    make_transient_to_detached(copy)
+    return copy
+
+def load_user_context(user_id):
+    """The user and their active semester, loaded together once per request.
+
+    Both rows come from one joined query, and detached copies are kept for
+    USER_CACHE_SECONDS so further requests need no query at all; cached
+    copies are merged into the request's session without loading. Returns
+    None for unknown users.
+    """
+    ttl = current_app.config['USER_CACHE_SECONDS']
+    with _user_cache_lock:
+        cached = _user_cache.get(user_id) if ttl else None
+    if cached is not None:
+        expires, loaded_at, user, semester = cached
+        if expires > time.monotonic() and loaded_at >= session.get(USER_CACHE_STAMP, 0):
+            g.user_from_cache = True
+            g.active_semester = db.session.merge(semester, load=False) if semester is not None else None
+            return db.session.merge(user, load=False)
 
-class TimetableSlot(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    subject_id = db.Column(db.Integer, db.ForeignKey('subject.id'), nullable=False)
-    day_of_week = db.Column(db.Integer, nullable=False)  # 0=Monday, 6=Sunday
-    start_time = db.Column(db.Time, nullable=False)
-    end_time = db.Column(db.Time, nullable=False)
-    room = db.Column(db.String(50))
+    row = db.session.query(User, Semester).outerjoin(
+        Semester, db.and_(Semester.user_id == User.id, Semester.is_active == True)
+    ).filter(User.id == user_id).order_by(Semester.id).first()
+    if row is None:
+        return None
+    user, semester = row
+    g.active_semester = semester
+    if ttl:
+        entry = (time.monotonic() + ttl, time.time(), detached_copy(user),
+                 detached_copy(semester) if semester is not None else None)
+        with _user_cache_lock:
+            _user_cache[user_id] = entry
+            _user_cache.move_to_end(user_id)
+            while len(_user_cache) > USER_CACHE_SIZE:
+                _user_cache.popitem(last=False)
+    return user
 
-class AttendanceRecord(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    subject_id = db.Column(db.Integer, db.ForeignKey('subject.id'), nullable=False)
-    date = db.Column(db.Date, nullable=False)
-    attended = db.Column(db.Boolean, nullable=False)
-    notes = db.Column(db.Text)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+def current_data_version():
+    """The current user's data version, re-read when the user came from the per-process cache.
 
-# Helper Functions
-def calculate_attendance_percentage(subject_id):
-    """Calculate attendance percentage for a subject"""
-    records = AttendanceRecord.query.filter_by(subject_id=subject_id).all()
-    if not records:
-        return 0.0
+    Writes through another worker bump the version without touching this
+    worker's cached copy, so ETags and cached trends built from it could
+    keep serving the page from before the write until the copy expires.
+    """
+    if 'data_version' not in g:
+        if g.get('user_from_cache'):
+            g.data_version = db.session.query(User.data_version).filter_by(id=current_user.id).scalar() or 0
+        else:
+            g.data_version = current_user.data_version or 0
+    return g.data_version
+
+def get_active_semester():
+    """The current user's active semester, looked up at most once per request"""
+    if 'active_semester' not in g:
+        g.active_semester = Semester.query.filter_by(is_active=True, user_id=current_user.id).order_by(Semester.id).first()
+    return g.active_semester
+
+def invalidate_user_context(user_id):
+    """Forget the cached user and active semester after a write.
+
+    Other workers keep their copy until it expires, but the writer's session
+    is stamped once the request has committed, so every worker reloads it
+    for the browser that made the change.
+    """
+    with _user_cache_lock:
+        _user_cache.pop(user_id, None)
+    if not has_request_context():
+        return
+    g.pop('active_semester', None)
+    g.pop('data_version', None)
+    if current_user.is_authenticated and current_user.id == user_id:
+        @after_this_request
+        def stamp_session(response):
+            session[USER_CACHE_STAMP] = time.time()
+            return response
+
+# Response Caching
+class LRUStore:
+    """Bounded in-process key/value store used when no shared backend is configured"""
+    
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
     
-    total_lectures = len(records)
-    attended_lectures = sum(1 for record in records if record.attended)
-    return (attended_lectures / total_lectures) * 100 if total_lectures > 0 else 0.0
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+    
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
 
-def calculate_aggregate_attendance():
-    """Calculate overall attendance percentage across all subjects"""
-    subjects = Subject.query.join(Semester).filter(Semester.is_active == True, Semester.user_id == current_user.id).all()
-    if not subjects:
-        return 0.0
+class ResponseCache:
+    """Caches rendered responses by ETag and counts hits, misses and 304s"""
     
-    total_lectures = 0
-    total_attended = 0
+    def __init__(self, store):
+        self.store = store
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self._lock = threading.Lock()
     
-    for subject in subjects:
-        records = AttendanceRecord.query.filter_by(subject_id=subject.id).all()
-        total_lectures += len(records)
-        total_attended += sum(1 for record in records if record.attended)
+    def count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
     
-    return (total_attended / total_lectures) * 100 if total_lectures > 0 else 0.0
+    def get(self, key):
+        value = self.store.get(f'response:{key}')
+        if value is None:
+            return None
+        mimetype, _, body = value.partition(b'\n')
+        return mimetype.decode(), body
+    
+    def set(self, key, mimetype, body):
+        self.store.set(f'response:{key}', mimetype.encode() + b'\n' + body)
 
-def calculate_lectures_needed(subject_id, target_percentage=75):
-    """Calculate how many lectures needed to reach target attendance"""
-    records = AttendanceRecord.query.filter_by(subject_id=subject_id).all()
+def bump_data_version(user_id):
+    """Invalidate every cached response of a user, across all workers"""
+    bump_data_versions([user_id])
+
+def bump_data_versions(user_ids):
+    """Invalidate the cached responses of many users with a single UPDATE"""
+    user_ids = sorted(set(user_ids))
+    if not user_ids:
+        return
+    User.query.filter(User.id.in_(user_ids)).update(
+        {'data_version': db.func.coalesce(User.data_version, 0) + 1},
+        synchronize_session=False
+    )
+    # Adding or activating a semester goes through here too
+    for user_id in user_ids:
+        invalidate_user_context(user_id)
+
+def cached_per_user(view):
+    """Serve a GET view from the response cache, with a strong ETag and 304 support.
+
+    The ETag covers the endpoint, the user's data version, today's date
+    (forecasts depend on it), the built assets the page links to and the
+    query string, so any write through bump_data_version() changes it. Requests with pending flash messages
+    bypass the cache because the rendered page would include them.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if '_flashes' in session:
+            return view(*args, **kwargs)
+        
+        cache = current_app.extensions['response_cache']
+        key = ':'.join([
+            request.endpoint, str(current_user.id), str(current_data_version()),
+            date.today().isoformat(), current_app.extensions['asset_version'], request.query_string.decode()
+        ])
+        etag = hashlib.sha1(key.encode()).hexdigest()
+        
+        if request.if_none_match.contains_weak(etag):
+            cache.count('not_modified')
+            response = current_app.response_class(status=304)
+            response.headers['X-Cache'] = 'HIT'
+        else:
+            cached = cache.get(etag)
+            if cached is not None:
+                cache.count('hits')
+                mimetype, body = cached
+                response = current_app.response_class(body, mimetype=mimetype)
+                response.headers['X-Cache'] = 'HIT'
+            else:
+                cache.count('misses')
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or '_flashes' in session:
+                    return response
+                cache.set(etag, response.mimetype, response.get_data())
+                response.headers['X-Cache'] = 'MISS'
+        
+        response.set_etag(etag)
+        # Let browsers keep a copy but always revalidate it with If-None-Match
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    return wrapper
+
+# Request Metrics
+logger = logging.getLogger(__name__)
+
+class RequestMetrics:
+    """Per-endpoint latency, SQL and template timings, exported in Prometheus text format.
+
+    Each worker process keeps its own numbers, so scrape every worker or
+    sum them in Prometheus.
+    """
+    LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+    QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
     
-    total_lectures = len(records)
-    attended_lectures = sum(1 for record in records if record.attended)
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
     
-    if total_lectures == 0:
-        return {"lectures_to_attend": 0, "lectures_can_miss": 0, "current_percentage": 0}
+    def _new_endpoint(self):
+        return {
+            'requests': defaultdict(int),
+            'latency_buckets': [0] * len(self.LATENCY_BUCKETS),
+            'latency_sum': 0.0,
+            'query_buckets': [0] * len(self.QUERY_BUCKETS),
+            'queries': 0,
+            'sql_seconds': 0.0,
+            'template_seconds': 0.0,
+            'over_budget': 0
+        }
     
-    current_percentage = (attended_lectures / total_lectures) * 100
+    def observe(self, endpoint, status, latency, request_stats, over_budget):
+        with self._lock:
+            stats = self._endpoints.get(endpoint)
+            if stats is None:
+                stats = self._endpoints[endpoint] = self._new_endpoint()
+            stats['requests'][status] += 1
+            stats['latency_sum'] += latency
+            for i, bound in enumerate(self.LATENCY_BUCKETS):
+                if latency <= bound:
+                    stats['latency_buckets'][i] += 1
+            for i, bound in enumerate(self.QUERY_BUCKETS):
+                if request_stats['queries'] <= bound:
+                    stats['query_buckets'][i] += 1
+            stats['queries'] += request_stats['queries']
+            stats['sql_seconds'] += request_stats['sql_seconds']
+            stats['template_seconds'] += request_stats['template_seconds']
+            stats['over_budget'] += int(over_budget)
     
-    # Calculate lectures needed to reach target
-    lectures_to_attend = 0
-    if current_percentage < target_percentage:
-        # Need to attend more lectures
-        # Formula: (attended + x) / (total + x) = target/100
-        # Solving for x: x = (target * total - 100 * attended) / (100 - target)
-        if target_percentage < 100:
-            lectures_to_attend = max(0, int((target_percentage * total_lectures - 100 * attended_lectures) / (100 - target_percentage)))
+    def render(self, response_cache=None):
+        """Prometheus text exposition of everything observed so far"""
+        with self._lock:
+            endpoints = sorted(self._endpoints.items())
+            lines = []
+            
+            def family(name, kind, help_text):
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+            
+            def histogram(name, key, buckets, total_key):
+                for endpoint, stats in endpoints:
+                    count = sum(stats['requests'].values())
+                    for bound, value in zip(buckets, stats[key]):
+                        lines.append(f'{name}_bucket{{endpoint="{endpoint}",le="{bound}"}} {value}')
+                    lines.append(f'{name}_bucket{{endpoint="{endpoint}",le="+Inf"}} {count}')
+                    lines.append(f'{name}_sum{{endpoint="{endpoint}"}} {stats[total_key]}')
+                    lines.append(f'{name}_count{{endpoint="{endpoint}"}} {count}')
+            
+            family('attendance_requests_total', 'counter', 'Requests handled, by endpoint and status code.')
+            for endpoint, stats in endpoints:
+                for status, value in sorted(stats['requests'].items()):
+                    lines.append(f'attendance_requests_total{{endpoint="{endpoint}",status="{status}"}} {value}')
+            family('attendance_request_duration_seconds', 'histogram', 'Request latency by endpoint.')
+            histogram('attendance_request_duration_seconds', 'latency_buckets', self.LATENCY_BUCKETS, 'latency_sum')
+            family('attendance_sql_queries_per_request', 'histogram', 'SQL statements executed per request.')
+            histogram('attendance_sql_queries_per_request', 'query_buckets', self.QUERY_BUCKETS, 'queries')
+            for name, key, help_text in (
+                ('attendance_sql_duration_seconds_total', 'sql_seconds', 'Time spent executing SQL.'),
+                ('attendance_template_render_seconds_total', 'template_seconds', 'Time spent rendering templates.'),
+                ('attendance_requests_over_query_budget_total', 'over_budget', 'Requests that exceeded QUERY_BUDGET.')
+            ):
+                family(name, 'counter', help_text)
+                for endpoint, stats in endpoints:
+                    lines.append(f'{name}{{endpoint="{endpoint}"}} {stats[key]}')
+        
+        if response_cache is not None:
+            for counter in ('hits', 'misses', 'not_modified'):
+                name = f'attendance_response_cache_{counter}_total'
+                family(name, 'counter', f'Response cache {counter.replace("_", " ")}.')
+                lines.append(f'{name} {getattr(response_cache, counter)}')
+        return '\n'.join(lines) + '\n'
+
+def init_metrics(app):
+    """Time every request, its SQL and its template rendering"""
+    metrics = app.extensions['metrics'] = RequestMetrics()
     
-    # Calculate lectures that can be missed while maintaining target
-    lectures_can_miss = 0
-    if current_percentage >= target_percentage:
-        # Formula: attended / (total + x) >= target/100
-        # Solving for x: x <= (100 * attended - target * total) / target
-        if target_percentage > 0:
-            lectures_can_miss = max(0, int((100 * attended_lectures - target_percentage * total_lectures) / target_percentage))
+    @app.before_request
+    def start_request_timer():
+        g.request_start = time.perf_counter()
+        g.request_stats = {'queries': 0, 'sql_seconds': 0.0, 'template_seconds': 0.0}
     
-    return {
-        "lectures_to_attend": lectures_to_attend,
-        "lectures_can_miss": lectures_can_miss,
-        "current_percentage": round(current_percentage, 2)
-    }
+    @app.after_request
+    def record_request(response):
+        if 'request_stats' not in g:
+            return response
+        request_stats = g.request_stats
+        latency = time.perf_counter() - g.request_start
+        budget = app.config['QUERY_BUDGET']
+        over_budget = request_stats['queries'] > budget
+        if over_budget:
+            response.headers['X-Query-Budget-Exceeded'] = f"{request_stats['queries']}/{budget}"
+            logger.warning('%s %s ran %d SQL queries (budget %d)', request.method, request.path,
+                           request_stats['queries'], budget)
+        if app.config['METRICS_ENABLED'] or app.debug:
+            response.headers['Server-Timing'] = (
+                f"db;dur={request_stats['sql_seconds'] * 1000:.1f};desc=\"{request_stats['queries']} queries\", "
+                f"tpl;dur={request_stats['template_seconds'] * 1000:.1f}, "
+                f"total;dur={latency * 1000:.1f}"
+            )
+        metrics.observe(request.endpoint or 'unmatched', response.status_code, latency, request_stats, over_budget)
+        return response
+    
+    def start_template_timer(sender, template, context, **extra):
+        if 'request_stats' in g:
+            g.template_start = time.perf_counter()
+    
+    def record_template_time(sender, template, context, **extra):
+        if 'request_stats' in g and 'template_start' in g:
+            g.request_stats['template_seconds'] += time.perf_counter() - g.pop('template_start')
+    
+    # Signals hold weak references by default; these closures have no other owner
+    before_render_template.connect(start_template_timer, app, weak=False)
+    template_rendered.connect(record_template_time, app, weak=False)
+
+@bp.route('/metrics')
+def metrics():
+    """Prometheus scrape endpoint; 404 unless METRICS_ENABLED is set"""
+    if not current_app.config['METRICS_ENABLED']:
+        abort(404)
+    token = current_app.config['METRICS_TOKEN']
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        abort(401)
+    body = current_app.extensions['metrics'].render(current_app.extensions['response_cache'])
+    return current_app.response_class(body, mimetype='text/plain; version=0.0.4')
+
+# Static Assets
+try:
+    import brotli
+except ImportError:  # optional: gzip is always built, .br files only with `pip install Brotli`
+    brotli = None
+
+# Third-party files served from static/vendor, pinned to exact versions
+VENDOR_ASSETS = {
+    'vendor/bootstrap/bootstrap.min.css': 'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css',
+    'vendor/bootstrap/bootstrap.bundle.min.js': 'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js',
+    'vendor/bootstrap-icons/bootstrap-icons.css': 'https://cdn.jsdelivr.net/npm/bootstrap-icons@1.11.0/font/bootstrap-icons.css',
+    'vendor/bootstrap-icons/fonts/bootstrap-icons.woff2': 'https://cdn.jsdelivr.net/npm/bootstrap-icons@1.11.0/font/fonts/bootstrap-icons.woff2',
+    'vendor/bootstrap-icons/fonts/bootstrap-icons.woff': 'https://cdn.jsdelivr.net/npm/bootstrap-icons@1.11.0/font/fonts/bootstrap-icons.woff',
+    'vendor/chart.js/chart.umd.js': 'https://cdn.jsdelivr.net/npm/chart.js@4.4.0/dist/chart.umd.js',
+}
+ASSET_DIST = 'dist'
+ASSET_MANIFEST = 'manifest.json'
+CSS_URL = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+
+def fingerprinted_name(path, content):
+    stem, ext = os.path.splitext(path)
+    return f'{stem}.{hashlib.sha256(content).hexdigest()[:12]}{ext}'
+
+def rewrite_css_urls(path, content, manifest):
+    """Point relative url() references of a stylesheet at their fingerprinted files"""
+    base = os.path.dirname(path)
+
+    def replace(match):
+        target = match.group(2)
+        if ':' in target or target.startswith(('/', '#')):
+            return match.group(0)
+        clean = target.split('?')[0].split('#')[0]
+        resolved = os.path.normpath(os.path.join(base, clean)).replace(os.sep, '/')
+        if resolved not in manifest:
+            return match.group(0)
+        return f'url("{os.path.relpath(manifest[resolved], base or ".").replace(os.sep, "/")}")'
+
+    return CSS_URL.sub(replace, content.decode('utf-8')).encode('utf-8')
+
+def build_assets(static_dir, refresh=False, progress=None):
+    """Download vendor files, then write fingerprinted and precompressed copies to static/dist.
+
+    Stylesheets are processed last so their url() references can be
+    rewritten to the fingerprinted fonts and images first. Returns the
+    manifest mapping each source path to its fingerprinted path.
+    """
+    for path, url in VENDOR_ASSETS.items():
+        target = os.path.join(static_dir, path)
+        if os.path.exists(target) and not refresh:
+            continue
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with urlopen(url, timeout=30) as response, open(target, 'wb') as f:
+            f.write(response.read())
+        if progress:
+            progress(f'downloaded {path}')
+
+    dist = os.path.join(static_dir, ASSET_DIST)
+    shutil.rmtree(dist, ignore_errors=True)
+    sources = []
+    for root, dirs, files in os.walk(static_dir):
+        dirs[:] = [d for d in dirs if os.path.join(root, d) != dist]
+        sources.extend(os.path.relpath(os.path.join(root, name), static_dir).replace(os.sep, '/') for name in files)
+    sources.sort(key=lambda path: (path.endswith('.css'), path))
+
+    manifest = {}
+    for path in sources:
+        with open(os.path.join(static_dir, path), 'rb') as f:
+            content = f.read()
+        if path.endswith('.css'):
+            content = rewrite_css_urls(path, content, manifest)
+        manifest[path] = fingerprinted_name(path, content)
+        target = os.path.join(dist, manifest[path])
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, 'wb') as f:
+            f.write(content)
+        if not path.endswith(PRECOMPRESSED_SKIP):
+            with open(target + '.gz', 'wb') as f:
+                f.write(gzip.compress(content, compresslevel=9, mtime=0))
+            if brotli is not None:
+                with open(target + '.br', 'wb') as f:
+                    f.write(brotli.compress(content))
+        if progress:
+            progress(f'{path} -> {ASSET_DIST}/{manifest[path]}')
+
+    with open(os.path.join(dist, ASSET_MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+def load_asset_manifest(app):
+    try:
+        with open(os.path.join(app.static_folder, ASSET_DIST, ASSET_MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def asset_url(filename):
+    """URL of a static file: fingerprinted when `flask build-assets` has run, otherwise as it is.
+
+    Vendor files that have not been downloaded yet are loaded from the CDN
+    they are pinned to.
+    """
+    hashed = current_app.extensions['asset_manifest'].get(filename)
+    if hashed:
+        return url_for('main.asset', filename=hashed)
+    if filename in VENDOR_ASSETS and not os.path.exists(os.path.join(current_app.static_folder, filename)):
+        return VENDOR_ASSETS[filename]
+    return url_for('static', filename=filename)
+
+@bp.route('/assets/<path:filename>')
+def asset(filename):
+    """Fingerprinted static file, precompressed when the client accepts it and cached for a year"""
+    dist = os.path.join(current_app.static_folder, ASSET_DIST)
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    encoding = None
+    for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if candidate in request.accept_encodings and os.path.exists(safe_join(dist, filename + suffix) or ''):
+            encoding = candidate
+            filename += suffix
+            break
+    response = send_from_directory(dist, filename, mimetype=mimetype, max_age=ASSET_MAX_AGE)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+@bp.cli.command('build-assets')
+@click.option('--refresh', is_flag=True, help='Download vendor files again even if present.')
+def build_assets_command(refresh):
+    """Vendor, fingerprint and precompress static files into static/dist."""
+    manifest = build_assets(current_app.static_folder, refresh, click.echo)
+    if brotli is None:
+        click.echo('Brotli is not installed; only gzip copies were written.')
+    click.echo(f'Built {len(manifest)} asset(s); restart the app to serve them.')
+
+def init_compression(app):
+    """Gzip dynamic HTML and JSON responses for clients that accept it"""
+
+    @app.after_request
+    def compress_response(response):
+        if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES
+                or 'gzip' not in request.accept_encodings):
+            return response
+        body = response.get_data()
+        response.vary.add('Accept-Encoding')
+        if len(body) < COMPRESS_MIN_BYTES:
+            return response
+        response.set_data(gzip.compress(body, compresslevel=COMPRESS_LEVEL))
+        response.headers['Content-Encoding'] = 'gzip'
+        # The same entity in another encoding: the validator stays usable, but only weakly
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
 
 # Authentication Routes
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated:
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
         
     if request.method == 'POST':
         username = request.form['username']
@@ -153,16 +3193,16 @@ def login():
             login_user(user)
             next_page = request.args.get('next')
             flash('Logged in successfully!', 'success')
-            return redirect(next_page or url_for('index'))
+            return redirect(next_page or url_for('main.index'))
         else:
             flash('Invalid username or password', 'error')
     
     return render_template('login.html')
 
-@app.route('/register', methods=['GET', 'POST'])
+@bp.route('/register', methods=['GET', 'POST'])
 def register():
     if current_user.is_authenticated:
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
         
     if request.method == 'POST':
         username = request.form['username']
@@ -187,56 +3227,47 @@ def register():
         
         login_user(user)
         flash('Registration successful! Welcome to Attendance Tracker!', 'success')
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     
     return render_template('register.html')
 
-@app.route('/logout')
+@bp.route('/logout')
 @login_required
 def logout():
     logout_user()
     flash('Logged out successfully', 'info')
-    return redirect(url_for('login'))
+    return redirect(url_for('main.login'))
 
 # Routes
-@app.route('/')
+@bp.route('/')
 @login_required
+@cached_per_user
 def index():
     """Dashboard showing overview of attendance"""
-    active_semester = Semester.query.filter_by(is_active=True, user_id=current_user.id).first()
+    active_semester = get_active_semester()
     if not active_semester:
         flash('Welcome! Please create your first semester to get started.', 'info')
-        return redirect(url_for('manage_semesters'))
-    
-    subjects = Subject.query.filter_by(semester_id=active_semester.id).all()
+        return redirect(url_for('main.manage_semesters'))
     
-    # Calculate attendance data for each subject
-    subject_data = []
-    for subject in subjects:
-        attendance_percentage = calculate_attendance_percentage(subject.id)
-        guidance = calculate_lectures_needed(subject.id)
-        
-        subject_data.append({
-            'subject': subject,
-            'attendance_percentage': round(attendance_percentage, 2),
-            'guidance': guidance
-        })
-    
-    aggregate_attendance = calculate_aggregate_attendance()
+    subject_data, aggregate_attendance = get_semester_attendance(active_semester.id)
+    projections = get_semester_projection(active_semester, subject_data)
+    for subject_info in subject_data:
+        subject_info['projection'] = projections[subject_info['subject'].id]
     
     return render_template('index.html', 
                          subjects=subject_data, 
-                         aggregate_attendance=round(aggregate_attendance, 2),
+                         aggregate_attendance=aggregate_attendance,
                          semester=active_semester)
 
-@app.route('/semesters')
+@bp.route('/semesters')
 @login_required
 def manage_semesters():
     """Manage semesters"""
     semesters = Semester.query.filter_by(user_id=current_user.id).all()
-    return render_template('semesters.html', semesters=semesters)
+    archived = archive_stats([semester.id for semester in semesters if semester.archived_at is not None])
+    return render_template('semesters.html', semesters=semesters, archived=archived)
 
-@app.route('/add_semester', methods=['GET', 'POST'])
+@bp.route('/add_semester', methods=['GET', 'POST'])
 @login_required
 def add_semester():
     """Add a new semester"""
@@ -252,45 +3283,98 @@ def add_semester():
             is_active=bool(request.form.get('is_active')),
             user_id=current_user.id
         )
+        semester.stats = SemesterStats(attended=0, total=0)
         
         db.session.add(semester)
+        bump_data_version(current_user.id)
         db.session.commit()
         flash('Semester added successfully!', 'success')
-        return redirect(url_for('manage_semesters'))
+        return redirect(url_for('main.manage_semesters'))
     
     return render_template('add_semester.html')
 
-@app.route('/activate_semester/<int:semester_id>')
+@bp.route('/activate_semester/<int:semester_id>')
 @login_required
 def activate_semester(semester_id):
     """Activate a semester and deactivate others"""
     Semester.query.filter_by(user_id=current_user.id).update({'is_active': False})
     semester = Semester.query.filter_by(id=semester_id, user_id=current_user.id).first_or_404()
     semester.is_active = True
+    restore_semester(semester)
+    bump_data_version(current_user.id)
     db.session.commit()
     flash(f'Semester "{semester.name}" activated!', 'success')
-    return redirect(url_for('manage_semesters'))
+    return redirect(url_for('main.manage_semesters'))
+
+@bp.route('/archive_semester/<int:semester_id>', methods=['POST'])
+@login_required
+def archive_semester_route(semester_id):
+    """Pack an inactive semester's attendance records into the compact archive"""
+    semester = Semester.query.filter_by(id=semester_id, user_id=current_user.id).first_or_404()
+    if semester.is_active:
+        flash('The active semester cannot be archived.', 'error')
+        return redirect(url_for('main.manage_semesters'))
+    packed = archive_semester(semester)
+    bump_data_version(current_user.id)
+    db.session.commit()
+    flash(f'Semester "{semester.name}" archived ({packed} records packed). Activating it restores them.', 'success')
+    return redirect(url_for('main.manage_semesters'))
+
+@bp.route('/semesters/<int:semester_id>/rollover', methods=['GET', 'POST'])
+@login_required
+def rollover_semester(semester_id):
+    """Start a new semester with a copy of this one's subjects and timetable"""
+    source = Semester.query.filter_by(id=semester_id, user_id=current_user.id).first_or_404()
+    subjects = Subject.query.filter_by(semester_id=source.id).order_by(Subject.code).all()
+    if request.method == 'POST':
+        codes = request.form.getlist('subject_codes')
+        if not codes:
+            flash('Choose at least one subject to copy.', 'error')
+            return redirect(url_for('main.rollover_semester', semester_id=source.id))
+        try:
+            semester, = rollover_semesters(
+                [source], request.form['name'],
+                datetime.strptime(request.form['start_date'], '%Y-%m-%d').date(),
+                datetime.strptime(request.form['end_date'], '%Y-%m-%d').date(),
+                subject_codes=codes if len(codes) < len(subjects) else None,
+                copy_holidays=bool(request.form.get('copy_holidays')),
+                activate=bool(request.form.get('is_active'))
+            )
+        except ValueError as e:
+            db.session.rollback()
+            flash(str(e), 'error')
+            return redirect(url_for('main.rollover_semester', semester_id=source.id))
+        db.session.commit()
+        flash(f'Semester "{semester.name}" created from "{source.name}".', 'success')
+        return redirect(url_for('main.manage_semesters'))
 
-@app.route('/subjects')
+    start_date, end_date = rollover_dates(source)
+    slot_counts = dict(db.session.query(TimetableSlot.subject_id, db.func.count()).join(Subject).filter(
+        Subject.semester_id == source.id
+    ).group_by(TimetableSlot.subject_id).all())
+    return render_template('rollover_semester.html', source=source, subjects=subjects, slot_counts=slot_counts,
+                           start_date=start_date, end_date=end_date)
+
+@bp.route('/subjects')
 @login_required
 def manage_subjects():
     """Manage subjects for active semester"""
-    active_semester = Semester.query.filter_by(is_active=True, user_id=current_user.id).first()
+    active_semester = get_active_semester()
     if not active_semester:
         flash('Please create and activate a semester first.', 'warning')
-        return redirect(url_for('manage_semesters'))
+        return redirect(url_for('main.manage_semesters'))
     
     subjects = Subject.query.filter_by(semester_id=active_semester.id).all()
     return render_template('subjects.html', subjects=subjects, semester=active_semester)
 
-@app.route('/add_subject', methods=['GET', 'POST'])
+@bp.route('/add_subject', methods=['GET', 'POST'])
 @login_required
 def add_subject():
     """Add a new subject"""
-    active_semester = Semester.query.filter_by(is_active=True, user_id=current_user.id).first()
+    active_semester = get_active_semester()
     if not active_semester:
         flash('Please create and activate a semester first.', 'warning')
-        return redirect(url_for('manage_semesters'))
+        return redirect(url_for('main.manage_semesters'))
     
     if request.method == 'POST':
         subject = Subject(
@@ -300,15 +3384,17 @@ def add_subject():
             total_lectures=int(request.form['total_lectures']),
             semester_id=active_semester.id
         )
+        subject.stats = SubjectStats(attended=0, total=0)
         
         db.session.add(subject)
+        bump_data_version(current_user.id)
         db.session.commit()
         flash('Subject added successfully!', 'success')
-        return redirect(url_for('manage_subjects'))
+        return redirect(url_for('main.manage_subjects'))
     
     return render_template('add_subject.html', semester=active_semester)
 
-@app.route('/edit_subject/<int:subject_id>', methods=['GET', 'POST'])
+@bp.route('/edit_subject/<int:subject_id>', methods=['GET', 'POST'])
 @login_required
 def edit_subject(subject_id):
     """Edit an existing subject"""
@@ -323,13 +3409,14 @@ def edit_subject(subject_id):
         subject.credits = int(request.form['credits'])
         subject.total_lectures = int(request.form['total_lectures'])
         
+        bump_data_version(current_user.id)
         db.session.commit()
         flash('Subject updated successfully!', 'success')
-        return redirect(url_for('manage_subjects'))
+        return redirect(url_for('main.manage_subjects'))
     
     return render_template('edit_subject.html', subject=subject)
 
-@app.route('/delete_subject/<int:subject_id>')
+@bp.route('/delete_subject/<int:subject_id>')
 @login_required
 def delete_subject(subject_id):
     """Delete a subject"""
@@ -337,19 +3424,25 @@ def delete_subject(subject_id):
         Subject.id == subject_id,
         Semester.user_id == current_user.id
     ).first_or_404()
+    stats = get_subject_stats(subject.id)
+    apply_stats_delta(subject, -stats.attended, -stats.total)
+    bump_schedule_version(subject.semester_id)
+    # Clients drop the subject's slots and records along with it
+    record_deletions(current_user.id, 'subjects', [subject.id])
     db.session.delete(subject)
+    bump_data_version(current_user.id)
     db.session.commit()
     flash('Subject deleted successfully!', 'success')
-    return redirect(url_for('manage_subjects'))
+    return redirect(url_for('main.manage_subjects'))
 
-@app.route('/timetable')
+@bp.route('/timetable')
 @login_required
 def view_timetable():
     """View and manage timetable"""
-    active_semester = Semester.query.filter_by(is_active=True, user_id=current_user.id).first()
+    active_semester = get_active_semester()
     if not active_semester:
         flash('Please create and activate a semester first.', 'warning')
-        return redirect(url_for('manage_semesters'))
+        return redirect(url_for('main.manage_semesters'))
     
     subjects = Subject.query.filter_by(semester_id=active_semester.id).all()
     
@@ -372,9 +3465,10 @@ def view_timetable():
                          timetable_data=dict(timetable_data), 
                          subjects=subjects, 
                          days=days,
+                         holidays=active_semester.holidays,
                          semester=active_semester)
 
-@app.route('/add_timetable_slot', methods=['POST'])
+@bp.route('/add_timetable_slot', methods=['POST'])
 @login_required
 def add_timetable_slot():
     """Add a timetable slot for a subject"""
@@ -392,11 +3486,13 @@ def add_timetable_slot():
     )
     
     db.session.add(slot)
+    bump_schedule_version(subject.semester_id)
+    bump_data_version(current_user.id)
     db.session.commit()
     flash('Timetable slot added successfully!', 'success')
-    return redirect(url_for('view_timetable'))
+    return redirect(url_for('main.view_timetable'))
 
-@app.route('/delete_timetable_slot/<int:slot_id>')
+@bp.route('/delete_timetable_slot/<int:slot_id>')
 @login_required
 def delete_timetable_slot(slot_id):
     """Delete a timetable slot"""
@@ -404,144 +3500,723 @@ def delete_timetable_slot(slot_id):
         TimetableSlot.id == slot_id,
         Semester.user_id == current_user.id
     ).first_or_404()
+    bump_schedule_version(slot.subject.semester_id)
+    record_deletions(current_user.id, 'slots', [slot.id])
     db.session.delete(slot)
+    bump_data_version(current_user.id)
     db.session.commit()
     flash('Timetable slot deleted successfully!', 'success')
-    return redirect(url_for('view_timetable'))
+    return redirect(url_for('main.view_timetable'))
+
+@bp.route('/add_holiday', methods=['POST'])
+@login_required
+def add_holiday():
+    """Exclude a date of the active semester from lecture projections"""
+    active_semester = get_active_semester() or abort(404)
+    holiday_date = datetime.strptime(request.form['date'], '%Y-%m-%d').date()
+    
+    if not active_semester.start_date <= holiday_date <= active_semester.end_date:
+        flash('Holiday must fall within the semester.', 'error')
+    elif Holiday.query.filter_by(semester_id=active_semester.id, date=holiday_date).first():
+        flash('That date is already marked as a holiday.', 'warning')
+    else:
+        db.session.add(Holiday(semester_id=active_semester.id, date=holiday_date, name=request.form.get('name', '')))
+        bump_schedule_version(active_semester.id)
+        bump_data_version(current_user.id)
+        db.session.commit()
+        flash('Holiday added successfully!', 'success')
+    return redirect(url_for('main.view_timetable'))
+
+@bp.route('/delete_holiday/<int:holiday_id>')
+@login_required
+def delete_holiday(holiday_id):
+    """Delete a holiday"""
+    holiday = Holiday.query.join(Semester).filter(
+        Holiday.id == holiday_id,
+        Semester.user_id == current_user.id
+    ).first_or_404()
+    bump_schedule_version(holiday.semester_id)
+    db.session.delete(holiday)
+    bump_data_version(current_user.id)
+    db.session.commit()
+    flash('Holiday deleted successfully!', 'success')
+    return redirect(url_for('main.view_timetable'))
 
-@app.route('/attendance')
+@bp.route('/attendance')
 @login_required
 def mark_attendance():
-    """Mark daily attendance"""
-    active_semester = Semester.query.filter_by(is_active=True, user_id=current_user.id).first()
+    """Mark attendance for the lectures scheduled on a day"""
+    active_semester = get_active_semester()
     if not active_semester:
         flash('Please create and activate a semester first.', 'warning')
-        return redirect(url_for('manage_semesters'))
+        return redirect(url_for('main.manage_semesters'))
     
     selected_date = request.args.get('date', date.today().strftime('%Y-%m-%d'))
     selected_date_obj = datetime.strptime(selected_date, '%Y-%m-%d').date()
+    show_all = request.args.get('all') == '1'
     
     subjects = Subject.query.filter_by(semester_id=active_semester.id).all()
-    
-    # Get existing attendance records for the selected date
-    attendance_data = {}
-    for subject in subjects:
-        record = AttendanceRecord.query.filter_by(
-            subject_id=subject.id,
-            date=selected_date_obj
-        ).first()
-        attendance_data[subject.id] = record
+    day = get_scheduled_lectures(active_semester, subjects, selected_date_obj, selected_date_obj, show_all)[0]
     
     return render_template('attendance.html', 
                          subjects=subjects, 
                          selected_date=selected_date,
-                         attendance_data=attendance_data,
+                         day=day,
+                         show_all=show_all,
+                         semester=active_semester)
+
+@bp.route('/attendance/week')
+@login_required
+def mark_attendance_week():
+    """Mark a whole week of scheduled lectures at once"""
+    active_semester = get_active_semester()
+    if not active_semester:
+        flash('Please create and activate a semester first.', 'warning')
+        return redirect(url_for('main.manage_semesters'))
+    
+    start = datetime.strptime(request.args.get('start', date.today().strftime('%Y-%m-%d')), '%Y-%m-%d').date()
+    start -= timedelta(days=start.weekday())
+    show_all = request.args.get('all') == '1'
+    
+    subjects = Subject.query.filter_by(semester_id=active_semester.id).all()
+    week = get_scheduled_lectures(active_semester, subjects, start, start + timedelta(days=6), show_all)
+    
+    return render_template('attendance_week.html', 
+                         subjects=subjects, 
+                         week=week,
+                         start=start,
+                         previous_week=start - timedelta(days=7),
+                         next_week=start + timedelta(days=7),
+                         show_all=show_all,
+                         today=date.today(),
                          semester=active_semester)
 
-@app.route('/save_attendance', methods=['POST'])
+@bp.route('/save_attendance', methods=['POST'])
 @login_required
 def save_attendance():
-    """Save attendance records for a specific date"""
-    selected_date = datetime.strptime(request.form['date'], '%Y-%m-%d').date()
+    """Save attendance for the lectures submitted from the day or week page.
+
+    The day page sends a switch per lecture, so an unticked one is an
+    absence. The week page sends present, absent or nothing for each
+    lecture, and lectures left unmarked are not written. Lectures after
+    today are never saved.
+    """
+    lectures = {key: parse_lecture_key(key) for key in request.form.getlist('lectures')}
     
-    for subject_id in request.form.getlist('subject_ids'):
-        subject_id = int(subject_id)
-        
-        # Verify the subject belongs to the current user
-        subject = Subject.query.join(Semester).filter(
-            Subject.id == subject_id,
-            Semester.user_id == current_user.id
-        ).first()
-        
-        if not subject:
-            continue  # Skip if subject doesn't belong to user
-        attended = f'attended_{subject_id}' in request.form
-        notes = request.form.get(f'notes_{subject_id}', '')
-        
-        # Check if record already exists
-        existing_record = AttendanceRecord.query.filter_by(
-            subject_id=subject_id,
-            date=selected_date
-        ).first()
-        
-        if existing_record:
-            existing_record.attended = attended
-            existing_record.notes = notes
+    # Verify ownership of every submitted subject at once; others are skipped
+    subjects = {subject.id: subject for subject in Subject.query.join(Semester).filter(
+        Subject.id.in_({subject_id for _, subject_id, _ in lectures.values()}),
+        Semester.user_id == current_user.id
+    )}
+    
+    today = date.today()
+    entries, upcoming = [], 0
+    for key, (record_date, subject_id, lecture) in lectures.items():
+        if subject_id not in subjects:
+            continue
+        if record_date > today:
+            upcoming += 1
+            continue
+        status = request.form.get(f'status_{key}')
+        if status is None:
+            attended = f'attended_{key}' in request.form
+        elif status in ('present', 'absent'):
+            attended = status == 'present'
         else:
-            new_record = AttendanceRecord(
-                subject_id=subject_id,
-                date=selected_date,
-                attended=attended,
-                notes=notes
+            continue
+        entries.append((subject_id, record_date, lecture, attended, request.form.get(f'notes_{key}', '')))
+    
+    if entries:
+        upsert_attendance(subjects, entries)
+        bump_data_version(current_user.id)
+        db.session.commit()
+    if upcoming:
+        flash("Attendance can't be marked for lectures that haven't happened yet.", 'warning')
+    else:
+        flash('Attendance saved successfully!', 'success')
+    if request.form.get('view') == 'week':
+        return redirect(url_for('main.mark_attendance_week', start=request.form['start'], all=request.form.get('all')))
+    return redirect(url_for('main.mark_attendance', date=request.form['date'], all=request.form.get('all')))
+
+@bp.route('/api/attendance/bulk', methods=['POST'])
+@login_required
+def api_bulk_attendance():
+    """Save many dates x subjects of attendance in one transaction.
+
+    Expects ``{"records": [{"subject_id": 1, "date": "2024-01-15",
+    "attended": true, "notes": ""}, ...]}``; an optional ``lecture`` number
+    (default 0) separates several lectures of a subject on one day. Nothing
+    is written unless every record is valid and belongs to the current user.
+    """
+    payload = request.get_json(silent=True) or {}
+    records = payload.get('records')
+    if not isinstance(records, list):
+        return jsonify({'error': 'Expected a JSON object with a "records" list'}), 400
+    if len(records) > BULK_MAX_RECORDS:
+        return jsonify({'error': f'At most {BULK_MAX_RECORDS} records per request'}), 400
+    
+    entries = {}
+    errors = []
+    for index, record in enumerate(records):
+        try:
+            if not isinstance(record, dict):
+                raise TypeError('record must be an object')
+            lecture = int(record.get('lecture', 0))
+            if lecture < 0:
+                raise ValueError('lecture must not be negative')
+            if not isinstance(record['attended'], bool):
+                raise TypeError('attended must be true or false')
+            entries[index] = (
+                int(record['subject_id']),
+                datetime.strptime(record['date'], '%Y-%m-%d').date(),
+                lecture,
+                record['attended'],
+                str(record.get('notes') or '')
             )
-            db.session.add(new_record)
+        except (TypeError, KeyError, ValueError) as e:
+            errors.append({'index': index, 'error': f'Invalid record: {e}'})
+    
+    subject_ids = {entry[0] for entry in entries.values()}
+    subjects = {subject.id: subject for subject in Subject.query.join(Semester).filter(
+        Subject.id.in_(subject_ids),
+        Semester.user_id == current_user.id
+    )}
+    for index, entry in entries.items():
+        if entry[0] not in subjects:
+            errors.append({'index': index, 'error': f'Unknown subject {entry[0]}'})
+    if errors:
+        return jsonify({'error': 'No records were saved', 'errors': errors}), 400
+    
+    inserted, updated = upsert_attendance(subjects, entries.values())
+    # An empty list writes nothing, so cached pages and ETags stay valid
+    if inserted or updated:
+        bump_data_version(current_user.id)
+        db.session.commit()
     
+    return jsonify({'inserted': inserted, 'updated': updated})
+
+def download(body, filename, mimetype):
+    """Stream a generator as a file download"""
+    response = Response(stream_with_context(body), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+def export_filename(semester, suffix):
+    slug = ''.join(c if c.isalnum() else '-' for c in semester.name.lower()).strip('-') or f'semester-{semester.id}'
+    return f'{slug}-{suffix}'
+
+@bp.route('/import_export', methods=['GET', 'POST'])
+@login_required
+def import_export():
+    """Download CSV/iCalendar exports and queue CSV imports into a semester"""
+    semesters = Semester.query.filter_by(user_id=current_user.id).order_by(Semester.start_date.desc()).all()
+    if request.method == 'POST':
+        semester = Semester.query.filter_by(id=int(request.form['semester_id']), user_id=current_user.id).first_or_404()
+        upload = request.files.get('file')
+        kind = request.form.get('kind')
+        if not upload or not upload.filename or kind not in IMPORTERS:
+            flash('Choose what to import and a CSV file.', 'error')
+            return redirect(url_for('main.import_export'))
+        # Large files are read by a job worker, so the request only has to store the upload
+        directory = current_app.config['JOB_ARTIFACT_DIR']
+        os.makedirs(directory, exist_ok=True)
+        filename = f'upload-{secrets.token_hex(8)}.csv'
+        upload.save(os.path.join(directory, filename))
+        job = enqueue_job('import_csv', current_user.id, {'semester_id': semester.id, 'kind': kind, 'upload': filename})
+        db.session.commit()
+        flash(f'Import #{job.id} into {semester.name} queued.', 'success')
+        return redirect(url_for('main.jobs'))
+    return render_template('import_export.html', semesters=semesters)
+
+@bp.route('/export/semesters/<int:semester_id>/attendance.csv')
+@login_required
+def export_semester_attendance(semester_id):
+    """Stream a semester's attendance records as CSV"""
+    semester = Semester.query.filter_by(id=semester_id, user_id=current_user.id).first_or_404()
+    return download(stream_csv(ATTENDANCE_CSV_FIELDS, export_attendance_rows([semester.id])),
+                    export_filename(semester, 'attendance.csv'), 'text/csv')
+
+@bp.route('/export/semesters/<int:semester_id>/timetable.csv')
+@login_required
+def export_semester_timetable(semester_id):
+    """Stream a semester's timetable slots as CSV"""
+    semester = Semester.query.filter_by(id=semester_id, user_id=current_user.id).first_or_404()
+    return download(stream_csv(TIMETABLE_CSV_FIELDS, export_timetable_rows(semester.id)),
+                    export_filename(semester, 'timetable.csv'), 'text/csv')
+
+@bp.route('/export/semesters/<int:semester_id>/timetable.ics')
+@login_required
+def export_semester_calendar(semester_id):
+    """Stream a semester's timetable as an iCalendar file of weekly events"""
+    semester = Semester.query.filter_by(id=semester_id, user_id=current_user.id).first_or_404()
+    return download(stream_timetable_ics(semester), export_filename(semester, 'timetable.ics'), 'text/calendar')
+
+@bp.route('/export/attendance.csv')
+@login_required
+def export_all_attendance():
+    """Stream the attendance records of every semester of the current user as CSV"""
+    semester_ids = [semester_id for semester_id, in db.session.query(Semester.id).filter_by(user_id=current_user.id)]
+    return download(stream_csv(ATTENDANCE_CSV_FIELDS, export_attendance_rows(semester_ids)),
+                    'attendance-all-semesters.csv', 'text/csv')
+
+def queue_user_job(kind, params):
+    """Validate and queue a job for the current user, or raise ValueError"""
+    if kind not in USER_JOB_KINDS and not (kind in ADMIN_JOB_KINDS and current_user.is_admin):
+        raise ValueError(f'Unknown job kind {kind!r}')
+    semester_id = params.get('semester_id')
+    if semester_id is not None and not Semester.query.filter_by(id=semester_id, user_id=current_user.id).first():
+        raise ValueError('Unknown semester')
+    job = enqueue_job(kind, current_user.id, params)
     db.session.commit()
-    flash('Attendance saved successfully!', 'success')
-    return redirect(url_for('mark_attendance', date=selected_date.strftime('%Y-%m-%d')))
+    return job
+
+@bp.route('/jobs', methods=['GET', 'POST'])
+@login_required
+def jobs():
+    """Background jobs of the current user; POST queues a new one"""
+    if request.method == 'POST':
+        params = {}
+        if request.form.get('semester_id'):
+            params['semester_id'] = int(request.form['semester_id'])
+        try:
+            job = queue_user_job(request.form.get('kind'), params)
+        except ValueError as e:
+            flash(str(e), 'error')
+        else:
+            flash(f'Job #{job.id} queued. It will be ready to download here shortly.', 'success')
+        return redirect(url_for('main.jobs'))
+    user_jobs = Job.query.filter_by(user_id=current_user.id).order_by(Job.id.desc()).limit(JOB_PAGE_SIZE).all()
+    return render_template('jobs.html', jobs=[job_status(job) for job in user_jobs])
+
+@bp.route('/jobs/<int:job_id>/download')
+@login_required
+def download_job(job_id):
+    """Download the file produced by a finished job"""
+    job = Job.query.filter_by(id=job_id, user_id=current_user.id, status='done').first_or_404()
+    if not job.artifact:
+        abort(404)
+    path = os.path.join(current_app.config['JOB_ARTIFACT_DIR'], job.artifact)
+    if not os.path.exists(path):
+        abort(410)
+    return send_file(path, mimetype=job.mimetype, as_attachment=True, download_name=job.artifact_name)
+
+@bp.route('/api/jobs', methods=['GET', 'POST'])
+@login_required
+def api_jobs():
+    """List the current user's jobs, or queue one from a JSON ``{"kind": ..., "params": {...}}`` body"""
+    if request.method == 'POST':
+        payload = request.get_json(silent=True)
+        if not isinstance(payload, dict) or not isinstance(payload.get('params', {}), dict):
+            return jsonify({'error': 'Expected a JSON object with kind and params'}), 400
+        try:
+            job = queue_user_job(payload.get('kind'), payload.get('params', {}))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        response = jsonify(job_status(job))
+        response.status_code = 202
+        response.headers['Location'] = url_for('main.api_job', job_id=job.id)
+        return response
+    user_jobs = Job.query.filter_by(user_id=current_user.id).order_by(Job.id.desc()).limit(JOB_PAGE_SIZE)
+    return jsonify({'jobs': [job_status(job) for job in user_jobs]})
+
+@bp.route('/api/jobs/<int:job_id>')
+@login_required
+def api_job(job_id):
+    """Status of one job; poll until it is done or failed"""
+    job = Job.query.filter_by(id=job_id, user_id=current_user.id).first_or_404()
+    return jsonify(job_status(job))
 
-@app.route('/attendance_report')
+@bp.route('/attendance_report')
 @login_required
+@cached_per_user
 def attendance_report():
     """View detailed attendance report"""
-    active_semester = Semester.query.filter_by(is_active=True, user_id=current_user.id).first()
+    active_semester = get_active_semester()
     if not active_semester:
         flash('Please create and activate a semester first.', 'warning')
-        return redirect(url_for('manage_semesters'))
+        return redirect(url_for('main.manage_semesters'))
     
-    subjects = Subject.query.filter_by(semester_id=active_semester.id).all()
-    
-    report_data = []
-    for subject in subjects:
-        records = AttendanceRecord.query.filter_by(subject_id=subject.id).order_by(AttendanceRecord.date.desc()).all()
-        attendance_percentage = calculate_attendance_percentage(subject.id)
-        guidance = calculate_lectures_needed(subject.id)
-        
-        report_data.append({
-            'subject': subject,
-            'records': records,
-            'attendance_percentage': round(attendance_percentage, 2),
-            'guidance': guidance,
-            'total_lectures': len(records),
-            'attended_lectures': sum(1 for r in records if r.attended)
-        })
+    report_data, aggregate_attendance = get_semester_attendance(active_semester.id)
     
-    aggregate_attendance = calculate_aggregate_attendance()
+    # Only the latest few records are shown; totals come from the counters
+    recent_records = get_recent_records([subject_data['subject'].id for subject_data in report_data])
+    for subject_data in report_data:
+        records = recent_records[subject_data['subject'].id]
+        subject_data['records'] = records
+        subject_data['next_cursor'] = encode_history_cursor(records[-1]) if records else None
     
     return render_template('attendance_report.html', 
                          report_data=report_data,
-                         aggregate_attendance=round(aggregate_attendance, 2),
+                         aggregate_attendance=aggregate_attendance,
                          semester=active_semester)
 
-@app.route('/api/attendance_data')
+@bp.route('/api/subjects/<int:subject_id>/history')
+@login_required
+def api_attendance_history(subject_id):
+    """Page through a subject's attendance records, newest first.
+
+    Pass the ``next_cursor`` of one page as ``cursor`` to get the next one.
+    """
+    subject = Subject.query.join(Semester).filter(
+        Subject.id == subject_id,
+        Semester.user_id == current_user.id
+    ).first_or_404()
+    
+    try:
+        limit = min(max(int(request.args.get('limit', HISTORY_PAGE_SIZE)), 1), HISTORY_MAX_PAGE_SIZE)
+        cursor = request.args.get('cursor')
+        query = AttendanceRecord.query.filter_by(subject_id=subject.id)
+        if cursor:
+            cursor_date, cursor_id = decode_history_cursor(cursor)
+            query = query.filter(db.or_(
+                AttendanceRecord.date < cursor_date,
+                db.and_(AttendanceRecord.date == cursor_date, AttendanceRecord.id < cursor_id)
+            ))
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor or limit'}), 400
+    
+    if subject.archive is not None:
+        return jsonify(archived_history_page(subject.archive, cursor, limit))
+    
+    # Fetch one extra row to know whether another page exists
+    records = query.order_by(AttendanceRecord.date.desc(), AttendanceRecord.id.desc()).limit(limit + 1).all()
+    has_more = len(records) > limit
+    records = records[:limit]
+    
+    return jsonify({
+        'records': [{
+            'id': record.id,
+            'date': record.date.isoformat(),
+            'lecture': record.lecture,
+            'attended': record.attended,
+            'notes': record.notes
+        } for record in records],
+        'next_cursor': encode_history_cursor(records[-1]) if has_more else None
+    })
+
+@bp.route('/api/projection')
+@login_required
+def api_projection():
+    """Remaining-semester forecast for every subject of the active semester.
+
+    Optional query parameters: ``target`` (percentage, default 75) and
+    ``as_of`` (YYYY-MM-DD, default today).
+    """
+    active_semester = get_active_semester()
+    if not active_semester:
+        return jsonify({'error': 'No active semester'})
+    
+    try:
+        target = float(request.args.get('target', 75))
+        as_of = datetime.strptime(request.args['as_of'], '%Y-%m-%d').date() if 'as_of' in request.args else date.today()
+    except ValueError:
+        return jsonify({'error': 'Invalid target or as_of'}), 400
+    if not 0 <= target <= 100:
+        return jsonify({'error': 'Target must be between 0 and 100'}), 400
+    
+    subject_data, _ = get_semester_attendance(active_semester.id, target)
+    projections = get_semester_projection(active_semester, subject_data, as_of, target)
+    
+    return jsonify({
+        'semester': active_semester.name,
+        'as_of': as_of.isoformat(),
+        'target_percentage': target,
+        'subjects': [dict(
+            projections[subject_info['subject'].id],
+            subject_id=subject_info['subject'].id,
+            subject_code=subject_info['subject'].code,
+            subject_name=subject_info['subject'].name,
+            attended_lectures=subject_info['attended_lectures'],
+            total_lectures=subject_info['total_lectures'],
+            attendance_percentage=subject_info['attendance_percentage']
+        ) for subject_info in subject_data]
+    })
+
+def parse_percentage(value, name):
+    value = float(value)
+    if not 0 <= value <= 100:
+        raise ValueError(f'{name} must be between 0 and 100')
+    return value
+
+def parse_scenario(index, scenario, subject_ids):
+    if not isinstance(scenario, dict):
+        raise ValueError(f'Scenario {index} must be an object')
+    skip = {int(subject_id): int(count) for subject_id, count in (scenario.get('skip') or {}).items()}
+    rate = scenario.get('attend_rate', 1.0)
+    rates = {int(subject_id): float(value) for subject_id, value in rate.items()} if isinstance(rate, dict) else {}
+    default_rate = float(scenario.get('default_attend_rate', 1.0)) if isinstance(rate, dict) else float(rate)
+    unknown = (set(skip) | set(rates)) - subject_ids
+    if unknown:
+        raise ValueError(f'Scenario {index} names unknown subject {min(unknown)}')
+    if not all(0 <= value <= 1 for value in list(rates.values()) + [default_rate]):
+        raise ValueError(f'Scenario {index}: attend rates must be between 0 and 1')
+    return {'name': str(scenario.get('name', index)), 'skip': skip, 'attend_rate': rates, 'default_rate': default_rate}
+
+@bp.route('/api/planner', methods=['POST'])
+@login_required
+def api_planner():
+    """Skip plan for the rest of the active semester, plus what-if scenarios.
+
+    JSON body, every field optional: ``target`` (default minimum for each
+    subject, 75 unless only ``aggregate_target`` is given), ``targets``
+    (``{subject_id: percentage}``), ``aggregate_target`` (credit-weighted
+    mean of the final percentages), ``as_of`` (YYYY-MM-DD) and
+    ``scenarios``: a list of ``{"name", "skip": {subject_id: lectures},
+    "attend_rate": 0.9 or {subject_id: rate}, "default_attend_rate"}``
+    evaluated against the same targets.
+    """
+    active_semester = get_active_semester()
+    if not active_semester:
+        return jsonify({'error': 'No active semester'})
+    payload = request.get_json(silent=True)
+    if payload is None:
+        payload = {}
+    if not isinstance(payload, dict):
+        return jsonify({'error': 'Expected a JSON object'}), 400
+
+    subject_data, _ = get_semester_attendance(active_semester.id)
+    subject_ids = {info['subject'].id for info in subject_data}
+    try:
+        as_of = datetime.strptime(payload['as_of'], '%Y-%m-%d').date() if payload.get('as_of') else date.today()
+        aggregate_target = payload.get('aggregate_target')
+        if aggregate_target is not None:
+            aggregate_target = parse_percentage(aggregate_target, 'aggregate_target')
+        default_target = payload.get('target', 75 if aggregate_target is None else None)
+        if default_target is not None:
+            default_target = parse_percentage(default_target, 'target')
+        own_targets = {int(subject_id): parse_percentage(value, f'Target of subject {subject_id}')
+                       for subject_id, value in (payload.get('targets') or {}).items()}
+        if set(own_targets) - subject_ids:
+            raise ValueError(f'Unknown subject {min(set(own_targets) - subject_ids)}')
+        scenarios = payload.get('scenarios') or []
+        if not isinstance(scenarios, list) or len(scenarios) > PLANNER_MAX_SCENARIOS:
+            raise ValueError(f'scenarios must be a list of at most {PLANNER_MAX_SCENARIOS}')
+        scenarios = [parse_scenario(index, scenario, subject_ids) for index, scenario in enumerate(scenarios)]
+    except (TypeError, ValueError, AttributeError) as e:
+        return jsonify({'error': str(e)}), 400
+
+    projections = get_semester_projection(active_semester, subject_data, as_of)
+    index = get_occurrence_index(active_semester)
+    subjects = [{
+        'subject': info['subject'],
+        'credits': info['subject'].credits or 0,
+        'attended': info['attended_lectures'],
+        'total': info['total_lectures'],
+        'remaining': projections[info['subject'].id]['remaining_lectures'],
+        'source': projections[info['subject'].id]['source']
+    } for info in subject_data]
+    targets = [own_targets.get(subject['subject'].id, default_target) for subject in subjects]
+    skips, aggregate_reachable = plan_skips(subjects, targets, aggregate_target)
+
+    plan = []
+    for subject, target, skip in zip(subjects, targets, skips):
+        # Skip the last lectures, so the running percentage never dips below target on the way
+        dates = remaining_lecture_dates(index, subject['subject'].id, as_of) if subject['source'] == 'timetable' else None
+        percentage = final_percentage(subject['attended'], subject['total'], subject['remaining'], skip)
+        best = final_percentage(subject['attended'], subject['total'], subject['remaining'], 0)
+        plan.append({
+            'subject_id': subject['subject'].id,
+            'subject_code': subject['subject'].code,
+            'credits': subject['credits'],
+            'target_percentage': target,
+            'remaining_lectures': subject['remaining'],
+            'attend': subject['remaining'] - skip,
+            'skip': skip,
+            'skip_dates': [date.fromordinal(ordinal).isoformat() for ordinal in dates[len(dates) - skip:]] if dates and skip else [],
+            'target_reachable': target is None or best is None or best + 1e-9 >= target,
+            'final_percentage': round(percentage, 2) if percentage is not None else None
+        })
+    planned = evaluate_scenario(subjects, targets, aggregate_target, {
+        'name': 'plan', 'skip': {entry['subject_id']: entry['skip'] for entry in plan}, 'attend_rate': {}, 'default_rate': 1.0
+    })
+
+    return jsonify({
+        'semester': active_semester.name,
+        'as_of': as_of.isoformat(),
+        'aggregate_target': aggregate_target,
+        'aggregate_reachable': aggregate_reachable,
+        'plan': {
+            'subjects': plan,
+            'total_skips': sum(skips),
+            'aggregate_percentage': planned['aggregate_percentage']
+        },
+        'scenarios': [evaluate_scenario(subjects, targets, aggregate_target, scenario) for scenario in scenarios]
+    })
+
+@bp.route('/api/attendance_trends')
+@login_required
+@cached_per_user
+def api_attendance_trends():
+    """Cumulative and rolling attendance over time, per subject and overall.
+
+    Optional query parameters: ``semester_id`` (default the active
+    semester) and ``since`` (YYYY-MM-DD) to trim the series. Each series
+    has one point per day with attendance: the cumulative percentage, the
+    7- and 30-day rolling percentages and the streak of days on which
+    every lecture was attended.
+    """
+    semester_id = request.args.get('semester_id', type=int)
+    if semester_id:
+        semester = Semester.query.filter_by(id=semester_id, user_id=current_user.id).first_or_404()
+    else:
+        semester = get_active_semester()
+    if not semester:
+        return jsonify({'error': 'No active semester'})
+    try:
+        since = datetime.strptime(request.args['since'], '%Y-%m-%d').date() if 'since' in request.args else None
+    except ValueError:
+        return jsonify({'error': 'Invalid since date'}), 400
+    
+    subjects = Subject.query.filter_by(semester_id=semester.id).order_by(Subject.id).all()
+    series = get_trend_series(semester, subjects, current_data_version())
+    
+    return jsonify({
+        'semester': {'id': semester.id, 'name': semester.name},
+        'aggregate': trend_payload(series[None], since) if None in series else None,
+        'subjects': [dict(
+            trend_payload(series[subject.id], since),
+            subject_id=subject.id,
+            subject_code=subject.code,
+            subject_name=subject.name
+        ) for subject in subjects if subject.id in series]
+    })
+
+@bp.route('/api/attendance_data')
 @login_required
+@cached_per_user
 def api_attendance_data():
     """API endpoint for attendance data (for charts/graphs)"""
-    active_semester = Semester.query.filter_by(is_active=True, user_id=current_user.id).first()
+    active_semester = get_active_semester()
     if not active_semester:
         return jsonify({'error': 'No active semester'})
     
-    subjects = Subject.query.filter_by(semester_id=active_semester.id).all()
+    subject_data, aggregate_attendance = get_semester_attendance(active_semester.id)
     
     data = []
-    for subject in subjects:
-        attendance_percentage = calculate_attendance_percentage(subject.id)
+    for subject_info in subject_data:
         data.append({
-            'subject_name': subject.name,
-            'subject_code': subject.code,
-            'attendance_percentage': round(attendance_percentage, 2)
+            'subject_name': subject_info['subject'].name,
+            'subject_code': subject_info['subject'].code,
+            'attendance_percentage': subject_info['attendance_percentage']
         })
     
     return jsonify({
         'subjects': data,
-        'aggregate_attendance': round(calculate_aggregate_attendance(), 2)
+        'aggregate_attendance': aggregate_attendance
+    })
+
+@bp.route('/admin/analytics')
+@admin_required
+def admin_analytics():
+    """Cohort reports read from the latest analytics snapshot"""
+    run = latest_analytics_run()
+    if run is None:
+        return render_template('admin_analytics.html', run=None)
+    
+    semesters = SemesterSnapshot.query.filter_by(run_id=run.id).order_by(SemesterSnapshot.semester_name).all()
+    semester_name = request.args.get('semester') or (semesters[-1].semester_name if semesters else None)
+    codes = SubjectCodeSnapshot.query.filter_by(run_id=run.id, semester_name=semester_name).order_by(
+        SubjectCodeSnapshot.subject_code
+    ).all()
+    
+    page = max(request.args.get('page', 1, type=int), 1)
+    at_risk = AtRiskSnapshot.query.filter_by(run_id=run.id)
+    if request.args.get('code'):
+        at_risk = at_risk.filter_by(subject_code=request.args['code'])
+    at_risk_count = at_risk.count()
+    at_risk = at_risk.order_by(AtRiskSnapshot.max_percentage, AtRiskSnapshot.percentage, AtRiskSnapshot.id).offset(
+        (page - 1) * ANALYTICS_PAGE_SIZE
+    ).limit(ANALYTICS_PAGE_SIZE).all()
+    
+    return render_template('admin_analytics.html',
+                         run=run,
+                         semesters=semesters,
+                         semester_name=semester_name,
+                         codes=codes,
+                         histograms={code.id: json.loads(code.histogram) for code in codes},
+                         at_risk=at_risk,
+                         at_risk_count=at_risk_count,
+                         page=page,
+                         pages=max(math.ceil(at_risk_count / ANALYTICS_PAGE_SIZE), 1))
+
+@bp.route('/api/v1/sync/pull')
+@login_required
+def api_sync_pull():
+    """Changes to the user's semesters, subjects, slots and records since ``cursor``.
+
+    Without a cursor the whole dataset is returned. Rows are sent as lists
+    in the order given by ``fields``; pass the returned ``cursor`` back on
+    the next pull and keep pulling while ``more`` is true. When ``reset``
+    is true the client should discard its local copy first.
+    """
+    try:
+        cursor = request.args.get('cursor')
+        cursor = decode_sync_cursor(cursor) if cursor else None
+        limit = min(max(int(request.args.get('limit', SYNC_PAGE_SIZE)), 1), SYNC_PAGE_SIZE)
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor or limit'}), 400
+    
+    changes = pull_changes(current_user.id, cursor, limit)
+    payload = {kind: {'fields': SYNC_FIELDS[kind], 'rows': rows} for kind, rows in changes['rows'].items()}
+    payload.update(
+        cursor=encode_sync_cursor(changes['cursor']) if changes['cursor'] else None,
+        more=changes['more'],
+        reset=changes['reset']
+    )
+    return sync_response(payload)
+
+@bp.route('/api/v1/sync/push', methods=['POST'])
+@login_required
+def api_sync_push():
+    """Apply a batch of offline attendance edits.
+
+    Expects ``{"changes": [{"subject_id": 1, "date": "2024-01-15",
+    "lecture": 0, "attended": true, "notes": "", "base": 1705312800000000}]}``,
+    optionally gzip-compressed. ``base`` is the record version from the last
+    pull (null for records created offline); ``"deleted": true`` removes a
+    record. Edits to records changed on the server since ``base`` are
+    returned as conflicts with the server copy, unless ``"on_conflict":
+    "client"`` is given. Valid changes are applied even if others fail;
+    each applied change is reported as ``[index, id, version]``.
+    """
+    try:
+        payload = sync_request_json() or {}
+    except (ValueError, OSError, EOFError):
+        return jsonify({'error': 'Invalid request body'}), 400
+    changes = payload.get('changes') if isinstance(payload, dict) else None
+    if not isinstance(changes, list):
+        return jsonify({'error': 'Expected a JSON object with a "changes" list'}), 400
+    if len(changes) > SYNC_MAX_PUSH:
+        return jsonify({'error': f'At most {SYNC_MAX_PUSH} changes per request'}), 400
+    
+    applied, conflicts, errors = push_changes(current_user.id, changes, payload.get('on_conflict') == 'client')
+    if applied:
+        bump_data_version(current_user.id)
+    db.session.commit()
+    
+    # Return the new version of every applied record so the client can use it as the next base
+    versions = {}
+    keys = set(applied.values())
+    if keys:
+        dates = [key[1] for key in keys]
+        for record in AttendanceRecord.query.filter(
+            AttendanceRecord.subject_id.in_({key[0] for key in keys}),
+            AttendanceRecord.date.between(min(dates), max(dates))
+        ):
+            versions[(record.subject_id, record.date, record.lecture)] = (record.id, sync_version(record.updated_at))
+    
+    return sync_response({
+        'applied': [[index] + list(versions.get(key, (None, None))) for index, key in sorted(applied.items())],
+        'conflicts': conflicts,
+        'errors': errors
     })
 
 if __name__ == '__main__':
-    with app.app_context():
-        db.create_all()
+    # Development server only; production runs wsgi:app under gunicorn (see Procfile).
+    # Create the schema first with `flask --app app upgrade-db`.
+    app = create_app()
     # Get port from environment variable or default to 5001
     port = int(os.environ.get('PORT', 5001))
     # Use 0.0.0.0 for deployment, localhost for local development
     host = '0.0.0.0' if os.environ.get('PORT') else '127.0.0.1'
-    app.run(debug=True, host=host, port=port)
\ No newline at end of file
+    app.run(debug=os.environ.get('FLASK_DEBUG') == '1', host=host, port=port)
\ No newline at end of file
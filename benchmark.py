@@ -0,0 +1,276 @@
+"""Reproducible route benchmarks and a concurrent load driver.
+
+Usage:
+    python benchmark.py                          # seed a temporary SQLite DB and benchmark it
+    python benchmark.py --users 1000 --days 120  # larger synthetic dataset
+    python benchmark.py --database-url sqlite:///attendance.db --user-prefix user
+    python benchmark.py --url http://127.0.0.1:5001 --concurrency 16   # drive a running server
+    python benchmark.py --compare bench_results/old.json
+
+Every route is timed through the Flask test client (or over HTTP with --url)
+and reports p50/p95/p99 latency, throughput and SQL queries per request.
+Query counts come from the Server-Timing header, so remote servers need
+METRICS_ENABLED=1. Results are written as JSON, tagged with the current git
+commit, so runs can be compared across commits.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import HTTPCookieProcessor, build_opener
+
+ROUTES = ['index', 'mark_attendance', 'mark_attendance_week', 'save_attendance', 'attendance_report',
+          'api_attendance_data', 'view_timetable']
+QUERY_COUNT = re.compile(r'desc="(\d+) queries"')
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of an unsorted list"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(int(round(pct / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def summarize(latencies, queries, elapsed):
+    return {
+        'requests': len(latencies),
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'queries_mean': round(sum(queries) / len(queries), 2) if queries else None,
+        'queries_max': max(queries) if queries else None
+    }
+
+
+class TestClientSession:
+    """Logged-in session against the app in this process"""
+
+    def __init__(self, app, username, password):
+        self.client = app.test_client()
+        self.request('POST', '/login', {'username': username, 'password': password})
+
+    def request(self, method, path, data=None):
+        response = self.client.open(path, method=method, data=data)
+        return response.status_code, response.headers.get('Server-Timing', '')
+
+
+class HTTPSession:
+    """Logged-in session against a running server"""
+
+    def __init__(self, base_url, username, password):
+        self.base_url = base_url.rstrip('/')
+        self.opener = build_opener(HTTPCookieProcessor(CookieJar()))
+        self.request('POST', '/login', {'username': username, 'password': password})
+
+    def request(self, method, path, data=None):
+        body = urlencode(data, doseq=True).encode() if data is not None else None
+        try:
+            with self.opener.open(self.base_url + path, data=body if method == 'POST' else None) as response:
+                response.read()
+                return response.status, response.headers.get('Server-Timing', '')
+        except HTTPError as e:
+            return e.code, e.headers.get('Server-Timing', '')
+
+
+def route_request(route, user, rng):
+    """Method, path and form data exercising one route for a user"""
+    day = (user['start_date'] + timedelta(days=rng.randrange(user['days']))).isoformat()
+    if route == 'save_attendance':
+        keys = [f'{day}:{subject_id}:0' for subject_id in user['subject_ids']]
+        data = {'date': day, 'lectures': keys}
+        for key in keys:
+            if rng.random() < 0.8:
+                data[f'attended_{key}'] = 'on'
+        return 'POST', '/save_attendance', data
+    paths = {
+        'index': '/',
+        'mark_attendance': f'/attendance?date={day}',
+        'mark_attendance_week': f'/attendance/week?start={day}',
+        'attendance_report': '/attendance_report',
+        'api_attendance_data': '/api/attendance_data',
+        'view_timetable': '/timetable'
+    }
+    return 'GET', paths[route], None
+
+
+def timed_request(session, route, user, rng):
+    method, path, data = route_request(route, user, rng)
+    started = time.perf_counter()
+    status, server_timing = session.request(method, path, data)
+    latency = time.perf_counter() - started
+    match = QUERY_COUNT.search(server_timing)
+    return status, latency, int(match.group(1)) if match else None
+
+
+def run_routes(sessions, users, requests_per_route, rng):
+    """Time each route sequentially, rotating through the logged-in users"""
+    results = {}
+    for route in ROUTES:
+        latencies, queries, errors = [], [], 0
+        started = time.perf_counter()
+        for i in range(requests_per_route):
+            status, latency, query_count = timed_request(sessions[i % len(sessions)], route, users[i % len(users)], rng)
+            errors += status >= 400
+            latencies.append(latency)
+            if query_count is not None:
+                queries.append(query_count)
+        results[route] = dict(summarize(latencies, queries, time.perf_counter() - started), errors=errors)
+        print(f"{route:22} p50 {results[route]['p50_ms']:8.2f}ms  p95 {results[route]['p95_ms']:8.2f}ms  "
+              f"p99 {results[route]['p99_ms']:8.2f}ms  {results[route]['throughput_rps']:8.1f} req/s  "
+              f"queries {results[route]['queries_mean']}")
+    return results
+
+
+def run_load(sessions, users, concurrency, duration, seed):
+    """Hammer a random mix of routes from ``concurrency`` threads for ``duration`` seconds"""
+    latencies, queries = [], []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(index):
+        rng = random.Random(seed + index)
+        session, user = sessions[index % len(sessions)], users[index % len(users)]
+        while time.perf_counter() < deadline:
+            status, latency, query_count = timed_request(session, rng.choice(ROUTES), user, rng)
+            with lock:
+                latencies.append(latency)
+                errors[0] += status >= 400
+                if query_count is not None:
+                    queries.append(query_count)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    result = dict(summarize(latencies, queries, time.perf_counter() - started), errors=errors[0], concurrency=concurrency)
+    print(f"load x{concurrency:<3}              p50 {result['p50_ms']:8.2f}ms  p95 {result['p95_ms']:8.2f}ms  "
+          f"p99 {result['p99_ms']:8.2f}ms  {result['throughput_rps']:8.1f} req/s")
+    return result
+
+
+def load_users(app, count, user_prefix, days):
+    """Usernames, active-semester subject ids and date range of ``count`` seeded users"""
+    from app import db, User, Semester, Subject
+
+    with app.app_context():
+        rows = db.session.query(User.username, Semester.start_date, Semester.id).join(Semester).filter(
+            Semester.is_active == True, User.username.like(f'{user_prefix}%')
+        ).order_by(User.id).limit(count).all()
+        subjects = {}
+        for subject_id, semester_id in db.session.query(Subject.id, Subject.semester_id).filter(
+            Subject.semester_id.in_([row[2] for row in rows])
+        ):
+            subjects.setdefault(semester_id, []).append(subject_id)
+        return [{'username': username, 'start_date': start_date, 'days': days,
+                 'subject_ids': subjects.get(semester_id, [])} for username, start_date, semester_id in rows]
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(current, previous_path):
+    with open(previous_path) as f:
+        previous = json.load(f)
+    print(f"\nChange vs {previous['meta'].get('commit')} ({previous_path}):")
+    for route, stats in current['routes'].items():
+        old = previous['routes'].get(route)
+        if not old:
+            continue
+        changes = []
+        for key in ('p50_ms', 'p95_ms', 'queries_mean'):
+            if old.get(key) and stats.get(key) is not None:
+                changes.append(f'{key} {(stats[key] - old[key]) / old[key] * 100:+.1f}%')
+        print(f"{route:22} {'  '.join(changes)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help='benchmark a running server instead of an in-process app')
+    parser.add_argument('--database-url', help='existing database to benchmark (defaults to a fresh seeded SQLite file)')
+    parser.add_argument('--user-prefix', default='user', help='username prefix of seeded users to log in as')
+    parser.add_argument('--users', type=int, default=50, help='users to seed into the temporary database')
+    parser.add_argument('--subjects', type=int, default=8)
+    parser.add_argument('--days', type=int, default=120)
+    parser.add_argument('--sessions', type=int, default=10, help='distinct logged-in users to rotate through')
+    parser.add_argument('--requests', type=int, default=200, help='requests per route')
+    parser.add_argument('--concurrency', type=int, default=8, help='threads for the load phase (0 to skip)')
+    parser.add_argument('--duration', type=float, default=10, help='seconds for the load phase')
+    parser.add_argument('--no-cache', action='store_true', help='disable the response cache')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='JSON results path (default bench_results/<timestamp>-<commit>.json)')
+    parser.add_argument('--compare', help='previous results JSON to compare against')
+    args = parser.parse_args()
+
+    if not args.database_url:
+        args.database_url = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'benchmark.db')
+    os.environ['DATABASE_URL'] = args.database_url
+
+    from app import create_app, db, User
+    from seed import PASSWORD, seed_database
+
+    app = create_app({'METRICS_ENABLED': True, 'RESPONSE_CACHE_SIZE': 0 if args.no_cache else 1024})
+    with app.app_context():
+        db.create_all()
+        if not db.session.query(User.id).first():
+            print(f'Seeding {args.users} users x {args.subjects} subjects x {args.days} days...')
+            seed_database(args.users, args.subjects, args.days, seed=args.seed)
+
+    users = load_users(app, args.sessions, args.user_prefix, args.days)
+    if not users:
+        parser.error(f'no users named {args.user_prefix}* with an active semester in {args.database_url}')
+    if args.url:
+        sessions = [HTTPSession(args.url, user['username'], PASSWORD) for user in users]
+    else:
+        sessions = [TestClientSession(app, user['username'], PASSWORD) for user in users]
+
+    rng = random.Random(args.seed)
+    results = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+            'python': platform.python_version(),
+            'target': args.url or 'in-process',
+            'database': args.database_url.split('@')[-1],
+            'scale': {'users': args.users, 'subjects': args.subjects, 'days': args.days},
+            'response_cache': not args.no_cache,
+            'requests_per_route': args.requests
+        },
+        'routes': run_routes(sessions, users, args.requests, rng)
+    }
+    if args.concurrency:
+        results['load'] = run_load(sessions, users, args.concurrency, args.duration, args.seed)
+
+    output = args.output or os.path.join(
+        'bench_results', f"{date.today().isoformat()}-{results['meta']['commit'] or 'unknown'}.json"
+    )
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'\nResults written to {output}')
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""Gunicorn settings for running wsgi:app with several workers.
+
+Every value can be tuned from the environment; run ``flask --app wsgi
+upgrade-db`` once before starting the workers.
+"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5001')}"
+
+# Processes x threads; gthread workers keep serving while one thread waits on the database
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+worker_class = 'gthread'
+
+# Import the app once in the master so workers fork with it already loaded
+preload_app = True
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+# Time workers get to finish in-flight requests on SIGTERM/SIGHUP reloads
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = 5
+
+# Recycle workers periodically to cap memory growth; jitter avoids restarting them all at once
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 100))
+
+# Seconds an exiting worker waits for its background jobs before requeueing them
+JOB_EXIT_TIMEOUT = float(os.environ.get('JOB_EXIT_TIMEOUT', 10))
+
+accesslog = '-'
+errorlog = '-'
+
+
+def post_fork(server, worker):
+    """Give each worker its own connection pool instead of the master's"""
+    from app import db
+    from wsgi import app
+
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+
+def worker_exit(server, worker):
+    """Stop the embedded job threads of a recycled or stopped worker.
+
+    The threads die with the process, so jobs they have not finished
+    within JOB_EXIT_TIMEOUT seconds are put back in the queue for another
+    worker instead of staying in running until cleanup times them out.
+    """
+    from wsgi import app
+
+    job_worker = app.extensions.get('job_worker')
+    if job_worker is not None and job_worker.pid == os.getpid():
+        job_worker.stop(JOB_EXIT_TIMEOUT)
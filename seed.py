@@ -0,0 +1,146 @@
+"""Populate a database with synthetic users, semesters, timetables and attendance.
+
+Usage:
+    python seed.py --users 10000 --subjects 8 --days 120
+
+Every generated user has the password ``password`` and the username
+``user<N>``. Rows are written with bulk inserts in batches, and the
+attendance counters are filled in directly, so large datasets take seconds
+rather than hours. The target database comes from DATABASE_URL, as for the app.
+"""
+import argparse
+import random
+import time
+from datetime import date, datetime, time as dt_time, timedelta
+
+from werkzeug.security import generate_password_hash
+
+from app import (create_app, db, User, Semester, Subject, TimetableSlot, AttendanceRecord,
+                 SubjectStats, SemesterStats, UPSERT_CHUNK_SIZE)
+
+PASSWORD = 'password'
+SUBJECT_NAMES = [
+    'Mathematics', 'Physics', 'Chemistry', 'Data Structures', 'Algorithms', 'Operating Systems',
+    'Databases', 'Computer Networks', 'Compilers', 'Machine Learning', 'Statistics', 'Economics'
+]
+
+
+def insert_rows(model, rows):
+    """Bulk insert plain dicts in chunks that stay under SQLite's parameter limit"""
+    table = model.__table__
+    for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+        db.session.execute(table.insert(), rows[start:start + UPSERT_CHUNK_SIZE])
+
+
+def next_id(model):
+    return (db.session.query(db.func.max(model.id)).scalar() or 0) + 1
+
+
+def seed_database(users=100, subjects=8, days=120, slots_per_subject=3, attendance_rate=0.8,
+                  past_semesters=0, batch_size=200, seed=None, progress=None):
+    """Generate ``users`` users, each with an active semester of ``subjects`` subjects.
+
+    Each subject gets ``slots_per_subject`` weekly slots and one attendance
+    record per day for the last ``days`` days. ``past_semesters`` adds
+    inactive semesters of the same shape before the active one. Must be
+    called inside an application context. Returns the number of rows written.
+    """
+    rng = random.Random(seed)
+    # Hashing is deliberately slow; every synthetic user shares one hash
+    password_hash = generate_password_hash(PASSWORD)
+    today = date.today()
+    user_id, semester_id, subject_id = next_id(User), next_id(Semester), next_id(Subject)
+    first_user = user_id
+    written = 0
+
+    while user_id < first_user + users:
+        batch = {model: [] for model in (User, Semester, SemesterStats, Subject, SubjectStats,
+                                         TimetableSlot, AttendanceRecord)}
+        for _ in range(min(batch_size, first_user + users - user_id)):
+            batch[User].append({
+                'id': user_id, 'username': f'user{user_id}', 'email': f'user{user_id}@example.com',
+                'password_hash': password_hash, 'created_at': datetime.utcnow(), 'data_version': 0
+            })
+            for term in range(past_semesters, -1, -1):
+                end_date = today - timedelta(days=term * (days + 30))
+                start_date = end_date - timedelta(days=days - 1)
+                if term == 0:
+                    end_date = start_date + timedelta(days=days + 30)
+                batch[Semester].append({
+                    'id': semester_id, 'name': f'Semester {past_semesters - term + 1}',
+                    'start_date': start_date, 'end_date': end_date, 'is_active': term == 0,
+                    'user_id': user_id, 'schedule_version': 0
+                })
+                semester_attended = semester_total = 0
+
+                for index in range(subjects):
+                    name = SUBJECT_NAMES[index % len(SUBJECT_NAMES)]
+                    batch[Subject].append({
+                        'id': subject_id, 'name': name, 'code': f'{name[:3].upper()}{100 + index}',
+                        'credits': rng.choice((2, 3, 4)), 'total_lectures': days // 2, 'semester_id': semester_id
+                    })
+                    for slot in range(slots_per_subject):
+                        hour = 8 + (index + slot * 3) % 10
+                        batch[TimetableSlot].append({
+                            'subject_id': subject_id, 'day_of_week': (index + slot * 2) % 5,
+                            'start_time': dt_time(hour), 'end_time': dt_time(hour + 1), 'room': f'Room {100 + index}'
+                        })
+
+                    # Each subject drifts around the overall rate so some fall below 75%
+                    rate = min(max(rng.gauss(attendance_rate, 0.1), 0.0), 1.0)
+                    attended = 0
+                    for offset in range(days):
+                        present = rng.random() < rate
+                        attended += present
+                        batch[AttendanceRecord].append({
+                            'subject_id': subject_id, 'date': start_date + timedelta(days=offset), 'lecture': 0,
+                            'attended': present, 'notes': '', 'created_at': datetime.utcnow()
+                        })
+                    batch[SubjectStats].append({'subject_id': subject_id, 'attended': attended, 'total': days})
+                    semester_attended += attended
+                    semester_total += days
+                    subject_id += 1
+
+                batch[SemesterStats].append({
+                    'semester_id': semester_id, 'attended': semester_attended, 'total': semester_total
+                })
+                semester_id += 1
+            user_id += 1
+
+        for model, rows in batch.items():
+            insert_rows(model, rows)
+            written += len(rows)
+        db.session.commit()
+        if progress:
+            progress(user_id - first_user, users, written)
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--subjects', type=int, default=8, help='subjects per semester')
+    parser.add_argument('--days', type=int, default=120, help='days of attendance per subject')
+    parser.add_argument('--slots', type=int, default=3, help='weekly timetable slots per subject')
+    parser.add_argument('--attendance-rate', type=float, default=0.8)
+    parser.add_argument('--past-semesters', type=int, default=0, help='inactive semesters per user')
+    parser.add_argument('--batch-size', type=int, default=200, help='users per transaction')
+    parser.add_argument('--seed', type=int, default=None, help='random seed for reproducible data')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        started = time.perf_counter()
+
+        def report(done, total, rows):
+            elapsed = time.perf_counter() - started
+            print(f'{done}/{total} users, {rows} rows, {rows / elapsed:,.0f} rows/s', flush=True)
+
+        rows = seed_database(args.users, args.subjects, args.days, args.slots, args.attendance_rate,
+                             args.past_semesters, args.batch_size, args.seed, report)
+        print(f'Wrote {rows} rows in {time.perf_counter() - started:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+import pytest
+
+import app as attendance
+from app import Semester, Subject, create_app, db
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(tmp_path / 'attendance.db'),
+        'JOB_WORKERS': 0,
+        'COMPRESS_RESPONSES': False,
+        'USER_CACHE_SECONDS': 0,
+    })
+    with app.app_context():
+        db.create_all()
+    # Per-process caches are keyed by row ids, which every test database hands out again
+    attendance._occurrence_cache.clear()
+    attendance._trend_cache.clear()
+    return app
+
+
+@pytest.fixture
+def client(app):
+    """A test client logged in as a new user"""
+    client = app.test_client()
+    client.post('/register', data={'username': 'student', 'email': 'student@example.com', 'password': 'secret'})
+    client.post('/login', data={'username': 'student', 'password': 'secret'})
+    return client
+
+
+@pytest.fixture
+def add_semester(app, client):
+    """Create an active semester with the given subjects (code -> weekdays of its slots); returns their ids"""
+    def add(name, start_date, end_date, subjects):
+        client.post('/add_semester', data={'name': name, 'start_date': start_date, 'end_date': end_date,
+                                           'is_active': '1'})
+        for code in subjects:
+            client.post('/add_subject', data={'name': f'Subject {code}', 'code': code, 'credits': '3',
+                                              'total_lectures': '40'})
+        with app.app_context():
+            ids = {subject.code: subject.id for subject in Subject.query.join(Semester).filter(Semester.name == name)}
+        for code, weekdays in subjects.items():
+            for weekday in weekdays:
+                client.post('/add_timetable_slot', data={'subject_id': ids[code], 'day_of_week': str(weekday),
+                                                         'start_time': '09:00', 'end_time': '10:00', 'room': ''})
+        # Render the flash messages left by the forms
+        client.get('/semesters')
+        return ids
+    return add
@@ -0,0 +1,78 @@
+import pytest
+
+from app import (AttendanceArchive, AttendanceRecord, Semester, SubjectStats, archive_semester, db,
+                 pack_ids, rebuild_stats, restore_semester, unpack_ids)
+
+
+@pytest.mark.parametrize('ids', [[], [1], [5, 6, 7, 9, 200], [300, 12, 12, 70000, 3, 2 ** 40]])
+def test_ids_round_trip(ids):
+    assert unpack_ids(pack_ids(ids)) == ids
+
+
+def live_records(subject_ids):
+    return sorted(
+        (record.id, record.subject_id, record.date, record.lecture, record.attended, record.notes or '')
+        for record in AttendanceRecord.query.filter(AttendanceRecord.subject_id.in_(subject_ids))
+    )
+
+
+def counters(subject_ids):
+    return sorted((stats.subject_id, stats.attended, stats.total)
+                  for stats in SubjectStats.query.filter(SubjectStats.subject_id.in_(subject_ids)))
+
+
+def test_archive_and_restore_give_back_the_same_records(app, client, add_semester):
+    ids = add_semester('Autumn', '2024-01-01', '2024-01-31', {'A': [0, 2], 'B': [4]})
+    records = [
+        # Timetabled lectures, some with notes
+        {'subject_id': ids['A'], 'date': '2024-01-01', 'attended': True},
+        {'subject_id': ids['A'], 'date': '2024-01-03', 'attended': False, 'notes': 'sick'},
+        {'subject_id': ids['A'], 'date': '2024-01-29', 'attended': True, 'notes': 'ünïcode'},
+        {'subject_id': ids['B'], 'date': '2024-01-05', 'attended': False},
+        {'subject_id': ids['B'], 'date': '2024-01-12', 'attended': True},
+        # Off the timetable: a Saturday, and a second lecture on a Monday
+        {'subject_id': ids['A'], 'date': '2024-01-06', 'attended': True, 'notes': 'extra class'},
+        {'subject_id': ids['A'], 'date': '2024-01-08', 'lecture': 1, 'attended': False},
+    ]
+    assert client.post('/api/attendance/bulk', json={'records': records}).status_code == 200
+    # A newer semester takes over, so this one can be archived
+    add_semester('Spring', '2024-02-01', '2024-05-31', {})
+
+    with app.app_context():
+        subject_ids = list(ids.values())
+        semester = Semester.query.filter_by(name='Autumn').one()
+        before, stats = live_records(subject_ids), counters(subject_ids)
+
+        assert archive_semester(semester) == len(records)
+        db.session.commit()
+        assert live_records(subject_ids) == []
+        assert AttendanceArchive.query.count() == 2
+        assert counters(subject_ids) == stats
+        assert rebuild_stats(fix=False) == []
+
+        assert restore_semester(semester) == len(records)
+        db.session.commit()
+        assert live_records(subject_ids) == before
+        assert AttendanceArchive.query.count() == 0
+        assert semester.archived_at is None
+        assert counters(subject_ids) == stats
+        assert rebuild_stats(fix=False) == []
+
+
+def test_archived_records_are_exported_and_listed(app, client, add_semester):
+    ids = add_semester('Autumn', '2024-01-01', '2024-01-31', {'A': [0]})
+    client.post('/api/attendance/bulk', json={'records': [
+        {'subject_id': ids['A'], 'date': f'2024-01-{day:02d}', 'attended': day != 15, 'notes': 'n' if day == 8 else ''}
+        for day in (1, 8, 15, 22, 29)
+    ]})
+    history = client.get(f"/api/subjects/{ids['A']}/history").get_json()['records']
+    export = client.get('/export/attendance.csv').get_data(as_text=True)
+    add_semester('Spring', '2024-02-01', '2024-05-31', {})
+
+    with app.app_context():
+        semester_id = Semester.query.filter_by(name='Autumn').one().id
+    assert client.post(f'/archive_semester/{semester_id}').status_code == 302
+    archived = client.get(f"/api/subjects/{ids['A']}/history").get_json()
+    assert archived['archived'] is True
+    assert archived['records'] == history
+    assert client.get('/export/attendance.csv').get_data(as_text=True) == export
@@ -0,0 +1,20 @@
+from app import User
+
+
+def data_version(app):
+    with app.app_context():
+        return User.query.filter_by(username='student').one().data_version
+
+
+def test_only_writes_bump_the_data_version(app, client, add_semester):
+    ids = add_semester('Spring', '2024-01-01', '2024-05-31', {'A': [0]})
+    before = data_version(app)
+
+    response = client.post('/api/attendance/bulk', json={'records': []})
+    assert response.get_json() == {'inserted': 0, 'updated': 0}
+    assert data_version(app) == before
+
+    client.post('/api/attendance/bulk', json={'records': [
+        {'subject_id': ids['A'], 'date': '2024-01-01', 'attended': True},
+    ]})
+    assert data_version(app) > before
@@ -0,0 +1,105 @@
+import pytest
+
+from app import plan_skips
+
+
+@pytest.fixture
+def subjects(client, add_semester):
+    """Four weeks of lectures: A on Mondays and Wednesdays, B on Fridays, with the first two weeks marked.
+
+    As of 2024-01-14, A has attended 4 of 4 with 4 lectures left and B 1 of 2 with 2 left.
+    """
+    ids = add_semester('January', '2024-01-01', '2024-01-28', {'A': [0, 2], 'B': [4]})
+    response = client.post('/api/attendance/bulk', json={'records': [
+        {'subject_id': ids['A'], 'date': day, 'attended': True}
+        for day in ('2024-01-01', '2024-01-03', '2024-01-08', '2024-01-10')
+    ] + [
+        {'subject_id': ids['B'], 'date': '2024-01-05', 'attended': True},
+        {'subject_id': ids['B'], 'date': '2024-01-12', 'attended': False},
+    ]})
+    assert response.status_code == 200
+    return ids
+
+
+def plan(client, **body):
+    response = client.post('/api/planner', json=dict(body, as_of='2024-01-14'))
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def by_code(result, ids):
+    entries = {entry['subject_id']: entry for entry in result['plan']['subjects']}
+    return {code: entries[subject_id] for code, subject_id in ids.items()}
+
+
+def test_default_target_skips_the_last_lectures(client, subjects):
+    result = by_code(plan(client), subjects)
+    assert result['A']['remaining_lectures'] == 4
+    assert (result['A']['skip'], result['A']['final_percentage']) == (2, 75.0)
+    assert result['A']['skip_dates'] == ['2024-01-22', '2024-01-24']
+    assert (result['B']['skip'], result['B']['skip_dates']) == (0, [])
+
+
+def test_per_subject_targets(client, subjects):
+    result = by_code(plan(client, target=75, targets={str(subjects['B']): 50}), subjects)
+    assert result['A']['skip'] == 2
+    assert (result['B']['skip'], result['B']['skip_dates'], result['B']['final_percentage']) == (1, ['2024-01-26'], 50.0)
+
+
+def test_running_percentage_never_dips_below_target(client, subjects):
+    entry = by_code(plan(client), subjects)['A']
+    remaining = ['2024-01-15', '2024-01-17', '2024-01-22', '2024-01-24']
+    attended, total = 4, 4
+    for day in remaining:
+        total += 1
+        attended += day not in entry['skip_dates']
+        assert attended / total * 100 >= entry['target_percentage']
+
+
+def test_aggregate_target_takes_the_cheapest_skips(client, subjects):
+    result = plan(client, aggregate_target=80)
+    entries = by_code(result, subjects)
+    # A skip of A (8 lectures in all) costs half as much of the mean as one of B (4 lectures)
+    assert (entries['A']['skip'], entries['B']['skip']) == (1, 0)
+    assert result['aggregate_reachable'] is True
+    assert result['plan']['aggregate_percentage'] == 81.25
+
+
+def test_scenarios_are_evaluated_against_the_targets(client, subjects):
+    result = plan(client, scenarios=[
+        {'name': 'skip all of A', 'skip': {str(subjects['A']): 4}},
+        {'name': 'attend half', 'attend_rate': 0.5},
+    ])
+    skip_all, half = result['scenarios']
+    assert [subject['final_percentage'] for subject in skip_all['subjects']] == [50.0, 75.0]
+    assert skip_all['all_targets_met'] is False
+    assert [subject['skipped'] for subject in half['subjects']] == [2, 1]
+    assert [subject['meets_target'] for subject in half['subjects']] == [True, False]
+
+
+def test_plan_skips_caps_each_subject_at_its_target():
+    subjects = [{'attended': 8, 'total': 10, 'remaining': 10, 'credits': 4}]
+    assert plan_skips(subjects, [75]) == ([3], True)
+    assert plan_skips(subjects, [None]) == ([10], True)
+    assert plan_skips(subjects, [100]) == ([0], True)
+
+
+def test_plan_skips_spends_the_aggregate_budget_on_cheap_subjects_first():
+    subjects = [
+        {'attended': 10, 'total': 10, 'remaining': 10, 'credits': 4},
+        {'attended': 10, 'total': 10, 'remaining': 10, 'credits': 2},
+    ]
+    skips, reachable = plan_skips(subjects, [None, None], aggregate_target=75)
+    assert (skips, reachable) == ([2, 10], True)
+    # One more skip of the first subject would take the weighted mean below 75
+    assert (4 * 85 + 2 * 50) / 6 < 75 <= (4 * 90 + 2 * 50) / 6
+
+
+def test_plan_skips_reports_an_unreachable_aggregate():
+    subjects = [
+        {'attended': 5, 'total': 10, 'remaining': 2, 'credits': 3},
+        # No credits: skipping it never moves the weighted mean
+        {'attended': 0, 'total': 0, 'remaining': 4, 'credits': 0},
+    ]
+    assert plan_skips(subjects, [None, None], aggregate_target=90) == ([0, 4], False)
+
@@ -0,0 +1,76 @@
+"""The dashboard, report and chart data must not run more queries as a user adds subjects."""
+import pytest
+from sqlalchemy import event
+
+from app import Semester, Subject, User, create_app, db
+
+PAGES = ['/', '/attendance_report', '/api/attendance_data']
+
+
+@pytest.fixture(scope='module')
+def app(tmp_path_factory):
+    url = 'sqlite:///' + str(tmp_path_factory.mktemp('db') / 'attendance.db')
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': url,
+        'JOB_WORKERS': 0,
+        'COMPRESS_RESPONSES': False,
+        # Every request loads the user, as it does after a cached copy expires
+        'USER_CACHE_SECONDS': 0,
+    })
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def user_with_subjects(app, username, subjects):
+    """Log a new user in with an active semester of ``subjects`` subjects, each with a slot and records"""
+    client = app.test_client()
+    client.post('/register', data={'username': username, 'email': f'{username}@example.com', 'password': 'secret'})
+    client.post('/login', data={'username': username, 'password': 'secret'})
+    client.post('/add_semester', data={'name': 'Spring', 'start_date': '2024-01-01', 'end_date': '2024-05-31',
+                                       'is_active': '1'})
+    for index in range(subjects):
+        client.post('/add_subject', data={'name': f'Subject {index}', 'code': f'S{index}', 'credits': '3',
+                                          'total_lectures': '40'})
+    with app.app_context():
+        subject_ids = [subject_id for (subject_id,) in db.session.query(Subject.id).join(Semester).join(User).filter(
+            User.username == username
+        ).order_by(Subject.id)]
+    assert len(subject_ids) == subjects
+    records = []
+    for index, subject_id in enumerate(subject_ids):
+        client.post('/add_timetable_slot', data={'subject_id': subject_id, 'day_of_week': str(index % 5),
+                                                 'start_time': '09:00', 'end_time': '10:00', 'room': 'A1'})
+        records += [{'subject_id': subject_id, 'date': f'2024-02-{day:02d}', 'attended': day % 3 != 0}
+                    for day in range(1, 21)]
+    response = client.post('/api/attendance/bulk', json={'records': records})
+    assert response.status_code == 200
+    # Render the flash messages left by the forms, so the pages below are served normally
+    client.get('/semesters')
+    return client
+
+
+def count_queries(app, client, url):
+    queries = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        queries.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        response = client.get(url)
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+    assert response.status_code == 200
+    return len(queries)
+
+
+@pytest.mark.parametrize('url', PAGES)
+def test_query_count_does_not_grow_with_subjects(app, url):
+    name = url.strip('/').replace('/', '-') or 'index'
+    one = count_queries(app, user_with_subjects(app, f'{name}-one', 1), url)
+    many = count_queries(app, user_with_subjects(app, f'{name}-many', 8), url)
+    assert many == one
@@ -0,0 +1,107 @@
+import pytest
+
+import app as attendance
+
+
+@pytest.fixture
+def records(client, add_semester, monkeypatch):
+    """Three subjects with twenty saved lectures each; pulls see writes at once"""
+    monkeypatch.setattr(attendance, 'SYNC_SETTLE_SECONDS', 0)
+    ids = add_semester('Spring', '2024-01-01', '2024-05-31', {'A': [0], 'B': [2], 'C': [4]})
+    response = client.post('/api/attendance/bulk', json={'records': [
+        {'subject_id': subject_id, 'date': f'2024-02-{day:02d}', 'attended': day % 2 == 0}
+        for subject_id in ids.values() for day in range(1, 21)
+    ]})
+    assert response.status_code == 200
+    return ids
+
+
+def pull(client, cursor=None, limit=None):
+    query = {key: value for key, value in (('cursor', cursor), ('limit', limit)) if value is not None}
+    response = client.get('/api/v1/sync/pull', query_string=query)
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def server_record(client, subject_id, record_date):
+    rows = pull(client)['records']['rows']
+    return next(row for row in rows if row[1] == subject_id and row[2] == record_date)
+
+
+def push(client, changes, **options):
+    response = client.post('/api/v1/sync/push', json=dict(options, changes=changes))
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_change_with_current_base_applies(client, records):
+    record = server_record(client, records['A'], '2024-02-01')
+    result = push(client, [{'subject_id': records['A'], 'date': '2024-02-01', 'attended': True, 'base': record[6]}])
+    assert [entry[0] for entry in result['applied']] == [0]
+    assert result['conflicts'] == []
+    assert server_record(client, records['A'], '2024-02-01')[4] is True
+
+
+def test_stale_base_returns_conflict_with_server_copy(client, records):
+    record = server_record(client, records['A'], '2024-02-01')
+    result = push(client, [{'subject_id': records['A'], 'date': '2024-02-01', 'attended': True, 'base': record[6] - 1}])
+    assert result['applied'] == []
+    assert result['conflicts'] == [{'index': 0, 'server': record}]
+    assert server_record(client, records['A'], '2024-02-01') == record
+
+
+def test_client_wins_overrides_stale_base(client, records):
+    record = server_record(client, records['A'], '2024-02-01')
+    result = push(client, [{'subject_id': records['A'], 'date': '2024-02-01', 'attended': True, 'notes': 'phone',
+                            'base': record[6] - 1}], on_conflict='client')
+    assert result['conflicts'] == []
+    assert server_record(client, records['A'], '2024-02-01')[4:6] == [True, 'phone']
+
+
+def test_deleted_record_reaches_pull_as_tombstone(client, records):
+    cursor = pull(client)['cursor']
+    record = server_record(client, records['B'], '2024-02-02')
+    result = push(client, [{'subject_id': records['B'], 'date': '2024-02-02', 'deleted': True, 'base': record[6]}])
+    assert result['conflicts'] == []
+
+    delta = pull(client, cursor)
+    assert delta['deleted']['rows'] == [['records', record[0]]]
+    assert 'records' not in delta
+    assert all(row[0] != record[0] for row in pull(client)['records']['rows'])
+
+
+def test_old_cursor_resets_to_full_snapshot(client, records):
+    full = pull(client)
+    delta = pull(client, '1:0:0')
+    assert delta['reset'] is True
+    assert delta['records']['rows'] == full['records']['rows']
+    assert 'deleted' not in delta
+
+
+def test_pages_split_rows_sharing_a_timestamp(client, records):
+    # The bulk save stamps all sixty records with the same time, so pages break ties by kind and id
+    seen, cursor, pages = [], None, 0
+    while True:
+        page = pull(client, cursor, limit=7)
+        seen += [(kind, row[0]) for kind, body in page.items() if isinstance(body, dict) for row in body['rows']]
+        cursor, pages = page['cursor'], pages + 1
+        if not page['more']:
+            break
+    full = pull(client)
+    expected = [(kind, row[0]) for kind, body in full.items() if isinstance(body, dict) for row in body['rows']]
+    assert pages > 1
+    assert len(seen) == len(set(seen))
+    assert sorted(seen) == sorted(expected)
+    assert pull(client, cursor).keys() == {'cursor', 'more', 'reset', 'v'}
+
+
+def test_recent_changes_wait_for_the_settle_window(client, records, monkeypatch):
+    monkeypatch.setattr(attendance, 'SYNC_SETTLE_SECONDS', 3600)
+    assert 'records' not in pull(client)
+
+
+@pytest.mark.parametrize('cursor', ['nonsense', '1:2', 'a:b:c', '99999999999999999999:0:0',
+                                    '-99999999999999999999:0:0'])
+def test_bad_cursor_is_rejected(client, records, cursor):
+    response = client.get('/api/v1/sync/pull', query_string={'cursor': cursor})
+    assert response.status_code == 400